@@ -0,0 +1,205 @@
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from ..hololens import hl2ss_3dcv
+
+# Process-wide store of the calibration of every headset, sensor and resolution
+#
+# Calibrations are read once from their source (the calibration folder on the NAS, or the device) and kept with the
+# tables derived from them: depth ray grids, undistort maps in fixed-point form and PV projection matrices.
+# Entries live in an in-memory LRU and in a local on-disk tier, one directory of .npy files per entry:
+#
+# <cache directory>/v<version>/<device id>/<sensor>_<width>x<height>/<table>.npy
+#
+# Calibrations of a headset do not change, so entries are never invalidated, a new layout gets a new version.
+# Entries are shared by every reader of the process and must not be modified.
+
+CALIBRATION_CACHE_VERSION = 1
+CALIBRATION_CACHE_DIRECTORY = os.environ.get(
+    'HL2_CALIBRATION_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'datacollection', 'calibration')
+)
+CALIBRATION_CACHE_CAPACITY = 32
+
+PV_CALIBRATION_FOLDER = 'personal_video'
+PV_CALIBRATION_FOCUS = 1000
+
+
+def _read_bin(file_path, shape=None):
+    data = np.fromfile(file_path, dtype=np.float32)
+    return data if (shape is None) else data.reshape(shape)
+
+
+def _compute_fixed_point_maps(undistort_map):
+    # 16 bit integer coordinates and interpolation table indices, what cv2.remap uses internally
+    map1, map2 = cv2.convertMaps(undistort_map[:, :, 0], undistort_map[:, :, 1], cv2.CV_16SC2)
+    return map1, map2
+
+
+def _load_depth_calibration(calibration_folder, device_id, depth_mode, width, height):
+    depth_calibration_folder = os.path.join(calibration_folder, device_id, f'rm_depth_{depth_mode}')
+    tables = {}
+    tables['extrinsics'] = _read_bin(os.path.join(depth_calibration_folder, 'extrinsics.bin'), (4, 4))
+    uv2xy = _read_bin(os.path.join(depth_calibration_folder, 'uv2xy.bin'), (height, width, 2))
+    tables['uv2xy'] = uv2xy
+    if depth_mode == 'long':
+        tables['scale'] = np.array([1000.0], dtype=np.float32)
+    elif depth_mode == 'ahat':
+        tables['scale'] = np.array([250.0], dtype=np.float32)
+    else:
+        tables['scale'] = _read_bin(os.path.join(depth_calibration_folder, 'scale.bin'))
+
+    # Rays through every pixel, depth * xy1 is the point in camera space
+    xy1, ray_scale = hl2ss_3dcv.rm_depth_compute_rays(uv2xy, 1)
+    tables['xy1'] = np.ascontiguousarray(xy1.reshape((-1, 3)), dtype=np.float32)
+    tables['ray_norm'] = ray_scale.astype(np.float32)
+
+    undistort_map_path = os.path.join(depth_calibration_folder, 'undistort_map.bin')
+    if os.path.exists(undistort_map_path):
+        undistort_map = _read_bin(undistort_map_path, (height, width, 2))
+        tables['undistort_map1'], tables['undistort_map2'] = _compute_fixed_point_maps(undistort_map)
+    return tables
+
+
+def _load_pv_calibration(calibration_folder, device_id, width, height):
+    pv_calibration_folder = os.path.join(calibration_folder, device_id, PV_CALIBRATION_FOLDER)
+    pv_resolution_folder = os.path.join(pv_calibration_folder, f'{PV_CALIBRATION_FOCUS}_{width}_{height}')
+    tables = {}
+    tables['extrinsics'] = _read_bin(os.path.join(pv_calibration_folder, 'extrinsics.bin'), (4, 4))
+    tables['intrinsics'] = _read_bin(os.path.join(pv_resolution_folder, 'intrinsics.bin'), (4, 4))
+    tables['focal_length'] = _read_bin(os.path.join(pv_resolution_folder, 'focal_length.bin'))
+    tables['principal_point'] = _read_bin(os.path.join(pv_resolution_folder, 'principal_point.bin'))
+
+    # Camera matrix with the x axis of the PV camera flipped, as used to project into the frames
+    tables['camera_matrix'] = np.array([
+        [-tables['focal_length'][0], 0, tables['principal_point'][0]],
+        [0, tables['focal_length'][1], tables['principal_point'][1]],
+        [0, 0, 1],
+    ], dtype=np.float32)
+    # Rig to image, the projection of a frame is world_to_reference(pose) @ rig_to_image
+    tables['rig_to_image'] = (
+        hl2ss_3dcv.rignode_to_camera(tables['extrinsics']) @ hl2ss_3dcv.camera_to_image(tables['intrinsics'])
+    ).astype(np.float32)
+
+    radial_distortion_path = os.path.join(pv_resolution_folder, 'radial_distortion.bin')
+    tangential_distortion_path = os.path.join(pv_resolution_folder, 'tangential_distortion.bin')
+    if os.path.exists(radial_distortion_path) and os.path.exists(tangential_distortion_path):
+        radial_distortion = _read_bin(radial_distortion_path)
+        tangential_distortion = _read_bin(tangential_distortion_path)
+        distortion = np.array([
+            radial_distortion[0], radial_distortion[1], tangential_distortion[0], tangential_distortion[1],
+            radial_distortion[2]
+        ], dtype=np.float64)
+        camera_matrix = np.abs(tables['camera_matrix']).astype(np.float64)
+        tables['undistort_map1'], tables['undistort_map2'] = cv2.initUndistortRectifyMap(
+            camera_matrix, distortion, None, camera_matrix, (width, height), cv2.CV_16SC2
+        )
+    return tables
+
+
+class CalibrationStore:
+
+    def __init__(self, cache_directory=CALIBRATION_CACHE_DIRECTORY, capacity=CALIBRATION_CACHE_CAPACITY):
+        self.cache_directory = None if (cache_directory is None) else os.path.join(
+            cache_directory, f'v{CALIBRATION_CACHE_VERSION}'
+        )
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # One lock per key, so that a calibration is loaded once when several threads ask for it
+        self._key_locks = {}
+
+    def _get_entry_directory(self, key):
+        device_id, sensor, width, height = key
+        return os.path.join(self.cache_directory, str(device_id), f'{sensor}_{width}x{height}')
+
+    def _read_disk_entry(self, key):
+        if self.cache_directory is None:
+            return None
+        entry_directory = self._get_entry_directory(key)
+        if not os.path.isdir(entry_directory):
+            return None
+        return {
+            os.path.splitext(file_name)[0]: np.load(os.path.join(entry_directory, file_name))
+            for file_name in os.listdir(entry_directory) if file_name.endswith('.npy')
+        }
+
+    def _write_disk_entry(self, key, tables):
+        if self.cache_directory is None:
+            return
+        entry_directory = self._get_entry_directory(key)
+        os.makedirs(os.path.dirname(entry_directory), exist_ok=True)
+        # Written next to the entry and renamed, so that other processes never see a partial entry
+        temporary_directory = tempfile.mkdtemp(dir=os.path.dirname(entry_directory))
+        try:
+            for table_name, table in tables.items():
+                np.save(os.path.join(temporary_directory, f'{table_name}.npy'), table)
+            os.rename(temporary_directory, entry_directory)
+        except OSError:
+            # Another process stored the entry first
+            shutil.rmtree(temporary_directory, ignore_errors=True)
+
+    def _put(self, key, tables):
+        with self._lock:
+            self._entries[key] = tables
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def get(self, device_id, sensor, width, height, load):
+        # load() returns the tables of the calibration when it is neither in memory nor on disk
+        key = (device_id, sensor, width, height)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                if key in self._entries:
+                    return self._entries[key]
+            tables = self._read_disk_entry(key)
+            if tables is None:
+                tables = load()
+                self._write_disk_entry(key, tables)
+            self._put(key, tables)
+            return tables
+
+    def get_depth_calibration(self, calibration_folder, device_id, depth_mode, width, height):
+        return self.get(
+            device_id, f'rm_depth_{depth_mode}', width, height,
+            lambda: _load_depth_calibration(str(calibration_folder), device_id, depth_mode, width, height)
+        )
+
+    def get_pv_calibration(self, calibration_folder, device_id, width, height):
+        return self.get(
+            device_id, PV_CALIBRATION_FOLDER, width, height,
+            lambda: _load_pv_calibration(str(calibration_folder), device_id, width, height)
+        )
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_calibration_store = None
+_calibration_store_lock = threading.Lock()
+
+
+def get_calibration_store():
+    global _calibration_store
+    with _calibration_store_lock:
+        if _calibration_store is None:
+            _calibration_store = CalibrationStore()
+        return _calibration_store
+
+
+def undistort(image, tables, interpolation=cv2.INTER_NEAREST):
+    return cv2.remap(image, tables['undistort_map1'], tables['undistort_map2'], interpolation)
+
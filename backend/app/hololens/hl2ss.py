@@ -22,6 +22,8 @@ class StreamPort:
     PHOTO_VIDEO          = 3810
     MICROPHONE           = 3811
     SPATIAL_INPUT        = 3812
+    # Name used by hl2ss_io and hl2ss_utilities
+    PERSONAL_VIDEO       = PHOTO_VIDEO
 
 
 # IPC TCP Ports
@@ -183,6 +185,12 @@ class _client:
             raise Exception('connection closed')
         return chunk
 
+    def recv_into(self, buffer):
+        count = self._socket.recv_into(buffer)
+        if (count <= 0):
+            raise Exception('connection closed')
+        return count
+
     def download(self, total, chunk_size):
         data = bytearray()
 
@@ -226,51 +234,125 @@ def unpack_packet(data):
     return _packet(timestamp, payload, np.frombuffer(pose, dtype=np.float32).reshape((4, 4)) if (len(pose) == 64) else None)
 
 
+# The packed layout is the same as the network layout so a received frame
+# can be forwarded and unpacked without copying the payload
+class _packet_view(_packet):
+    def __init__(self, timestamp, payload, pose, frame):
+        super().__init__(timestamp, payload, pose)
+        self.frame = frame
+
+
+def pack_packet_view(packet):
+    return packet.frame if (isinstance(packet, _packet_view)) else memoryview(pack_packet(packet))
+
+
+def unpack_packet_view(data):
+    frame = memoryview(data)
+    timestamp, payload_size = struct.unpack_from('<QI', frame, 0)
+    payload_end = 12 + payload_size
+    pose = np.frombuffer(frame, dtype=np.float32, count=16, offset=payload_end).reshape((4, 4)) if ((len(frame) - payload_end) == 64) else None
+    return _packet_view(timestamp, frame[12:payload_end], pose, frame)
+
+
 def is_valid_pose(pose):
     return pose[3, 3] != 0
 
 
 class _unpacker:
-    def reset(self, mode):
+    # Packets are received into a preallocated buffer and read at an offset
+    # The pending bytes are only moved to the front when there is no room left after them
+    def reset(self, mode, capacity=4*1024*1024):
         self._mode = mode
         self._state = 0
-        self._buffer = bytearray()
+        self._buffer = bytearray(capacity)
+        self._begin = 0
+        self._end = 0
         self._timestamp = None
         self._size = None
-        self._payload = None
-        self._pose = None
+        self._payload_end = None
+        self._consumed = 0
+
+    def clear(self):
+        # Drops the pending bytes and keeps the buffer, e.g. after seeking in a file
+        self._state = 0
+        self._begin = 0
+        self._end = 0
+        self._consumed = 0
+
+    def _make_room(self, size):
+        if ((len(self._buffer) - self._end) >= size):
+            return
+        pending = self._end - self._begin
+        if ((pending + size) > len(self._buffer)):
+            buffer = bytearray(max(2 * len(self._buffer), pending + size))
+            buffer[:pending] = memoryview(self._buffer)[self._begin:self._end]
+            self._buffer = buffer
+        else:
+            view = memoryview(self._buffer)
+            view[:pending] = view[self._begin:self._end]
+            view.release()
+        self._begin = 0
+        self._end = pending
 
     def extend(self, chunk):
-        self._buffer.extend(chunk)
+        size = len(chunk)
+        self._make_room(size)
+        self._buffer[self._end:(self._end + size)] = chunk
+        self._end += size
+
+    def reserve(self, size):
+        # Writable view of the free space, the bytes written into it are added with commit
+        self._make_room(size)
+        return memoryview(self._buffer)[self._end:(self._end + size)]
+
+    def commit(self, count):
+        self._end += count
+
+    def fill(self, read_into, size):
+        # read_into is socket.recv_into or file.readinto, bytes are written in place
+        with self.reserve(size) as view:
+            count = read_into(view)
+        self.commit(count)
+        return count
 
-    def unpack(self):        
-        length = len(self._buffer)
+    def unpack(self):
+        # The previous packet stays in the buffer until the next call so it can be
+        # read either as a copy (get) or as a single frame (get_view)
+        if (self._consumed > 0):
+            self._begin += self._consumed
+            self._consumed = 0
+            if (self._begin == self._end):
+                self._begin = 0
+                self._end = 0
+
+        length = self._end - self._begin
         
         while (True):
             if (self._state == 0):
                 if (length >= 12):
-                    header = struct.unpack('<QI', self._buffer[:12])
+                    header = struct.unpack_from('<QI', self._buffer, self._begin)
                     self._timestamp = header[0]
                     self._size = 12 + header[1]
+                    self._payload_end = self._size
                     if (self._mode == StreamMode.MODE_1):
                         self._size += 64
                     self._state = 1
                     continue
             elif (self._state == 1):
                 if (length >= self._size):
-                    if (self._mode == StreamMode.MODE_1):
-                        payload_end = self._size - 64
-                        self._pose = np.frombuffer(self._buffer[payload_end:self._size], dtype=np.float32).reshape((4, 4))
-                    else:
-                        payload_end = self._size
-                    self._payload = self._buffer[12:payload_end]
-                    self._buffer = self._buffer[self._size:]
+                    self._consumed = self._size
                     self._state = 0
                     return True
             return False
 
     def get(self):
-        return _packet(self._timestamp, self._payload, self._pose)
+        begin = self._begin
+        pose = np.frombuffer(self._buffer[(begin + self._payload_end):(begin + self._size)], dtype=np.float32).reshape((4, 4)) if (self._mode == StreamMode.MODE_1) else None
+        return _packet(self._timestamp, self._buffer[(begin + 12):(begin + self._payload_end)], pose)
+
+    def get_view(self):
+        # The frame is copied out once, the receive buffer is reused for the next packets
+        return unpack_packet_view(self._buffer[self._begin:(self._begin + self._size)])
 
 
 #------------------------------------------------------------------------------
@@ -289,10 +371,14 @@ class _gatherer:
         self._client.sendall(data)
 
     def get_next_packet(self):
-        while (True):
-            self._unpacker.extend(self._client.recv(self._chunk_size))
-            if (self._unpacker.unpack()):
-                return self._unpacker.get()
+        while (not self._unpacker.unpack()):
+            self._unpacker.fill(self._client.recv_into, self._chunk_size)
+        return self._unpacker.get()
+
+    def get_next_packet_view(self):
+        while (not self._unpacker.unpack()):
+            self._unpacker.fill(self._client.recv_into, self._chunk_size)
+        return self._unpacker.get_view()
 
     def close(self):
         self._client.close()
@@ -500,6 +586,9 @@ class rx_rm_vlc(_context_manager):
     def get_next_packet(self):
         return self._client.get_next_packet()
 
+    def get_next_packet_view(self):
+        return self._client.get_next_packet_view()
+
     def close(self):
         self._client.close()
 
@@ -519,6 +608,9 @@ class rx_rm_depth_ahat(_context_manager):
     def get_next_packet(self):
         return self._client.get_next_packet()
 
+    def get_next_packet_view(self):
+        return self._client.get_next_packet_view()
+
     def close(self):
         self._client.close()
 
@@ -537,6 +629,9 @@ class rx_rm_depth_longthrow(_context_manager):
     def get_next_packet(self):
         return self._client.get_next_packet()
 
+    def get_next_packet_view(self):
+        return self._client.get_next_packet_view()
+
     def close(self):
         self._client.close()
 
@@ -554,6 +649,9 @@ class rx_rm_imu(_context_manager):
     def get_next_packet(self):
         return self._client.get_next_packet()
 
+    def get_next_packet_view(self):
+        return self._client.get_next_packet_view()
+
     def close(self):
         self._client.close()
 
@@ -576,6 +674,9 @@ class rx_pv(_context_manager):
     def get_next_packet(self):
         return self._client.get_next_packet()
 
+    def get_next_packet_view(self):
+        return self._client.get_next_packet_view()
+
     def close(self):
         self._client.close()
 
@@ -593,6 +694,9 @@ class rx_microphone(_context_manager):
     def get_next_packet(self):
         return self._client.get_next_packet()
 
+    def get_next_packet_view(self):
+        return self._client.get_next_packet_view()
+
     def close(self):
         self._client.close()
 
@@ -609,10 +713,146 @@ class rx_si(_context_manager):
     def get_next_packet(self):
         return self._client.get_next_packet()
 
+    def get_next_packet_view(self):
+        return self._client.get_next_packet_view()
+
     def close(self):
         self._client.close()
 
 
+#------------------------------------------------------------------------------
+# Asyncio Receivers
+#------------------------------------------------------------------------------
+
+class _async_gatherer:
+    async def open(self, host, port, chunk_size, mode):
+        self._loop = asyncio.get_running_loop()
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setblocking(False)
+        await self._loop.sock_connect(self._socket, (host, port))
+        self._unpacker = _unpacker()
+        self._chunk_size = chunk_size
+        self._unpacker.reset(mode)
+
+    async def sendall(self, data):
+        await self._loop.sock_sendall(self._socket, data)
+
+    async def _fill(self):
+        with self._unpacker.reserve(self._chunk_size) as view:
+            count = await self._loop.sock_recv_into(self._socket, view)
+        if (count <= 0):
+            raise Exception('connection closed')
+        self._unpacker.commit(count)
+
+    async def get_next_packet(self):
+        while (not self._unpacker.unpack()):
+            await self._fill()
+        return self._unpacker.get()
+
+    async def get_next_packet_view(self):
+        while (not self._unpacker.unpack()):
+            await self._fill()
+        return self._unpacker.get_view()
+
+    async def close(self):
+        self._socket.close()
+
+
+class _async_rs_gatherer:
+    async def open(self, host, port, max_size):
+        self._genlock = False
+        self._client = await websockets.client.connect(_rs_get_stream_url_pull(host, port), max_size=max_size, compression=None)
+
+    async def _fetch(self):
+        while (True):
+            data = await self._client.recv()
+            if (len(data) > 0):
+                break
+        raw_packet = data[:-1]
+        aliased_index = struct.unpack('<B', data[-1:])[0]
+        return (aliased_index, raw_packet)
+
+    async def _fetch_synchronized(self):
+        aliased_index, data = await self._fetch()
+        while (not self._genlock):
+            if (aliased_index == 0):
+                self._genlock = True
+            else:
+                aliased_index, data = await self._fetch()
+        return data
+
+    async def get_next_packet(self):
+        return unpack_packet(await self._fetch_synchronized())
+
+    async def get_next_packet_view(self):
+        return unpack_packet_view(await self._fetch_synchronized())
+
+    async def close(self):
+        await self._client.close()
+
+
+async def _async_connect_client(host, port, chunk_size, mode, configuration):
+    if (is_rs_host(host)):
+        c = _async_rs_gatherer()
+        await c.open(host, port, None)
+    else:
+        c = _async_gatherer()
+        await c.open(host, port, chunk_size, mode)
+        if (configuration is not None):
+            await c.sendall(configuration)
+    return c
+
+
+# Receivers of all streams, and of several devices, can run as tasks of a single event loop
+class _rx_async:
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.get_next_packet()
+
+    async def get_next_packet(self):
+        return await self._client.get_next_packet()
+
+    async def get_next_packet_view(self):
+        return await self._client.get_next_packet_view()
+
+    async def close(self):
+        await self._client.close()
+
+
+class rx_async_rm_depth_ahat(_rx_async, rx_rm_depth_ahat):
+    async def open(self):
+        self._client = await _async_connect_client(self.host, self.port, self.chunk, self.mode, _create_configuration_for_rm_depth_ahat(self.mode, self.profile, self.bitrate))
+
+
+class rx_async_rm_imu(_rx_async, rx_rm_imu):
+    async def open(self):
+        self._client = await _async_connect_client(self.host, self.port, self.chunk, self.mode, _create_configuration_for_rm_imu(self.mode))
+
+
+class rx_async_pv(_rx_async, rx_pv):
+    async def open(self):
+        self._client = await _async_connect_client(self.host, self.port, self.chunk, self.mode, _create_configuration_for_pv(self.mode, self.width, self.height, self.framerate, self.profile, self.bitrate))
+
+
+class rx_async_microphone(_rx_async, rx_microphone):
+    async def open(self):
+        self._client = await _async_connect_client(self.host, self.port, self.chunk, StreamMode.MODE_0, _create_configuration_for_microphone(self.profile))
+
+
+class rx_async_si(_rx_async, rx_si):
+    async def open(self):
+        self._client = await _async_connect_client(self.host, self.port, self.chunk, StreamMode.MODE_0, None)
+
+
 #------------------------------------------------------------------------------
 # Codecs
 #------------------------------------------------------------------------------
@@ -769,6 +1009,39 @@ class unpack_rm_imu:
         data = struct.unpack('<QQffff', self._batch[(index * 32):((index + 1) * 32)])
         return _RM_IMU_Frame(data[0], data[1], data[2], data[3], data[4], data[5])
 
+    def get_frames(self):
+        return np.frombuffer(self._batch, dtype=RM_IMU_SAMPLE_DTYPE, count=self._count)
+
+
+# IMU samples as a structured dtype, the samples of all the packets of a stream are decoded in a single pass
+RM_IMU_SAMPLE_DTYPE = np.dtype([('vinyl_hup_ticks', '<u8'), ('soc_ticks', '<u8'), ('x', '<f4'), ('y', '<f4'), ('z', '<f4'), ('temperature', '<f4')])
+
+
+class _RM_IMU_Batch:
+    def __init__(self, samples, timestamps):
+        self.samples         = samples
+        self.timestamps      = timestamps
+        self.vinyl_hup_ticks = samples['vinyl_hup_ticks']
+        self.soc_ticks       = samples['soc_ticks']
+        self.xyz             = np.stack((samples['x'], samples['y'], samples['z']), axis=-1)
+        self.temperature     = samples['temperature']
+
+    def __len__(self):
+        return self.samples.shape[0]
+
+
+def unpack_rm_imu_batch(payloads, timestamps=None):
+    # payloads: IMU packet payloads or an array of RM_IMU_SAMPLE_DTYPE samples
+    # timestamps: packet timestamps, repeated for every sample of their packet
+    if (isinstance(payloads, np.ndarray)):
+        return _RM_IMU_Batch(payloads, timestamps)
+    payloads = [bytes(payload) for payload in payloads]
+    samples = np.frombuffer(b''.join(payloads), dtype=RM_IMU_SAMPLE_DTYPE)
+    if (timestamps is not None):
+        counts = np.array([len(payload) // RM_IMU_SAMPLE_DTYPE.itemsize for payload in payloads], dtype=np.int64)
+        timestamps = np.repeat(np.asarray(timestamps, dtype=np.uint64), counts)
+    return _RM_IMU_Batch(samples, timestamps)
+
 
 #------------------------------------------------------------------------------
 # PV Decoder
@@ -984,6 +1257,48 @@ class unpack_si:
         return _SI_Hand(self._data[_Mode0Layout_SI.BEGIN_HAND_RIGHT : _Mode0Layout_SI.END_HAND_RIGHT])
 
 
+# Mode 0 SI layout as a structured dtype, N payloads are decoded in a single pass
+SI_HAND_JOINT_DTYPE = np.dtype([('orientation', '<f4', (4,)), ('position', '<f4', (3,)), ('radius', '<f4'), ('accuracy', '<i4')])
+SI_DTYPE = np.dtype([('valid', 'u1'), ('head_pose', '<f4', (3, 3)), ('eye_ray', '<f4', (2, 3)), ('hands', SI_HAND_JOINT_DTYPE, (2, SI_HandJointKind.TOTAL))])
+
+
+class SI_HandIndex:
+    LEFT  = 0
+    RIGHT = 1
+
+
+class _SI_Batch:
+    def __init__(self, data):
+        self.valid             = data['valid']
+        self.head_pose         = data['head_pose']
+        self.eye_ray           = data['eye_ray']
+        self.hand_orientations = data['hands']['orientation']
+        self.hand_positions    = data['hands']['position']
+        self.hand_radii        = data['hands']['radius']
+        self.hand_accuracies   = data['hands']['accuracy']
+
+    def __len__(self):
+        return self.valid.shape[0]
+
+    def is_valid_head_pose(self):
+        return (self.valid & _SI_Field.HEAD) != 0
+
+    def is_valid_eye_ray(self):
+        return (self.valid & _SI_Field.EYE) != 0
+
+    def is_valid_hand(self):
+        return np.stack(((self.valid & _SI_Field.LEFT) != 0, (self.valid & _SI_Field.RIGHT) != 0), axis=-1)
+
+
+def unpack_si_batch(payloads):
+    # payloads: (N, 1933) uint8 array, e.g. SI records, or a sequence of payloads or unpack_si
+    if (isinstance(payloads, np.ndarray)):
+        data = np.ascontiguousarray(payloads, dtype=np.uint8).reshape((-1, SI_DTYPE.itemsize)).view(SI_DTYPE).reshape(-1)
+    else:
+        data = np.frombuffer(b''.join([bytes(payload._data if (isinstance(payload, unpack_si)) else payload) for payload in payloads]), dtype=SI_DTYPE)
+    return _SI_Batch(data)
+
+
 #------------------------------------------------------------------------------
 # Decoded Receivers
 #------------------------------------------------------------------------------
@@ -2025,14 +2340,20 @@ class _rs_gatherer:
         aliased_index = struct.unpack('<B', data[-1:])[0]
         return (aliased_index, raw_packet)
     
-    def get_next_packet(self):
+    def _fetch_synchronized(self):
         aliased_index, data = self._fetch()
         while (not self._genlock):
             if (aliased_index == 0): 
                 self._genlock = True
             else:
                 aliased_index, data = self._fetch()
-        return unpack_packet(data)
+        return data
+
+    def get_next_packet(self):
+        return unpack_packet(self._fetch_synchronized())
+
+    def get_next_packet_view(self):
+        return unpack_packet_view(self._fetch_synchronized())
     
     def close(self):
         self._client.close()
@@ -1,11 +1,105 @@
 
+import collections
+import copy
+import json
+import mmap
 import multiprocessing as mp
+import os
 import struct
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from ..hololens import hl2ss
 from ..hololens import hl2ss_mp
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
 
 _MAGIC = 'X38HL2SS'
+# Files with compressed payloads, the compression follows the port
+_MAGIC_COMPRESSED = 'X38HL2SZ'
+_INDEX_EXTENSION = '.idx'
+_INDEX_RECORD_FORMAT = '<QQ'
+_INDEX_DTYPE = np.dtype([('timestamp', '<u8'), ('offset', '<u8')])
+_MANIFEST_EXTENSION = '.manifest'
+_SEGMENT_PART_EXTENSION = '.part'
+
+
+#------------------------------------------------------------------------------
+# Payload Compression
+#------------------------------------------------------------------------------
+# Payloads are compressed one by one, timestamps and poses are stored as is so
+# the packet headers and the timestamp index work the same on compressed files
+# Both codecs release the GIL, packets are compressed and decompressed by threads
+
+class Compression:
+    NONE = 0
+    ZSTD = 1
+    LZ4  = 2
+
+
+_COMPRESSION_LEVEL_ZSTD = 3
+_COMPRESSION_LEVEL_LZ4 = 0
+_COMPRESSION_THREADS = max((os.cpu_count() or 1) - 1, 1)
+# Packets compressed or decompressed ahead of the packet being written or read
+_COMPRESSION_QUEUE_SIZE = 64
+_DECOMPRESSION_READ_AHEAD = 2 * _COMPRESSION_THREADS
+
+
+def check_compression(compression):
+    if ((compression == Compression.ZSTD) and (zstandard is None)):
+        raise Exception('ZSTD compression needs the zstandard package')
+    if ((compression == Compression.LZ4) and (lz4 is None)):
+        raise Exception('LZ4 compression needs the lz4 package')
+
+
+def compress(compression, data):
+    if   (compression == Compression.NONE):
+        return data
+    elif (compression == Compression.ZSTD):
+        return zstandard.compress(data, _COMPRESSION_LEVEL_ZSTD)
+    elif (compression == Compression.LZ4):
+        return lz4.frame.compress(data, compression_level=_COMPRESSION_LEVEL_LZ4)
+    raise Exception(f'Unsupported compression {compression}')
+
+
+def decompress(compression, data):
+    if   (compression == Compression.NONE):
+        return data
+    elif (compression == Compression.ZSTD):
+        return zstandard.decompress(data)
+    elif (compression == Compression.LZ4):
+        return lz4.frame.decompress(data)
+    raise Exception(f'Unsupported compression {compression}')
+
+
+def compress_packet(compression, packet):
+    return hl2ss._packet(packet.timestamp, compress(compression, packet.payload), packet.pose)
+
+
+def decompress_packet(compression, packet):
+    return hl2ss._packet(packet.timestamp, decompress(compression, packet.payload), packet.pose)
+
+
+_decompression_pool = None
+_decompression_pool_lock = threading.Lock()
+
+
+def _get_decompression_pool():
+    # Shared by the readers of the process
+    global _decompression_pool
+    with _decompression_pool_lock:
+        if (_decompression_pool is None):
+            _decompression_pool = ThreadPoolExecutor(_COMPRESSION_THREADS)
+        return _decompression_pool
 
 
 #------------------------------------------------------------------------------
@@ -13,25 +107,42 @@ _MAGIC = 'X38HL2SS'
 #------------------------------------------------------------------------------
 
 class _writer:
-    def open(self, filename):
+    def open(self, filename, index, compression):
+        check_compression(compression)
         self._file = open(filename, 'wb')
+        self._index = open(get_index_filename(filename), 'wb') if (index) else None
+        self._offset = 0
+        self._compression = compression
 
     def put(self, data):
         self._file.write(data)
+        self._offset += len(data)
 
     def write(self, packet):
-        self._file.write(hl2ss.pack_packet(packet))
+        self.write_compressed(compress_packet(self._compression, packet) if (self._compression != Compression.NONE) else packet)
+
+    def write_compressed(self, packet):
+        # packet.payload is already compressed
+        data = hl2ss.pack_packet(packet)
+        if (self._index is not None):
+            self._index.write(struct.pack(_INDEX_RECORD_FORMAT, packet.timestamp, self._offset))
+        self._file.write(data)
+        self._offset += len(data)
 
     def close(self):
         self._file.close()
+        if (self._index is not None):
+            self._index.close()
 
 
 #------------------------------------------------------------------------------
 # Header Pack
 #------------------------------------------------------------------------------
 
-def _create_header(port):
-    return struct.pack(f'<{len(_MAGIC)}sH', _MAGIC.encode(), port)
+def _create_header(port, compression):
+    if (compression == Compression.NONE):
+        return struct.pack(f'<{len(_MAGIC)}sH', _MAGIC.encode(), port)
+    return struct.pack(f'<{len(_MAGIC_COMPRESSED)}sHB', _MAGIC_COMPRESSED.encode(), port, compression)
 
 
 def _create_user(user):
@@ -42,64 +153,64 @@ def _create_user(user):
 # Mode 0 and Mode 1 Data Store
 #------------------------------------------------------------------------------
 
-def _create_wr_rm_vlc(filename, port, mode, profile, bitrate, user):
+def _create_wr_rm_vlc(filename, port, mode, profile, bitrate, user, index, compression):
     w = _writer()
-    w.open(filename)
-    w.put(_create_header(port))
+    w.open(filename, index, compression)
+    w.put(_create_header(port, compression))
     w.put(hl2ss._create_configuration_for_rm_vlc(mode, profile, bitrate))
     w.put(_create_user(user))
     return w
 
 
-def _create_wr_rm_depth_ahat(filename, port, mode, profile, bitrate, user):
+def _create_wr_rm_depth_ahat(filename, port, mode, profile, bitrate, user, index, compression):
     w = _writer()
-    w.open(filename)
-    w.put(_create_header(port))
+    w.open(filename, index, compression)
+    w.put(_create_header(port, compression))
     w.put(hl2ss._create_configuration_for_rm_depth_ahat(mode, profile, bitrate))
     w.put(_create_user(user))
     return w
 
 
-def _create_wr_rm_depth_longthrow(filename, port, mode, png_filter, user):
+def _create_wr_rm_depth_longthrow(filename, port, mode, png_filter, user, index, compression):
     w = _writer()
-    w.open(filename)
-    w.put(_create_header(port))
+    w.open(filename, index, compression)
+    w.put(_create_header(port, compression))
     w.put(hl2ss._create_configuration_for_rm_depth_longthrow(mode, png_filter))
     w.put(_create_user(user))
     return w
 
 
-def _create_wr_rm_imu(filename, port, mode, user):
+def _create_wr_rm_imu(filename, port, mode, user, index, compression):
     w = _writer()
-    w.open(filename)
-    w.put(_create_header(port))
+    w.open(filename, index, compression)
+    w.put(_create_header(port, compression))
     w.put(hl2ss._create_configuration_for_rm_imu(mode))
     w.put(_create_user(user))
     return w
 
 
-def _create_wr_pv(filename, port, mode, width, height, framerate, profile, bitrate, user):
+def _create_wr_pv(filename, port, mode, width, height, framerate, profile, bitrate, user, index, compression):
     w = _writer()
-    w.open(filename)
-    w.put(_create_header(port))
+    w.open(filename, index, compression)
+    w.put(_create_header(port, compression))
     w.put(hl2ss._create_configuration_for_pv(mode, width, height, framerate, profile, bitrate))
     w.put(_create_user(user))
     return w
 
 
-def _create_wr_microphone(filename, port, profile, user):
+def _create_wr_microphone(filename, port, profile, user, index, compression):
     w = _writer()
-    w.open(filename)
-    w.put(_create_header(port))
+    w.open(filename, index, compression)
+    w.put(_create_header(port, compression))
     w.put(hl2ss._create_configuration_for_microphone(profile))
     w.put(_create_user(user))
     return w
 
 
-def _create_wr_si(filename, port, user):
+def _create_wr_si(filename, port, user, index, compression):
     w = _writer()
-    w.open(filename)
-    w.put(_create_header(port))
+    w.open(filename, index, compression)
+    w.put(_create_header(port, compression))
     w.put(_create_user(user))
     return w
 
@@ -109,80 +220,100 @@ def _create_wr_si(filename, port, user):
 #------------------------------------------------------------------------------
 
 class wr_rm_vlc(hl2ss._context_manager):
-    def __init__(self, filename, port, mode, profile, bitrate, user):
+    def __init__(self, filename, port, mode, profile, bitrate, user, index=True, compression=Compression.NONE):
         self.filename = filename
         self.port = port
         self.mode = mode
         self.profile = profile
         self.bitrate = bitrate
         self.user = user
+        self.index = index
+        self.compression = compression
 
     def open(self):
-        self._wr = _create_wr_rm_vlc(self.filename, self.port, self.mode, self.profile, self.bitrate, self.user)
+        self._wr = _create_wr_rm_vlc(self.filename, self.port, self.mode, self.profile, self.bitrate, self.user, self.index, self.compression)
 
     def write(self, packet):
         self._wr.write(packet)
 
+    def write_compressed(self, packet):
+        self._wr.write_compressed(packet)
+
     def close(self):
         self._wr.close()
 
 
 class wr_rm_depth_ahat(hl2ss._context_manager):
-    def __init__(self, filename, port, mode, profile, bitrate, user):
+    def __init__(self, filename, port, mode, profile, bitrate, user, index=True, compression=Compression.NONE):
         self.filename = filename
         self.port = port
         self.mode = mode
         self.profile = profile
         self.bitrate = bitrate
         self.user = user
+        self.index = index
+        self.compression = compression
 
     def open(self):
-        self._wr = _create_wr_rm_depth_ahat(self.filename, self.port, self.mode, self.profile, self.bitrate, self.user)
+        self._wr = _create_wr_rm_depth_ahat(self.filename, self.port, self.mode, self.profile, self.bitrate, self.user, self.index, self.compression)
 
     def write(self, packet):
         self._wr.write(packet)
 
+    def write_compressed(self, packet):
+        self._wr.write_compressed(packet)
+
     def close(self):
         self._wr.close()
 
 
 class wr_rm_depth_longthrow(hl2ss._context_manager):
-    def __init__(self, filename, port, mode, png_filter, user):
+    def __init__(self, filename, port, mode, png_filter, user, index=True, compression=Compression.NONE):
         self.filename = filename
         self.port = port
         self.mode = mode
         self.png_filter = png_filter
         self.user = user
+        self.index = index
+        self.compression = compression
 
     def open(self):
-        self._wr = _create_wr_rm_depth_longthrow(self.filename, self.port, self.mode, self.png_filter, self.user)
+        self._wr = _create_wr_rm_depth_longthrow(self.filename, self.port, self.mode, self.png_filter, self.user, self.index, self.compression)
 
     def write(self, packet):
         self._wr.write(packet)
 
+    def write_compressed(self, packet):
+        self._wr.write_compressed(packet)
+
     def close(self):
         self._wr.close()
 
 
 class wr_rm_imu(hl2ss._context_manager):
-    def __init__(self, filename, port, mode, user):
+    def __init__(self, filename, port, mode, user, index=True, compression=Compression.NONE):
         self.filename = filename
         self.port = port
         self.mode = mode
         self.user = user
+        self.index = index
+        self.compression = compression
 
     def open(self):
-        self._wr = _create_wr_rm_imu(self.filename, self.port, self.mode, self.user)
+        self._wr = _create_wr_rm_imu(self.filename, self.port, self.mode, self.user, self.index, self.compression)
 
     def write(self, packet):
         self._wr.write(packet)
 
+    def write_compressed(self, packet):
+        self._wr.write_compressed(packet)
+
     def close(self):
         self._wr.close()
 
 
 class wr_pv(hl2ss._context_manager):
-    def __init__(self, filename, port, mode, width, height, framerate, profile, bitrate, user):
+    def __init__(self, filename, port, mode, width, height, framerate, profile, bitrate, user, index=True, compression=Compression.NONE):
         self.filename = filename
         self.port = port
         self.mode = mode
@@ -192,83 +323,242 @@ class wr_pv(hl2ss._context_manager):
         self.profile = profile
         self.bitrate = bitrate
         self.user = user
+        self.index = index
+        self.compression = compression
 
     def open(self):
-        self._wr = _create_wr_pv(self.filename, self.port, self.mode, self.width, self.height, self.framerate, self.profile, self.bitrate, self.user)
+        self._wr = _create_wr_pv(self.filename, self.port, self.mode, self.width, self.height, self.framerate, self.profile, self.bitrate, self.user, self.index, self.compression)
 
     def write(self, packet):
         self._wr.write(packet)
 
+    def write_compressed(self, packet):
+        self._wr.write_compressed(packet)
+
     def close(self):
         self._wr.close()
 
 
 class wr_microphone(hl2ss._context_manager):
-    def __init__(self, filename, port, profile, user):
+    def __init__(self, filename, port, profile, user, index=True, compression=Compression.NONE):
         self.filename = filename
         self.port = port
         self.profile = profile
         self.user = user
+        self.index = index
+        self.compression = compression
     
     def open(self):
-        self._wr = _create_wr_microphone(self.filename, self.port, self.profile, self.user)
+        self._wr = _create_wr_microphone(self.filename, self.port, self.profile, self.user, self.index, self.compression)
 
     def write(self, packet):
         self._wr.write(packet)
 
+    def write_compressed(self, packet):
+        self._wr.write_compressed(packet)
+
     def close(self):
         self._wr.close()
 
 
 class wr_si(hl2ss._context_manager):
-    def __init__(self, filename, port, user):
+    def __init__(self, filename, port, user, index=True, compression=Compression.NONE):
         self.filename = filename
         self.port = port
         self.user = user
+        self.index = index
+        self.compression = compression
 
     def open(self):
-        self._wr = _create_wr_si(self.filename, self.port, self.user)
+        self._wr = _create_wr_si(self.filename, self.port, self.user, self.index, self.compression)
 
     def write(self, packet):
         self._wr.write(packet)
 
+    def write_compressed(self, packet):
+        self._wr.write_compressed(packet)
+
     def close(self):
         self._wr.close()
 
 
+#------------------------------------------------------------------------------
+# Segmented Writer
+#------------------------------------------------------------------------------
+# A stream can be written as a sequence of segment files, <root>.<number><ext>,
+# each a complete hl2ss_io file with its own index
+# <filename>.manifest lists the closed segments with their first and last
+# timestamps, segments are written as <segment>.part and renamed when closed
+# so closed segments can be processed or transferred while capture continues
+
+def get_manifest_filename(filename):
+    return filename + _MANIFEST_EXTENSION
+
+
+def get_segment_filename(filename, number):
+    root, ext = os.path.splitext(filename)
+    return f'{root}.{number:05d}{ext}'
+
+
+def read_manifest(filename):
+    with open(get_manifest_filename(filename), 'r') as file:
+        return json.load(file)
+
+
+def _write_manifest(filename, manifest):
+    # Replaced in one step, readers never see a partial manifest
+    manifest_filename = get_manifest_filename(filename)
+    with open(manifest_filename + _SEGMENT_PART_EXTENSION, 'w') as file:
+        json.dump(manifest, file, indent=1)
+    os.replace(manifest_filename + _SEGMENT_PART_EXTENSION, manifest_filename)
+
+
+def is_segmented(filename):
+    return os.path.isfile(get_manifest_filename(filename))
+
+
+def exists(filename):
+    return os.path.isfile(filename) or is_segmented(filename)
+
+
+def get_closed_segments(filename):
+    # Paths of the closed segments, in order
+    directory = os.path.dirname(filename)
+    return [os.path.join(directory, segment['filename']) for segment in read_manifest(filename)['segments']]
+
+
+def get_files(filename):
+    # Every file of the stream: data, indices and manifest
+    if (not is_segmented(filename)):
+        return [path for path in [filename, get_index_filename(filename)] if (os.path.isfile(path))]
+    files = []
+    for path in get_closed_segments(filename):
+        files.extend([path, get_index_filename(path)])
+    files.append(get_manifest_filename(filename))
+    return [path for path in files if (os.path.isfile(path))]
+
+
+class wr_segmented(hl2ss._context_manager):
+    # Starts a new segment once the current one spans segment_duration seconds or
+    # holds segment_size bytes, on a sync frame so every segment begins with a keyframe
+    def __init__(self, wr, segment_duration=None, segment_size=None):
+        self.wr = wr
+        self.segment_duration = segment_duration
+        self.segment_size = segment_size
+
+    def __getattr__(self, name):
+        # port, profile, compression, ... of the segment writers
+        if (name.startswith('_') or (name == 'wr')):
+            raise AttributeError(name)
+        return getattr(self.wr, name)
+
+    def open(self):
+        self._sync_period = get_sync_period(self.wr)
+        self._count = 0
+        self._segment = None
+        self._manifest = {'segments': [], 'closed': False}
+        _write_manifest(self.wr.filename, self._manifest)
+
+    def _open_segment(self, timestamp):
+        segment_filename = get_segment_filename(self.wr.filename, len(self._manifest['segments']))
+        self._segment = copy.copy(self.wr)
+        self._segment.filename = segment_filename + _SEGMENT_PART_EXTENSION
+        self._segment.open()
+        self._segment_filename = segment_filename
+        self._first_timestamp = timestamp
+        self._last_timestamp = timestamp
+        self._segment_count = 0
+
+    def _close_segment(self):
+        size = self._segment._wr._offset
+        self._segment.close()
+        os.replace(self._segment.filename, self._segment_filename)
+        if (self._segment.index):
+            os.replace(get_index_filename(self._segment.filename), get_index_filename(self._segment_filename))
+        self._segment = None
+        self._manifest['segments'].append({
+            'filename': os.path.basename(self._segment_filename),
+            'first_timestamp': self._first_timestamp,
+            'last_timestamp': self._last_timestamp,
+            'packets': self._segment_count,
+            'size': size,
+        })
+        _write_manifest(self.wr.filename, self._manifest)
+
+    def _is_full(self, timestamp):
+        if ((self._count % self._sync_period) != 0):
+            return False
+        if ((self.segment_duration is not None) and ((timestamp - self._first_timestamp) >= (self.segment_duration * hl2ss.TimeBase.HUNDREDS_OF_NANOSECONDS))):
+            return True
+        if ((self.segment_size is not None) and (self._segment._wr._offset >= self.segment_size)):
+            return True
+        return False
+
+    def _next(self, timestamp):
+        if ((self._segment is not None) and self._is_full(timestamp)):
+            self._close_segment()
+        if (self._segment is None):
+            self._open_segment(timestamp)
+        self._last_timestamp = timestamp
+        self._segment_count += 1
+        self._count += 1
+        return self._segment
+
+    def write(self, packet):
+        self._next(packet.timestamp).write(packet)
+
+    def write_compressed(self, packet):
+        self._next(packet.timestamp).write_compressed(packet)
+
+    def close(self):
+        if (self._segment is not None):
+            self._close_segment()
+        self._manifest['closed'] = True
+        _write_manifest(self.wr.filename, self._manifest)
+
+
 #------------------------------------------------------------------------------
 # Writer From Receiver
 #------------------------------------------------------------------------------
 
-def create_wr_from_rx(filename, rx, user):
+def _create_wr_from_rx(filename, rx, user, index, compression):
     if   (rx.port == hl2ss.StreamPort.RM_VLC_LEFTFRONT):
-        return wr_rm_vlc(filename, rx.port, rx.mode, rx.profile, rx.bitrate, user)
+        return wr_rm_vlc(filename, rx.port, rx.mode, rx.profile, rx.bitrate, user, index, compression)
     elif (rx.port == hl2ss.StreamPort.RM_VLC_LEFTLEFT):
-        return wr_rm_vlc(filename, rx.port, rx.mode, rx.profile, rx.bitrate, user)
+        return wr_rm_vlc(filename, rx.port, rx.mode, rx.profile, rx.bitrate, user, index, compression)
     elif (rx.port == hl2ss.StreamPort.RM_VLC_RIGHTFRONT):
-        return wr_rm_vlc(filename, rx.port, rx.mode, rx.profile, rx.bitrate, user)
+        return wr_rm_vlc(filename, rx.port, rx.mode, rx.profile, rx.bitrate, user, index, compression)
     elif (rx.port == hl2ss.StreamPort.RM_VLC_RIGHTRIGHT):
-        return wr_rm_vlc(filename, rx.port, rx.mode, rx.profile, rx.bitrate, user)
+        return wr_rm_vlc(filename, rx.port, rx.mode, rx.profile, rx.bitrate, user, index, compression)
     elif (rx.port == hl2ss.StreamPort.RM_DEPTH_AHAT):
-        return wr_rm_depth_ahat(filename, rx.port, rx.mode, rx.profile, rx.bitrate, user)
+        return wr_rm_depth_ahat(filename, rx.port, rx.mode, rx.profile, rx.bitrate, user, index, compression)
     elif (rx.port == hl2ss.StreamPort.RM_DEPTH_LONGTHROW):
-        return wr_rm_depth_longthrow(filename, rx.port, rx.mode, rx.png_filter, user)
+        return wr_rm_depth_longthrow(filename, rx.port, rx.mode, rx.png_filter, user, index, compression)
     elif (rx.port == hl2ss.StreamPort.RM_IMU_ACCELEROMETER):
-        return wr_rm_imu(filename, rx.port, rx.mode, user)
+        return wr_rm_imu(filename, rx.port, rx.mode, user, index, compression)
     elif (rx.port == hl2ss.StreamPort.RM_IMU_GYROSCOPE):
-        return wr_rm_imu(filename, rx.port, rx.mode, user)
+        return wr_rm_imu(filename, rx.port, rx.mode, user, index, compression)
     elif (rx.port == hl2ss.StreamPort.RM_IMU_MAGNETOMETER):
-        return wr_rm_imu(filename, rx.port, rx.mode, user)
+        return wr_rm_imu(filename, rx.port, rx.mode, user, index, compression)
     elif (rx.port == hl2ss.StreamPort.PERSONAL_VIDEO):
-        return wr_pv(filename, rx.port, rx.mode, rx.width, rx.height, rx.framerate, rx.profile, rx.bitrate, user)
+        return wr_pv(filename, rx.port, rx.mode, rx.width, rx.height, rx.framerate, rx.profile, rx.bitrate, user, index, compression)
     elif (rx.port == hl2ss.StreamPort.MICROPHONE):
-        return wr_microphone(filename, rx.port, rx.profile, user)
+        return wr_microphone(filename, rx.port, rx.profile, user, index, compression)
     elif (rx.port == hl2ss.StreamPort.SPATIAL_INPUT):
-        return wr_si(filename, rx.port, user)
+        return wr_si(filename, rx.port, user, index, compression)
+
 
+def create_wr_from_rx(filename, rx, user, index=True, compression=Compression.NONE, segment_duration=None, segment_size=None):
+    # Checked here as well as on open, writers of wr_process_rx are created in the parent and opened in the child
+    check_compression(compression)
+    wr = _create_wr_from_rx(filename, rx, user, index, compression)
+    if ((segment_duration is None) and (segment_size is None)):
+        return wr
+    return wr_segmented(wr, segment_duration, segment_size)
 
-def create_wr_from_producer(filename, producer, port, user):
-    return create_wr_from_rx(filename, producer._rx[port], user)
+
+def create_wr_from_producer(filename, producer, port, user, index=True, compression=Compression.NONE, segment_duration=None, segment_size=None):
+    return create_wr_from_rx(filename, producer._rx[port], user, index, compression, segment_duration, segment_size)
 
 
 #------------------------------------------------------------------------------
@@ -288,6 +578,10 @@ class _reader:
     
     def get_port(self):
         return self.get('<H')[0]
+
+    def get_compression(self, magic):
+        self.compression = self.get('<B')[0] if (magic == _MAGIC_COMPRESSED.encode()) else Compression.NONE
+        return self.compression
     
     def get_mode(self):
         return self.get('<B')[0]
@@ -308,9 +602,16 @@ class _reader:
         return self._file.read(self.get('<I')[0])
     
     def begin(self, mode):
+        self._mode = mode
+        self._data_begin = self._file.tell()
         self._unpacker = hl2ss._unpacker()
         self._unpacker.reset(mode)
         self._eof = False
+
+    def seek(self, offset):
+        self._file.seek(offset)
+        self._unpacker.clear()
+        self._eof = False
         
     def read(self):
         while (True):
@@ -318,14 +619,95 @@ class _reader:
                 return self._unpacker.get()
             if (self._eof):
                 return None
-            chunk = self._file.read(self._chunk)
-            self._eof = len(chunk) < self._chunk
-            self._unpacker.extend(chunk)
+            self._eof = self._unpacker.fill(self._file.readinto, self._chunk) < self._chunk
 
     def close(self):
         self._file.close()
 
 
+class _mapped_reader:
+    # Walks the packets in place in a memory map of the file
+    # Payloads and poses of the packets read are views into the map, valid until the reader is closed
+    def open(self, filename, chunk):
+        self._file = open(filename, 'rb')
+        self._size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if (self._size > 0) else b''
+        self._view = memoryview(self._map)
+        self._offset = 0
+
+    def get(self, format):
+        data = struct.unpack_from(format, self._view, self._offset)
+        self._offset += struct.calcsize(format)
+        return data
+
+    def get_magic(self):
+        return self.get(f'<{len(_MAGIC)}s')[0]
+
+    def get_port(self):
+        return self.get('<H')[0]
+
+    def get_compression(self, magic):
+        self.compression = self.get('<B')[0] if (magic == _MAGIC_COMPRESSED.encode()) else Compression.NONE
+        return self.compression
+
+    def get_mode(self):
+        return self.get('<B')[0]
+
+    def get_video_format(self):
+        return self.get('<HHB')
+
+    def get_video_encoding(self):
+        return self.get('<BI')
+
+    def get_audio_encoding(self):
+        return self.get('<B')[0]
+
+    def get_png_encoding(self):
+        return self.get('<B')[0]
+
+    def get_user(self):
+        size = self.get('<I')[0]
+        user = bytes(self._view[self._offset:(self._offset + size)])
+        self._offset += size
+        return user
+
+    def begin(self, mode):
+        self._mode = mode
+        self._data_begin = self._offset
+        self._pose_size = 64 if (mode == hl2ss.StreamMode.MODE_1) else 0
+
+    def seek(self, offset):
+        self._offset = offset
+
+    def read(self):
+        if ((self._offset + 12) > self._size):
+            return None
+        payload_size = struct.unpack_from('<I', self._view, self._offset + 8)[0]
+        end = self._offset + 12 + payload_size + self._pose_size
+        if (end > self._size):
+            return None
+        packet = hl2ss.unpack_packet_view(self._view[self._offset:end])
+        self._offset = end
+        return packet
+
+    def close(self):
+        try:
+            self._view.release()
+        except BufferError:
+            pass
+        if (self._size > 0):
+            try:
+                self._map.close()
+            except BufferError:
+                # Packets still refer to the map, it is unmapped once they are released
+                pass
+        self._file.close()
+
+
+def _create_reader(mapped):
+    return _mapped_reader() if (mapped) else _reader()
+
+
 def _probe(filename, chunk):
     r = _reader()
     r.open(filename, chunk)
@@ -335,6 +717,80 @@ def _probe(filename, chunk):
     return magic, port
 
 
+#------------------------------------------------------------------------------
+# Timestamp Index
+#------------------------------------------------------------------------------
+# <filename>.idx holds one (timestamp, offset) record per packet, written by the
+# writers or built from the packet headers of the file
+# Packets of a stream are stored in timestamp order
+
+def get_index_filename(filename):
+    return filename + _INDEX_EXTENSION
+
+
+def _scan_index(file, offset, mode):
+    # Reads the packet headers only, payloads are skipped
+    size = os.fstat(file.fileno()).st_size
+    pose_size = 64 if (mode == hl2ss.StreamMode.MODE_1) else 0
+    records = []
+    while ((offset + 12) <= size):
+        file.seek(offset)
+        timestamp, payload_size = struct.unpack('<QI', file.read(12))
+        end = offset + 12 + payload_size + pose_size
+        if (end > size):
+            break
+        records.append((timestamp, offset))
+        offset = end
+    return np.array(records, dtype=_INDEX_DTYPE)
+
+
+class _index:
+    def __init__(self, filename, file, data_begin, mode):
+        index_filename = get_index_filename(filename)
+        position = file.tell()
+        if (os.path.isfile(index_filename)):
+            records = np.fromfile(index_filename, dtype=_INDEX_DTYPE)
+            # Records past the end of the data were indexed but never written, e.g. after a crash
+            records = records[:int(np.searchsorted(records['offset'], os.fstat(file.fileno()).st_size, side='left'))]
+            # The file may have grown since, or the index may be missing its last records
+            offset = int(records['offset'][-1]) if (len(records) > 0) else data_begin
+            tail = _scan_index(file, offset, mode)
+            records = np.concatenate((records[:-1], tail)) if (len(records) > 0) else tail
+        else:
+            records = _scan_index(file, data_begin, mode)
+            try:
+                records.tofile(index_filename)
+            except OSError:
+                pass
+        file.seek(position)
+        self.timestamps = records['timestamp']
+        self.offsets = records['offset']
+        self.end = os.fstat(file.fileno()).st_size
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def find(self, timestamp):
+        # First packet at or after timestamp
+        return int(np.searchsorted(self.timestamps, timestamp, side='left'))
+
+    def find_before(self, timestamp):
+        # Last packet at or before timestamp
+        return max(int(np.searchsorted(self.timestamps, timestamp, side='right')) - 1, 0)
+
+    def get_offset(self, position):
+        return int(self.offsets[position]) if (position < len(self.offsets)) else self.end
+
+
+def create_index(filename):
+    # Builds the index of a file written without one
+    r, header = _create_rd(filename, hl2ss.ChunkSize.SINGLE_TRANSFER)
+    records = _scan_index(r._file, r._data_begin, r._mode)
+    r.close()
+    records.tofile(get_index_filename(filename))
+    return len(records)
+
+
 #------------------------------------------------------------------------------
 # Header Unpack
 #------------------------------------------------------------------------------
@@ -401,11 +857,12 @@ class _header_si(_header):
 # Mode 0 and Mode 1 Data Load
 #------------------------------------------------------------------------------
 
-def _create_rd_rm_vlc(filename, chunk):
-    r = _reader()
+def _create_rd_rm_vlc(filename, chunk, mapped):
+    r = _create_reader(mapped)
     r.open(filename, chunk)
     magic = r.get_magic()
     port = r.get_port()
+    r.get_compression(magic)
     mode = r.get_mode()
     profile, bitrate = r.get_video_encoding()
     user = r.get_user()
@@ -413,11 +870,12 @@ def _create_rd_rm_vlc(filename, chunk):
     return r, _header_rm_vlc(magic, port, mode, profile, bitrate, user)
 
 
-def _create_rd_rm_depth_ahat(filename, chunk):
-    r = _reader()
+def _create_rd_rm_depth_ahat(filename, chunk, mapped):
+    r = _create_reader(mapped)
     r.open(filename, chunk)
     magic = r.get_magic()
     port = r.get_port()
+    r.get_compression(magic)
     mode = r.get_mode()
     profile, bitrate = r.get_video_encoding()
     user = r.get_user()    
@@ -425,11 +883,12 @@ def _create_rd_rm_depth_ahat(filename, chunk):
     return r, _header_rm_depth_ahat(magic, port, mode, profile, bitrate, user)
 
 
-def _create_rd_rm_depth_longthrow(filename, chunk):
-    r = _reader()
+def _create_rd_rm_depth_longthrow(filename, chunk, mapped):
+    r = _create_reader(mapped)
     r.open(filename, chunk)
     magic = r.get_magic()
     port = r.get_port()
+    r.get_compression(magic)
     mode = r.get_mode()
     png_filter = r.get_png_encoding()
     user = r.get_user()
@@ -437,22 +896,24 @@ def _create_rd_rm_depth_longthrow(filename, chunk):
     return r, _header_rm_depth_longthrow(magic, port, mode, png_filter, user)
 
 
-def _create_rd_rm_imu(filename, chunk):
-    r = _reader()
+def _create_rd_rm_imu(filename, chunk, mapped):
+    r = _create_reader(mapped)
     r.open(filename, chunk)
     magic = r.get_magic()
     port = r.get_port()
+    r.get_compression(magic)
     mode = r.get_mode()
     user = r.get_user()
     r.begin(mode)
     return r, _header_rm_imu(magic, port, mode, user)
 
 
-def _create_rd_pv(filename, chunk):
-    r = _reader()
+def _create_rd_pv(filename, chunk, mapped):
+    r = _create_reader(mapped)
     r.open(filename, chunk)
     magic = r.get_magic()
     port = r.get_port()
+    r.get_compression(magic)
     mode = r.get_mode()
     width, height, framerate = r.get_video_format()
     profile, bitrate = r.get_video_encoding()
@@ -461,53 +922,55 @@ def _create_rd_pv(filename, chunk):
     return r, _header_pv(magic, port, mode, width, height, framerate, profile, bitrate, user)
 
 
-def _create_rd_microphone(filename, chunk):
-    r = _reader()
+def _create_rd_microphone(filename, chunk, mapped):
+    r = _create_reader(mapped)
     r.open(filename, chunk)
     magic = r.get_magic()
     port = r.get_port()
+    r.get_compression(magic)
     profile = r.get_audio_encoding()
     user = r.get_user()
     r.begin(hl2ss.StreamMode.MODE_0)    
     return r, _header_microphone(magic, port, profile, user)
 
 
-def _create_rd_si(filename, chunk):
-    r = _reader()
+def _create_rd_si(filename, chunk, mapped):
+    r = _create_reader(mapped)
     r.open(filename, chunk)
     magic = r.get_magic()
     port = r.get_port()
+    r.get_compression(magic)
     user = r.get_user()
     r.begin(hl2ss.StreamMode.MODE_0)
     return r, _header_si(magic, port, user)
 
 
-def _create_rd(filename, chunk):
+def _create_rd(filename, chunk, mapped=False):
     magic, port = _probe(filename, chunk)
     if   (port == hl2ss.StreamPort.RM_VLC_LEFTFRONT):
-        return _create_rd_rm_vlc(filename, chunk)
+        return _create_rd_rm_vlc(filename, chunk, mapped)
     elif (port == hl2ss.StreamPort.RM_VLC_LEFTLEFT):
-        return _create_rd_rm_vlc(filename, chunk)
+        return _create_rd_rm_vlc(filename, chunk, mapped)
     elif (port == hl2ss.StreamPort.RM_VLC_RIGHTFRONT):
-        return _create_rd_rm_vlc(filename, chunk)
+        return _create_rd_rm_vlc(filename, chunk, mapped)
     elif (port == hl2ss.StreamPort.RM_VLC_RIGHTRIGHT):
-        return _create_rd_rm_vlc(filename, chunk)
+        return _create_rd_rm_vlc(filename, chunk, mapped)
     elif (port == hl2ss.StreamPort.RM_DEPTH_AHAT):
-        return _create_rd_rm_depth_ahat(filename, chunk)
+        return _create_rd_rm_depth_ahat(filename, chunk, mapped)
     elif (port == hl2ss.StreamPort.RM_DEPTH_LONGTHROW):
-        return _create_rd_rm_depth_longthrow(filename, chunk)
+        return _create_rd_rm_depth_longthrow(filename, chunk, mapped)
     elif (port == hl2ss.StreamPort.RM_IMU_ACCELEROMETER):
-        return _create_rd_rm_imu(filename, chunk)
+        return _create_rd_rm_imu(filename, chunk, mapped)
     elif (port == hl2ss.StreamPort.RM_IMU_GYROSCOPE):
-        return _create_rd_rm_imu(filename, chunk)
+        return _create_rd_rm_imu(filename, chunk, mapped)
     elif (port == hl2ss.StreamPort.RM_IMU_MAGNETOMETER):
-        return _create_rd_rm_imu(filename, chunk)
+        return _create_rd_rm_imu(filename, chunk, mapped)
     elif (port == hl2ss.StreamPort.PERSONAL_VIDEO):
-        return _create_rd_pv(filename, chunk)
+        return _create_rd_pv(filename, chunk, mapped)
     elif (port == hl2ss.StreamPort.MICROPHONE):
-        return _create_rd_microphone(filename, chunk)
+        return _create_rd_microphone(filename, chunk, mapped)
     elif (port == hl2ss.StreamPort.SPATIAL_INPUT):
-        return _create_rd_si(filename, chunk)
+        return _create_rd_si(filename, chunk, mapped)
 
 
 #------------------------------------------------------------------------------
@@ -515,17 +978,71 @@ def _create_rd(filename, chunk):
 #------------------------------------------------------------------------------
 
 class _rd(hl2ss._context_manager):
-    def __init__(self, filename, chunk):
+    def __init__(self, filename, chunk, mapped=False):
         self.filename = filename
         self.chunk = chunk
+        self.mapped = mapped
 
     def open(self):
-        self._rd, self.header = _create_rd(self.filename, self.chunk)
+        self._rd, self.header = _create_rd(self.filename, self.chunk, self.mapped)
+        self.header.compression = self._rd.compression
+        self._index = None
+        self._pending = collections.deque()
 
     def read(self):
-        return self._rd.read()
+        if (self.header.compression == Compression.NONE):
+            return self._rd.read()
+        # The next packets are decompressed by the pool while this one is used
+        while (len(self._pending) < _DECOMPRESSION_READ_AHEAD):
+            data = self._rd.read()
+            if (data is None):
+                break
+            self._pending.append(_get_decompression_pool().submit(decompress_packet, self.header.compression, data))
+        return self._pending.popleft().result() if (len(self._pending) > 0) else None
+
+    def get_index(self):
+        if (self._index is None):
+            self._index = _index(self.filename, self._rd._file, self._rd._data_begin, self._rd._mode)
+        return self._index
+
+    def is_seekable(self):
+        return True
+
+    def _seek_position(self, position):
+        for future in self._pending:
+            future.cancel()
+        self._pending.clear()
+        self._rd.seek(self.get_index().get_offset(position))
+
+    def seek(self, timestamp):
+        # The next packet read is the first packet at or after timestamp
+        self._seek_position(self.get_index().find(timestamp))
+
+    def seek_sync(self, timestamp):
+        # The next packet read is the sync frame at or before timestamp, decoding can start from it
+        # Sync frames are every sync period packets from the first packet of the stream
+        position = self.get_index().find_before(timestamp)
+        self._seek_position(position - (position % get_sync_period(self.header)))
+
+    def _continue(self, filename):
+        # Goes on with the packets of another file of the stream, decoders keep their state
+        self.close()
+        self.filename = filename
+        self._rd, header = _create_rd(self.filename, self.chunk, self.mapped)
+        self._index = None
+
+    def read_range(self, timestamp_begin, timestamp_end):
+        self.seek(timestamp_begin)
+        while (True):
+            data = self.read()
+            if ((data is None) or (data.timestamp > timestamp_end)):
+                return
+            yield data
 
     def close(self):
+        for future in self._pending:
+            future.cancel()
+        self._pending.clear()
         self._rd.close()
 
 
@@ -534,8 +1051,8 @@ class _rd(hl2ss._context_manager):
 #------------------------------------------------------------------------------
 
 class _rd_decoded_rm_vlc(_rd):
-    def __init__(self, filename, chunk):
-        super().__init__(filename, chunk)
+    def __init__(self, filename, chunk, mapped=False):
+        super().__init__(filename, chunk, mapped)
 
     def open(self):
         super().open()
@@ -549,13 +1066,22 @@ class _rd_decoded_rm_vlc(_rd):
             data.payload = self._codec.decode(data.payload)
         return data
 
+    def is_seekable(self):
+        # Encoded video can only be decoded from the first packet
+        return (self.header.profile == hl2ss.VideoProfile.RAW)
+
+    def _seek_position(self, position):
+        if (not self.is_seekable()):
+            raise Exception('seek needs a RAW profile')
+        super()._seek_position(position)
+
     def close(self):
         super().close()
 
 
 class _rd_decoded_rm_depth_ahat(_rd):
-    def __init__(self, filename, chunk):
-        super().__init__(filename, chunk)
+    def __init__(self, filename, chunk, mapped=False):
+        super().__init__(filename, chunk, mapped)
 
     def open(self):
         super().open()
@@ -569,13 +1095,22 @@ class _rd_decoded_rm_depth_ahat(_rd):
             data.payload = self._codec.decode(data.payload)
         return data
 
+    def is_seekable(self):
+        # Encoded video can only be decoded from the first packet
+        return (self.header.profile == hl2ss.VideoProfile.RAW)
+
+    def _seek_position(self, position):
+        if (not self.is_seekable()):
+            raise Exception('seek needs a RAW profile')
+        super()._seek_position(position)
+
     def close(self):
         super().close()
 
 
 class _rd_decoded_rm_depth_longthrow(_rd):
-    def __init__(self, filename, chunk):
-        super().__init__(filename, chunk)
+    def __init__(self, filename, chunk, mapped=False):
+        super().__init__(filename, chunk, mapped)
 
     def open(self):
         super().open()
@@ -591,8 +1126,8 @@ class _rd_decoded_rm_depth_longthrow(_rd):
 
 
 class _rd_decoded_pv(_rd):
-    def __init__(self, filename, chunk, format):
-        super().__init__(filename, chunk)
+    def __init__(self, filename, chunk, format, mapped=False):
+        super().__init__(filename, chunk, mapped)
         self.format = format
 
     def open(self):
@@ -608,13 +1143,22 @@ class _rd_decoded_pv(_rd):
             data.payload.image = self._codec.decode(data.payload.image, self.format)
         return data
 
+    def is_seekable(self):
+        # Encoded video can only be decoded from the first packet
+        return (self.header.profile == hl2ss.VideoProfile.RAW)
+
+    def _seek_position(self, position):
+        if (not self.is_seekable()):
+            raise Exception('seek needs a RAW profile')
+        super()._seek_position(position)
+
     def close(self):
         super().close()
 
 
 class _rd_decoded_microphone(_rd):
-    def __init__(self, filename, chunk):
-        super().__init__(filename, chunk)
+    def __init__(self, filename, chunk, mapped=False):
+        super().__init__(filename, chunk, mapped)
         
     def open(self):
         super().open()
@@ -627,40 +1171,120 @@ class _rd_decoded_microphone(_rd):
             data.payload = self._codec.decode(data.payload)        
         return data
 
+    def _seek_position(self, position):
+        super()._seek_position(position)
+        self._codec.create()
+
     def close(self):
         super().close()
 
 
+#------------------------------------------------------------------------------
+# Segmented Reader
+#------------------------------------------------------------------------------
+
+class _segmented_index(_index):
+    def __init__(self, indices):
+        self.timestamps = np.concatenate([index.timestamps for index in indices]) if (len(indices) > 0) else np.zeros(0, dtype=np.uint64)
+        self.begins = np.cumsum([0] + [len(index) for index in indices])
+
+    def locate(self, position):
+        # Segment of the packet and its position in the segment
+        segment = min(int(np.searchsorted(self.begins, position, side='right')) - 1, len(self.begins) - 2)
+        return segment, position - int(self.begins[segment])
+
+
+class _rd_segmented(_rd):
+    # The closed segments of a segmented stream read as one stream
+    # The manifest is read again at the end of the last segment, segments closed in the meantime are read too
+    def __init__(self, decoded, filename, chunk, format, mapped=False):
+        self.decoded = decoded
+        self.filename = filename
+        self.chunk = chunk
+        self.format = format
+        self.mapped = mapped
+
+    def open(self):
+        self._segments = get_closed_segments(self.filename)
+        if (len(self._segments) == 0):
+            raise Exception(f'{self.filename} has no closed segments')
+        self._segment = 0
+        self._reader = create_rd(self.decoded, self._segments[0], self.chunk, self.format, self.mapped)
+        self._reader.open()
+        self.header = self._reader.header
+        self._index = None
+
+    def _open_segment(self, segment):
+        self._reader._continue(self._segments[segment])
+        self._segment = segment
+
+    def read(self):
+        while (True):
+            data = self._reader.read()
+            if (data is not None):
+                return data
+            if ((self._segment + 1) >= len(self._segments)):
+                self._segments = get_closed_segments(self.filename)
+                if ((self._segment + 1) >= len(self._segments)):
+                    return None
+            self._open_segment(self._segment + 1)
+
+    def get_index(self):
+        if ((self._index is None) or ((len(self._index.begins) - 1) != len(self._segments))):
+            indices = []
+            for segment in self._segments:
+                r, header = _create_rd(segment, self.chunk)
+                indices.append(_index(segment, r._file, r._data_begin, r._mode))
+                r.close()
+            self._index = _segmented_index(indices)
+        return self._index
+
+    def is_seekable(self):
+        return self._reader.is_seekable()
+
+    def _seek_position(self, position):
+        segment, position = self.get_index().locate(position)
+        if (segment != self._segment):
+            self._open_segment(segment)
+        self._reader._seek_position(position)
+
+    def close(self):
+        self._reader.close()
+
+
 #------------------------------------------------------------------------------
 # Create Reader
 #------------------------------------------------------------------------------
 
-def create_rd(decoded, filename, chunk, format):
+def create_rd(decoded, filename, chunk, format, mapped=False):
+    # mapped readers return packets whose payload and pose are views into a memory map of the file
+    if (is_segmented(filename)):
+        return _rd_segmented(decoded, filename, chunk, format, mapped)
     magic, port = _probe(filename, chunk)
     if   (port == hl2ss.StreamPort.RM_VLC_LEFTFRONT):
-        return _rd_decoded_rm_vlc(filename, chunk) if (decoded) else _rd(filename, chunk)
+        return _rd_decoded_rm_vlc(filename, chunk, mapped) if (decoded) else _rd(filename, chunk, mapped)
     elif (port == hl2ss.StreamPort.RM_VLC_LEFTLEFT):
-        return _rd_decoded_rm_vlc(filename, chunk) if (decoded) else _rd(filename, chunk)
+        return _rd_decoded_rm_vlc(filename, chunk, mapped) if (decoded) else _rd(filename, chunk, mapped)
     elif (port == hl2ss.StreamPort.RM_VLC_RIGHTFRONT):
-        return _rd_decoded_rm_vlc(filename, chunk) if (decoded) else _rd(filename, chunk)
+        return _rd_decoded_rm_vlc(filename, chunk, mapped) if (decoded) else _rd(filename, chunk, mapped)
     elif (port == hl2ss.StreamPort.RM_VLC_RIGHTRIGHT):
-        return _rd_decoded_rm_vlc(filename, chunk) if (decoded) else _rd(filename, chunk)
+        return _rd_decoded_rm_vlc(filename, chunk, mapped) if (decoded) else _rd(filename, chunk, mapped)
     elif (port == hl2ss.StreamPort.RM_DEPTH_AHAT):
-        return _rd_decoded_rm_depth_ahat(filename, chunk) if (decoded) else _rd(filename, chunk)
+        return _rd_decoded_rm_depth_ahat(filename, chunk, mapped) if (decoded) else _rd(filename, chunk, mapped)
     elif (port == hl2ss.StreamPort.RM_DEPTH_LONGTHROW):
-        return _rd_decoded_rm_depth_longthrow(filename, chunk) if (decoded) else _rd(filename, chunk)
+        return _rd_decoded_rm_depth_longthrow(filename, chunk, mapped) if (decoded) else _rd(filename, chunk, mapped)
     elif (port == hl2ss.StreamPort.RM_IMU_ACCELEROMETER):
-        return _rd(filename, chunk)
+        return _rd(filename, chunk, mapped)
     elif (port == hl2ss.StreamPort.RM_IMU_GYROSCOPE):
-        return _rd(filename, chunk)
+        return _rd(filename, chunk, mapped)
     elif (port == hl2ss.StreamPort.RM_IMU_MAGNETOMETER):
-        return _rd(filename, chunk)
+        return _rd(filename, chunk, mapped)
     elif (port == hl2ss.StreamPort.PERSONAL_VIDEO):
-        return _rd_decoded_pv(filename, chunk, format) if (decoded) else _rd(filename, chunk)
+        return _rd_decoded_pv(filename, chunk, format, mapped) if (decoded) else _rd(filename, chunk, mapped)
     elif (port == hl2ss.StreamPort.MICROPHONE):
-        return _rd_decoded_microphone(filename, chunk) if (decoded) else _rd(filename, chunk)
+        return _rd_decoded_microphone(filename, chunk, mapped) if (decoded) else _rd(filename, chunk, mapped)
     elif (port == hl2ss.StreamPort.SPATIAL_INPUT):
-        return _rd(filename, chunk)
+        return _rd(filename, chunk, mapped)
 
 
 #------------------------------------------------------------------------------
@@ -668,34 +1292,154 @@ def create_rd(decoded, filename, chunk, format):
 #------------------------------------------------------------------------------
 
 class sequencer:
-    def __init__(self, decoded, filename, chunk, format):
+    def __init__(self, decoded, filename, chunk, format, mapped=False):
         self.decoded = decoded
         self.filename = filename
         self.chunk = chunk
         self.format = format
+        self.mapped = mapped
 
     def open(self):
-        self._rd = create_rd(self.decoded, self.filename, self.chunk, self.format)
+        self._rd = create_rd(self.decoded, self.filename, self.chunk, self.format, self.mapped)
         self._rd.open()
         self._l = self._rd.read()
         self._r = self._rd.read()
 
+    def seek(self, timestamp):
+        # Moves to the pair of packets around timestamp, backwards or forwards
+        position = self._rd.get_index().find_before(timestamp)
+        self._rd._seek_position(position)
+        self._l = self._rd.read()
+        self._r = self._rd.read()
+
+    def _advance(self, timestamp):
+        # Moves forward until _r is the first packet at or after timestamp, or None at the end of the stream
+        if ((self._r is None) or (timestamp <= self._r.timestamp)):
+            return
+        if (self._rd.is_seekable()):
+            # Jumps over the packets in between instead of reading them
+            index = self._rd.get_index()
+            if ((len(index) > 0) and (index.timestamps[index.find_before(timestamp)] > self._r.timestamp)):
+                self.seek(timestamp)
+                if (self._r is None):
+                    return
+        while (timestamp > self._r.timestamp):
+            self._l = self._r
+            self._r = self._rd.read()
+            if (self._r is None):
+                return
+
     def read(self, timestamp):
         if ((self._l is None) or (self._r is None)):
             return None
         if (timestamp < self._l.timestamp):
             return None
-        while (timestamp > self._r.timestamp):
-            self._l = self._r
-            self._r = self._rd.read()
-            if (self._r is None):
-                return None
+        self._advance(timestamp)
+        if ((self._l is None) or (self._r is None)):
+            return None
         return self._l if ((timestamp - self._l.timestamp) < (self._r.timestamp - timestamp)) else self._r
     
     def close(self):
         self._rd.close()
 
 
+#------------------------------------------------------------------------------
+# Synchronizer
+#------------------------------------------------------------------------------
+# Aligns any number of streams to the packets of a base stream in one forward
+# pass, only the two packets around the current base timestamp are kept per stream
+
+class SyncPolicy:
+    NEAREST      = 0
+    PREVIOUS     = 1
+    INTERPOLATED = 2
+
+
+# Largest difference between the timestamps of aligned packets, in hundreds of
+# nanoseconds, as used by the synchronization services
+_SYNC_TOLERANCE = 1e8
+
+
+def _interpolate_pose(pose_l, pose_r, weight):
+    pose = ((1 - weight) * pose_l + weight * pose_r).astype(np.float32)
+    # Closest rotation to the blended one
+    u, _, vt = np.linalg.svd(pose[:3, :3])
+    pose[:3, :3] = u @ vt
+    return pose
+
+
+class synchronizer(hl2ss._context_manager):
+    # base is the filename of the base stream, streams maps a name to the filename of every other stream
+    # read returns (base packet, {name: packet or None}), None when there is no packet within tolerance
+    # INTERPOLATED returns a packet at the base timestamp with the pose interpolated between the packets
+    # around it and the payload of the nearest one
+    def __init__(self, base, streams, decoded, chunk, format, policy=SyncPolicy.NEAREST, tolerance=_SYNC_TOLERANCE, mapped=False):
+        self.base = base
+        self.streams = streams
+        self.decoded = decoded
+        self.chunk = chunk
+        self.format = format
+        self.policy = policy
+        self.tolerance = tolerance
+        self.mapped = mapped
+
+    def open(self):
+        self._base = create_rd(self.decoded, self.base, self.chunk, self.format, self.mapped)
+        self._base.open()
+        self._streams = {}
+        for name, filename in self.streams.items():
+            self._streams[name] = sequencer(self.decoded, filename, self.chunk, self.format, self.mapped)
+            self._streams[name].open()
+
+    def _nearest(self, timestamp, l, r):
+        if ((r is not None) and ((l is None) or (abs(r.timestamp - timestamp) < abs(timestamp - l.timestamp)))):
+            l = r
+        return l if ((l is not None) and (abs(l.timestamp - timestamp) <= self.tolerance)) else None
+
+    def _previous(self, timestamp, l, r):
+        if ((r is not None) and (r.timestamp == timestamp)):
+            return r
+        return l if ((l is not None) and (l.timestamp <= timestamp) and ((timestamp - l.timestamp) <= self.tolerance)) else None
+
+    def _interpolated(self, timestamp, l, r):
+        nearest = self._nearest(timestamp, l, r)
+        if ((nearest is None) or (l is None) or (r is None) or (not (l.timestamp < timestamp < r.timestamp))):
+            return nearest
+        if ((r.timestamp - l.timestamp) > (2 * self.tolerance)):
+            return nearest
+        if ((l.pose is None) or (r.pose is None) or (not hl2ss.is_valid_pose(l.pose)) or (not hl2ss.is_valid_pose(r.pose))):
+            return nearest
+        weight = (timestamp - l.timestamp) / (r.timestamp - l.timestamp)
+        return hl2ss._packet(timestamp, nearest.payload, _interpolate_pose(l.pose, r.pose, weight))
+
+    def _align(self, timestamp, stream):
+        stream._advance(timestamp)
+        if   (self.policy == SyncPolicy.NEAREST):
+            return self._nearest(timestamp, stream._l, stream._r)
+        elif (self.policy == SyncPolicy.PREVIOUS):
+            return self._previous(timestamp, stream._l, stream._r)
+        elif (self.policy == SyncPolicy.INTERPOLATED):
+            return self._interpolated(timestamp, stream._l, stream._r)
+
+    def read(self):
+        data = self._base.read()
+        if (data is None):
+            return None
+        return data, {name: self._align(data.timestamp, stream) for name, stream in self._streams.items()}
+
+    def __iter__(self):
+        while (True):
+            data = self.read()
+            if (data is None):
+                return
+            yield data
+
+    def close(self):
+        self._base.close()
+        for stream in self._streams.values():
+            stream.close()
+
+
 #------------------------------------------------------------------------------
 # Background Writers
 #------------------------------------------------------------------------------
@@ -728,20 +1472,36 @@ def get_sync_period(wr):
 
 
 class wr_process_rx(mp.Process):
-    def __init__(self, filename, rx, user):
+    def __init__(self, filename, rx, user, compression=Compression.NONE, segment_duration=None, segment_size=None):
         super().__init__()
         self._event_stop = mp.Event()
-        self._wr = create_wr_from_rx(filename, rx, user)
+        self._wr = create_wr_from_rx(filename, rx, user, compression=compression, segment_duration=segment_duration, segment_size=segment_size)
         self._rx = rx
 
     def stop(self):
         self._event_stop.set()
 
+    def _run_compressed(self):
+        # Packets are compressed by a pool of threads while the next ones are received
+        # and written in order as soon as they are done
+        # The receive loop only waits when the pool falls a full queue behind the stream
+        pending = collections.deque()
+        with ThreadPoolExecutor(_COMPRESSION_THREADS) as pool:
+            while (not self._event_stop.is_set()):
+                pending.append(pool.submit(compress_packet, self._wr.compression, self._rx.get_next_packet()))
+                while ((len(pending) > 0) and (pending[0].done() or (len(pending) > _COMPRESSION_QUEUE_SIZE))):
+                    self._wr.write_compressed(pending.popleft().result())
+            while (len(pending) > 0):
+                self._wr.write_compressed(pending.popleft().result())
+
     def run(self):
         self._wr.open()
         self._rx.open()
-        while (not self._event_stop.is_set()):
-            self._wr.write(self._rx.get_next_packet())
+        if (self._wr.compression == Compression.NONE):
+            while (not self._event_stop.is_set()):
+                self._wr.write(self._rx.get_next_packet())
+        else:
+            self._run_compressed()
         self._rx.close()
         self._wr.close()
 
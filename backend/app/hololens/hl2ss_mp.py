@@ -1,5 +1,8 @@
 
+import copy
 import multiprocessing as mp
+import struct
+from multiprocessing import shared_memory
 from ..hololens import hl2ss
 
 
@@ -72,6 +75,104 @@ def _get_nearest_packet(data, timestamp):
     return l if (abs(data[l].timestamp - timestamp) < abs(data[r].timestamp - timestamp)) else r
 
 
+#------------------------------------------------------------------------------
+# Frame Ring
+#------------------------------------------------------------------------------
+# With a slot size, frames are written once by the source into a ring of fixed
+# size slots in shared memory and copied out by the sinks, the queues and the
+# interconnect only carry the frame stamp and timestamp of every frame
+# Slot: frame stamp of the frame it holds (-1 while it is written), frame size
+# and the frame as packed by hl2ss.pack_packet
+# The source is not held back by the sinks, so a slot can be written again while
+# a sink reads it: sinks copy the frame and check the frame stamp of the slot
+# again after the copy, a frame overwritten meanwhile is reported as lost
+# Payloads must be bytes, as received by the raw (not decoded) receivers
+
+_FRAME_RING_HEADER = '<qI'
+_FRAME_RING_HEADER_SIZE = struct.calcsize(_FRAME_RING_HEADER)
+# Slots for the frames the source writes before the interconnect buffers them
+_FRAME_RING_MARGIN = 8
+
+
+def get_slot_size(payload_size):
+    # Slot size for packets with payloads of up to payload_size bytes and a pose
+    return 12 + payload_size + 64
+
+
+class _frame_slot:
+    def __init__(self, frame_stamp, timestamp):
+        self.frame_stamp = frame_stamp
+        self.timestamp = timestamp
+
+
+class _frame_ring:
+    def __init__(self, name, slots, slot_size):
+        self.name = name
+        self.slots = slots
+        self.slot_size = slot_size
+        self._memory = None
+
+    def __getstate__(self):
+        # Every process attaches to the shared memory on first use
+        return (self.name, self.slots, self.slot_size)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def _get_view(self):
+        if (self._memory is None):
+            self._memory = shared_memory.SharedMemory(name=self.name)
+        return self._memory.buf
+
+    def _get_offset(self, frame_stamp):
+        return (frame_stamp % self.slots) * (_FRAME_RING_HEADER_SIZE + self.slot_size)
+
+    def write(self, frame_stamp, packet):
+        view = self._get_view()
+        offset = self._get_offset(frame_stamp)
+        payload_size = len(packet.payload)
+        size = 12 + payload_size + (0 if (packet.pose is None) else 64)
+        if (size > self.slot_size):
+            raise Exception(f'Frame of {size} bytes does not fit in slots of {self.slot_size} bytes')
+        struct.pack_into(_FRAME_RING_HEADER, view, offset, -1, size)
+        begin = offset + _FRAME_RING_HEADER_SIZE
+        struct.pack_into('<QI', view, begin, packet.timestamp, payload_size)
+        view[(begin + 12):(begin + 12 + payload_size)] = packet.payload
+        if (packet.pose is not None):
+            view[(begin + 12 + payload_size):(begin + size)] = packet.pose.tobytes()
+        struct.pack_into('<q', view, offset, frame_stamp)
+
+    def read(self, slot):
+        # None when the slot holds a newer frame, before or after the copy
+        view = self._get_view()
+        offset = self._get_offset(slot.frame_stamp)
+        frame_stamp, size = struct.unpack_from(_FRAME_RING_HEADER, view, offset)
+        if ((frame_stamp != slot.frame_stamp) or (size > self.slot_size)):
+            return None
+        begin = offset + _FRAME_RING_HEADER_SIZE
+        data = bytes(view[begin:(begin + size)])
+        frame_stamp, = struct.unpack_from('<q', view, offset)
+        if (frame_stamp != slot.frame_stamp):
+            return None
+        return hl2ss.unpack_packet_view(data)
+
+    def close(self):
+        if (self._memory is None):
+            return
+        try:
+            self._memory.close()
+        except BufferError:
+            # A view of the ring is still in use, it is unmapped once it is released
+            pass
+        self._memory = None
+
+
+def _create_frame_ring(buffer_size, slot_size):
+    slots = buffer_size + _FRAME_RING_MARGIN
+    memory = shared_memory.SharedMemory(create=True, size=slots * (_FRAME_RING_HEADER_SIZE + slot_size))
+    return memory, _frame_ring(memory.name, slots, slot_size)
+
+
 #------------------------------------------------------------------------------
 # Source
 #------------------------------------------------------------------------------
@@ -88,16 +189,25 @@ class _source(mp.Process):
         self._event_stop = event_stop
         self._source_dout = source_wires.source_dout
         self._interconnect_semaphore = interconnect_wires.interconnect_semaphore
+        self._frame_ring = interconnect_wires.frame_ring
 
     def stop(self):
         self._event_stop.set()
 
     def run(self):
         self._source.open()
+        frame_stamp = -1
         while (not self._event_stop.is_set()):
-            self._source_dout.put(self._source.get_next_packet())
+            data = self._source.get_next_packet()
+            if (self._frame_ring is not None):
+                frame_stamp += 1
+                self._frame_ring.write(frame_stamp, data)
+                data = _frame_slot(frame_stamp, data.timestamp)
+            self._source_dout.put(data)
             self._interconnect_semaphore.release()
         self._source.close()
+        if (self._frame_ring is not None):
+            self._frame_ring.close()
 
 
 def _create_interface_source():
@@ -113,10 +223,11 @@ def _create_source(receiver, source_wires, interconnect_wires):
 #------------------------------------------------------------------------------
 
 class _net_interconnect:
-    def __init__(self, interconnect_din, interconnect_dout, interconnect_semaphore):
+    def __init__(self, interconnect_din, interconnect_dout, interconnect_semaphore, frame_ring):
         self.interconnect_din = interconnect_din
         self.interconnect_dout = interconnect_dout
         self.interconnect_semaphore = interconnect_semaphore
+        self.frame_ring = frame_ring
 
 
 class _interconnect(mp.Process):
@@ -241,8 +352,8 @@ class _interconnect(mp.Process):
             self._process_sink()
 
 
-def _create_interface_interconnect():
-    return _net_interconnect(mp.Queue(), mp.Queue(), mp.Semaphore(_interconnect.IPC_SEMAPHORE_VALUE))
+def _create_interface_interconnect(frame_ring):
+    return _net_interconnect(mp.Queue(), mp.Queue(), mp.Semaphore(_interconnect.IPC_SEMAPHORE_VALUE), frame_ring)
 
 
 def _create_interconnect(buffer_size, source_wires, interconnect_wires):
@@ -266,6 +377,11 @@ class _sink:
         self._sink_dout = sink_wires.sink_dout
         self._sink_semaphore = sink_wires.sink_semaphore
         self._interconnect_semaphore = interconnect_wires.interconnect_semaphore
+        # Every sink maps the ring on its own, so that detaching one sink leaves the others of the process mapped
+        self._frame_ring = copy.copy(interconnect_wires.frame_ring)
+
+    def _read_frame(self, data):
+        return data if ((self._frame_ring is None) or (data is None)) else self._frame_ring.read(data)
 
     def acquire(self):
         self._sink_semaphore.acquire()
@@ -282,6 +398,8 @@ class _sink:
         self._sink_dout.put(_interconnect.IPC_SINK_DETACH)
         self._sink_dout.put(self._key)
         self._interconnect_semaphore.release()
+        if (self._frame_ring is not None):
+            self._frame_ring.close()
 
     def get_nearest(self, timestamp):
         self._sink_dout.put(_interconnect.IPC_SINK_GET_NEAREST)
@@ -289,7 +407,7 @@ class _sink:
         self._interconnect_semaphore.release()
         frame_stamp = self._sink_din.get()
         data = self._sink_din.get()
-        return (frame_stamp, data)
+        return (frame_stamp, self._read_frame(data))
 
     def get_frame_stamp(self):
         self._sink_dout.put(_interconnect.IPC_SINK_GET_FRAME_STAMP)
@@ -302,13 +420,18 @@ class _sink:
         self._interconnect_semaphore.release()
         frame_stamp = self._sink_din.get()
         data = self._sink_din.get()
-        return (frame_stamp, data)
+        return (frame_stamp, self._read_frame(data))
 
     def get_buffered_frame(self, frame_stamp):
         self._sink_dout.put(frame_stamp)
         self._interconnect_semaphore.release()
         state = self._sink_din.get()
         data = self._sink_din.get()
+        if (state == 0):
+            data = self._read_frame(data)
+            if (data is None):
+                # Overwritten by a newer frame
+                state = -1
         return (state, data)
 
 
@@ -325,9 +448,10 @@ def _create_sink(sink_wires, interconnect_wires):
 #------------------------------------------------------------------------------
 
 class _module:
-    def __init__(self, receiver, buffer_size):
+    def __init__(self, receiver, buffer_size, slot_size=None):
+        self._frame_memory, frame_ring = _create_frame_ring(buffer_size, slot_size) if (slot_size is not None) else (None, None)
         self._source_wires = _create_interface_source()
-        self._interconnect_wires = _create_interface_interconnect()
+        self._interconnect_wires = _create_interface_interconnect(frame_ring)
         self._source = _create_source(receiver, self._source_wires, self._interconnect_wires)
         self._interconnect = _create_interconnect(buffer_size, self._source_wires, self._interconnect_wires)
 
@@ -340,6 +464,9 @@ class _module:
         self._source.join()
         self._interconnect.stop()
         self._interconnect.join()
+        if (self._frame_memory is not None):
+            self._frame_memory.close()
+            self._frame_memory.unlink()
 
     def attach_sink(self, sink_wires):
         return self._interconnect.attach_sink(sink_wires)
@@ -381,8 +508,9 @@ class producer:
     def configure_si(self, host, port, chunk):
         self.configure(port, hl2ss.rx_si(host, port, chunk))
 
-    def initialize(self, port, buffer_size):
-        self._producer[port] = _module(self._rx[port], buffer_size)
+    def initialize(self, port, buffer_size, slot_size=None):
+        # With a slot size, frames go through a shared memory ring instead of the queues, see get_slot_size
+        self._producer[port] = _module(self._rx[port], buffer_size, slot_size)
 
     def start(self, port):        
         self._producer[port].start()
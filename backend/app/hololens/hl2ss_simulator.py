@@ -0,0 +1,325 @@
+
+import socket
+import struct
+import threading
+import time
+import numpy as np
+from ..hololens import hl2ss
+from ..hololens import hl2ss_io
+
+
+#------------------------------------------------------------------------------
+# Local HoloLens stream simulator
+#------------------------------------------------------------------------------
+# Serves the hl2ss stream protocol of PV, RM Depth AHAT, RM IMU, SI and
+# Microphone, the PV subsystem control messages and the ipc_rc commands on the
+# local machine, so capture can run end to end without a device
+# Streams replay hl2ss_io files, looping with increasing timestamps, or send
+# synthetic packets, either at the device rate or as fast as the client reads
+# In real time, packets that are more than one period late are dropped, as
+# the device does when the network does not keep up
+
+# Packets per second and IMU samples per packet of the synthetic streams
+class Parameters_SIMULATOR:
+    PV_FPS                      = 30
+    RM_IMU_ACCELEROMETER_FPS    = 12
+    RM_IMU_ACCELEROMETER_BATCH  = 93
+    RM_IMU_GYROSCOPE_FPS        = 24
+    RM_IMU_GYROSCOPE_BATCH      = 315
+    RM_IMU_MAGNETOMETER_FPS     = 20
+    RM_IMU_MAGNETOMETER_BATCH   = 11
+    MICROPHONE_AAC_PACKET_SIZE  = 512
+    UTC_OFFSET                  = 133000000000000000
+    APPLICATION_VERSION         = (1, 0, 0, 0)
+
+
+_SIMULATED_STREAM_PORTS = [
+    hl2ss.StreamPort.RM_DEPTH_AHAT,
+    hl2ss.StreamPort.RM_IMU_ACCELEROMETER,
+    hl2ss.StreamPort.RM_IMU_GYROSCOPE,
+    hl2ss.StreamPort.RM_IMU_MAGNETOMETER,
+    hl2ss.StreamPort.PHOTO_VIDEO,
+    hl2ss.StreamPort.MICROPHONE,
+    hl2ss.StreamPort.SPATIAL_INPUT,
+]
+
+
+def _recv_exactly(connection, size):
+    data = bytearray()
+    while (len(data) < size):
+        chunk = connection.recv(size - len(data))
+        if (len(chunk) <= 0):
+            raise Exception('connection closed')
+        data.extend(chunk)
+    return bytes(data)
+
+
+#------------------------------------------------------------------------------
+# Stream Configuration
+#------------------------------------------------------------------------------
+
+class _configuration:
+    def __init__(self, port, mode, width=None, height=None, framerate=None, profile=None, bitrate=None):
+        self.port = port
+        self.mode = mode
+        self.width = width
+        self.height = height
+        self.framerate = framerate
+        self.profile = profile
+        self.bitrate = bitrate
+
+
+def _read_configuration(connection, port):
+    # Returns None for the PV subsystem control messages (mode 2 with the start or stop bits)
+    if (port == hl2ss.StreamPort.PHOTO_VIDEO):
+        mode = struct.unpack('<B', _recv_exactly(connection, 1))[0]
+        width, height, framerate = struct.unpack('<HHB', _recv_exactly(connection, 5))
+        if ((mode & 3) == 3):
+            return mode, None
+        profile, bitrate = struct.unpack('<BI', _recv_exactly(connection, 5))
+        return mode, _configuration(port, mode, width, height, framerate, profile, bitrate)
+    if (port == hl2ss.StreamPort.RM_DEPTH_AHAT):
+        mode, profile, bitrate = struct.unpack('<BBI', _recv_exactly(connection, 6))
+        return mode, _configuration(port, mode, profile=profile, bitrate=bitrate)
+    if (port in [hl2ss.StreamPort.RM_IMU_ACCELEROMETER, hl2ss.StreamPort.RM_IMU_GYROSCOPE, hl2ss.StreamPort.RM_IMU_MAGNETOMETER]):
+        mode = struct.unpack('<B', _recv_exactly(connection, 1))[0]
+        return mode, _configuration(port, mode)
+    if (port == hl2ss.StreamPort.MICROPHONE):
+        profile = struct.unpack('<B', _recv_exactly(connection, 1))[0]
+        return hl2ss.StreamMode.MODE_0, _configuration(port, hl2ss.StreamMode.MODE_0, profile=profile)
+    return hl2ss.StreamMode.MODE_0, _configuration(port, hl2ss.StreamMode.MODE_0)
+
+
+#------------------------------------------------------------------------------
+# Packet Sources
+#------------------------------------------------------------------------------
+
+def _get_synthetic_framerate(configuration):
+    if (configuration.port == hl2ss.StreamPort.PHOTO_VIDEO):
+        return configuration.framerate
+    if (configuration.port == hl2ss.StreamPort.RM_DEPTH_AHAT):
+        return hl2ss.Parameters_RM_DEPTH_AHAT.FPS
+    if (configuration.port == hl2ss.StreamPort.RM_IMU_ACCELEROMETER):
+        return Parameters_SIMULATOR.RM_IMU_ACCELEROMETER_FPS
+    if (configuration.port == hl2ss.StreamPort.RM_IMU_GYROSCOPE):
+        return Parameters_SIMULATOR.RM_IMU_GYROSCOPE_FPS
+    if (configuration.port == hl2ss.StreamPort.RM_IMU_MAGNETOMETER):
+        return Parameters_SIMULATOR.RM_IMU_MAGNETOMETER_FPS
+    if (configuration.port == hl2ss.StreamPort.MICROPHONE):
+        return 1 / hl2ss.Parameters_MICROPHONE.PERIOD
+    if (configuration.port == hl2ss.StreamPort.SPATIAL_INPUT):
+        return hl2ss.Parameters_SI.SAMPLE_RATE
+
+
+def _create_imu_payload(batch_size):
+    samples = np.zeros(batch_size, dtype=hl2ss.RM_IMU_SAMPLE_DTYPE)
+    samples['z'] = 9.81
+    samples['temperature'] = 30
+    return samples.tobytes()
+
+
+def _create_synthetic_payload(configuration):
+    # Payloads are built once per connection, frames carry noise so that JPEG and PNG encoding costs are realistic
+    if (configuration.port == hl2ss.StreamPort.PHOTO_VIDEO):
+        if (configuration.profile != hl2ss.VideoProfile.RAW):
+            raise Exception('synthetic PV is only available with the RAW profile, replay a file for encoded PV')
+        image_size = (hl2ss.get_nv12_stride(configuration.width) * configuration.height * 3) // 2
+        intrinsics = struct.pack('<ffff', 500, 500, configuration.width / 2, configuration.height / 2)
+        return np.random.randint(0, 256, image_size, dtype=np.uint8).tobytes() + intrinsics
+    if (configuration.port == hl2ss.StreamPort.RM_DEPTH_AHAT):
+        if (configuration.profile != hl2ss.VideoProfile.RAW):
+            raise Exception('synthetic AHAT is only available with the RAW profile, replay a file for encoded AHAT')
+        rows, columns = np.mgrid[0:hl2ss.Parameters_RM_DEPTH_AHAT.HEIGHT, 0:hl2ss.Parameters_RM_DEPTH_AHAT.WIDTH]
+        depth = ((rows + columns) * 2).astype(np.uint16)
+        ab = ((rows * columns) % 1024).astype(np.uint16)
+        return depth.tobytes() + ab.tobytes()
+    if (configuration.port == hl2ss.StreamPort.RM_IMU_ACCELEROMETER):
+        return _create_imu_payload(Parameters_SIMULATOR.RM_IMU_ACCELEROMETER_BATCH)
+    if (configuration.port == hl2ss.StreamPort.RM_IMU_GYROSCOPE):
+        return _create_imu_payload(Parameters_SIMULATOR.RM_IMU_GYROSCOPE_BATCH)
+    if (configuration.port == hl2ss.StreamPort.RM_IMU_MAGNETOMETER):
+        return _create_imu_payload(Parameters_SIMULATOR.RM_IMU_MAGNETOMETER_BATCH)
+    if (configuration.port == hl2ss.StreamPort.MICROPHONE):
+        if (configuration.profile == hl2ss.AudioProfile.RAW):
+            return bytes(hl2ss.Parameters_MICROPHONE.GROUP_SIZE * hl2ss.Parameters_MICROPHONE.CHANNELS * hl2ss._SIZEOF.SHORT)
+        # Not a valid AAC frame, the capture path stores the payloads as they are
+        return np.random.randint(0, 256, Parameters_SIMULATOR.MICROPHONE_AAC_PACKET_SIZE, dtype=np.uint8).tobytes()
+    if (configuration.port == hl2ss.StreamPort.SPATIAL_INPUT):
+        payload = bytearray(hl2ss._Mode0Layout_SI.END_HAND_RIGHT)
+        payload[0] = hl2ss._SI_Field.HEAD
+        payload[hl2ss._Mode0Layout_SI.BEGIN_HEAD_FORWARD:hl2ss._Mode0Layout_SI.END_HEAD_FORWARD] = struct.pack('<fff', 0, 0, -1)
+        payload[hl2ss._Mode0Layout_SI.BEGIN_HEAD_UP:hl2ss._Mode0Layout_SI.END_HEAD_UP] = struct.pack('<fff', 0, 1, 0)
+        return bytes(payload)
+
+
+def _synthetic_packets(configuration):
+    payload = _create_synthetic_payload(configuration)
+    period = hl2ss.TimeBase.HUNDREDS_OF_NANOSECONDS / _get_synthetic_framerate(configuration)
+    start = time.perf_counter_ns() // 100
+    index = 0
+    while (True):
+        yield hl2ss._packet(start + int(index * period), payload, None)
+        index += 1
+
+
+def _replay_packets(filename):
+    # Loops over the file, timestamps of every loop continue after the last packet of the previous one
+    offset = 0
+    while (True):
+        reader = hl2ss_io.create_rd(False, filename, hl2ss.ChunkSize.SINGLE_TRANSFER, None)
+        reader.open()
+        first = None
+        last = None
+        while (True):
+            packet = reader.read()
+            if (packet is None):
+                break
+            if (first is None):
+                first = packet.timestamp
+            last = packet.timestamp
+            packet.timestamp = packet.timestamp - first + offset
+            yield packet
+        reader.close()
+        if (first is None):
+            raise Exception(f'{filename} has no packets')
+        offset += (last - first) + max((last - first) // 1000, 1)
+
+
+#------------------------------------------------------------------------------
+# Statistics
+#------------------------------------------------------------------------------
+
+class _stream_statistics:
+    def __init__(self):
+        self.connections = 0
+        self.sent_packets = 0
+        self.sent_bytes = 0
+        self.dropped_packets = 0
+
+    def to_dict(self):
+        return {'connections': self.connections, 'sent_packets': self.sent_packets, 'sent_bytes': self.sent_bytes, 'dropped_packets': self.dropped_packets}
+
+
+#------------------------------------------------------------------------------
+# Simulator
+#------------------------------------------------------------------------------
+
+class simulator(hl2ss._context_manager):
+    def __init__(self, host='127.0.0.1', ports=None, filenames=None, realtime=True):
+        # filenames: port -> hl2ss_io file to replay, the other ports send synthetic packets
+        self.host = host
+        self.ports = _SIMULATED_STREAM_PORTS if (ports is None) else ports
+        self.filenames = {} if (filenames is None) else filenames
+        self.realtime = realtime
+        self.statistics = {port: _stream_statistics() for port in self.ports}
+        self.pv_subsystem = False
+
+    def open(self):
+        self._enable = True
+        self._sockets = []
+        self._threads = []
+        for port in self.ports + [hl2ss.IPCPort.REMOTE_CONFIGURATION]:
+            server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            server.bind((self.host, port))
+            server.listen()
+            self._sockets.append(server)
+            thread = threading.Thread(target=self._accept, args=(server, port), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _accept(self, server, port):
+        while (self._enable):
+            try:
+                connection, _ = server.accept()
+            except OSError:
+                return
+            target = self._serve_rc if (port == hl2ss.IPCPort.REMOTE_CONFIGURATION) else self._serve_stream
+            threading.Thread(target=target, args=(connection, port), daemon=True).start()
+
+    def _serve_stream(self, connection, port):
+        with connection:
+            try:
+                mode, configuration = _read_configuration(connection, port)
+            except Exception:
+                return
+            if (configuration is None):
+                # PV subsystem start (0x7) or stop (0xB)
+                self.pv_subsystem = (mode & 4) != 0
+                return
+            self.statistics[port].connections += 1
+            try:
+                self._send_packets(connection, configuration)
+            except Exception:
+                return
+
+    def _send_packets(self, connection, configuration):
+        statistics = self.statistics[configuration.port]
+        filename = self.filenames.get(configuration.port, None)
+        packets = _replay_packets(filename) if (filename is not None) else _synthetic_packets(configuration)
+        pose = np.eye(4, dtype=np.float32)
+        start_time = None
+        first = None
+        period = None
+        for packet in packets:
+            if (not self._enable):
+                return
+            if (self.realtime):
+                if (first is None):
+                    start_time = time.perf_counter()
+                    first = packet.timestamp
+                due = start_time + (packet.timestamp - first) / hl2ss.TimeBase.HUNDREDS_OF_NANOSECONDS
+                delay = due - time.perf_counter()
+                if (period is None):
+                    period = 1 / _get_synthetic_framerate(configuration)
+                if (delay < -period):
+                    statistics.dropped_packets += 1
+                    continue
+                if (delay > 0):
+                    time.sleep(delay)
+            if (configuration.mode == hl2ss.StreamMode.MODE_1):
+                packet.pose = pose if (packet.pose is None) else packet.pose
+            else:
+                packet.pose = None
+            data = hl2ss.pack_packet(packet)
+            connection.sendall(data)
+            statistics.sent_packets += 1
+            statistics.sent_bytes += len(data)
+
+    def _serve_rc(self, connection, port):
+        with connection:
+            try:
+                while (self._enable):
+                    command = struct.unpack('<B', _recv_exactly(connection, 1))[0]
+                    if (command == hl2ss.ipc_rc._CMD_GET_APPLICATION_VERSION):
+                        connection.sendall(struct.pack('<HHHH', *Parameters_SIMULATOR.APPLICATION_VERSION))
+                    elif (command == hl2ss.ipc_rc._CMD_GET_UTC_OFFSET):
+                        _recv_exactly(connection, 4)
+                        connection.sendall(struct.pack('<Q', Parameters_SIMULATOR.UTC_OFFSET))
+                    elif (command == hl2ss.ipc_rc._CMD_GET_PV_SUBSYSTEM_STATUS):
+                        connection.sendall(struct.pack('<B', 1 if (self.pv_subsystem) else 0))
+                    elif (command == hl2ss.ipc_rc._CMD_SET_PV_FOCUS):
+                        _recv_exactly(connection, 20)
+                    elif (command in [hl2ss.ipc_rc._CMD_SET_PV_EXPOSURE, hl2ss.ipc_rc._CMD_SET_PV_ISO_SPEED]):
+                        _recv_exactly(connection, 8)
+                    else:
+                        _recv_exactly(connection, 4)
+            except Exception:
+                return
+
+    def get_statistics(self):
+        return {hl2ss.get_port_name(port): statistics.to_dict() for port, statistics in self.statistics.items()}
+
+    def close(self):
+        self._enable = False
+        for server in self._sockets:
+            server.close()
+
+
+if __name__ == '__main__':
+    import sys
+    # python -m ...hl2ss_simulator [max]
+    with simulator(realtime=(len(sys.argv) < 2) or (sys.argv[1] != 'max')) as s:
+        while (True):
+            time.sleep(10)
+            print(s.get_statistics())
@@ -1,5 +1,6 @@
 
 import fractions
+import heapq
 import numpy as np
 import time
 import av
@@ -40,11 +41,8 @@ class SI_Hand:
 
 def si_unpack_hand(hand):
     poses = [hand.get_joint_pose(joint) for joint in range(0, hl2ss.SI_HandJointKind.TOTAL)]
-    orientations = np.array([pose.orientation for pose in poses])
-    positions = np.array([pose.position for pose in poses])
-    radii = np.array([pose.radius for pose in poses])
-    accuracies = np.array([pose.accuracy for pose in poses])
-    return SI_Hand(poses, orientations, positions, radii, accuracies)
+    joints = np.frombuffer(hand._data, dtype=hl2ss.SI_HAND_JOINT_DTYPE)
+    return SI_Hand(poses, joints['orientation'], joints['position'], joints['radius'].reshape((-1, 1)), joints['accuracy'].reshape((-1, 1)))
 
 
 def si_head_pose_rotation_matrix(head_pose):
@@ -92,37 +90,51 @@ def get_av_framerate(reader):
         return hl2ss.Parameters_MICROPHONE.SAMPLE_RATE
 
 
-def unpack_to_mp4(input_filenames, output_filename):
-    readers = [hl2ss_io.create_rd(False, input_filename, hl2ss.ChunkSize.SINGLE_TRANSFER, None) for input_filename in input_filenames]
+def _read_clip(reader, timestamp_end):
+    data = reader.read()
+    return None if ((data is None) or ((timestamp_end is not None) and (data.timestamp > timestamp_end))) else data
+
+
+def unpack_to_mp4(input_filenames, output_filename, timestamp_begin=None, timestamp_end=None):
+    # Single pass, packets of all the readers are muxed in timestamp order through a heap
+    # holding the next packet of every reader, so the output is interleaved and memory stays bounded
+    # timestamp_begin and timestamp_end cut a clip, video starts at the sync frame at or before timestamp_begin
+    readers = [hl2ss_io.create_rd(False, input_filename, hl2ss.ChunkSize.SINGLE_TRANSFER, None, mapped=True) for input_filename in input_filenames]
     [reader.open() for reader in readers]
+    if (timestamp_begin is not None):
+        [reader.seek(timestamp_begin) if (reader.header.port == hl2ss.StreamPort.MICROPHONE) else reader.seek_sync(timestamp_begin) for reader in readers]
 
     container = av.open(output_filename, mode='w')
     streams = [container.add_stream(get_av_codec_name(reader), rate=get_av_framerate(reader)) for reader in readers]
     codecs = [av.CodecContext.create(get_av_codec_name(reader), "r") for reader in readers]
 
-    base = hl2ss._RANGEOF.U64_MAX
-
-    for reader in readers:
-        data = reader.read()
-        if ((data is not None) and (data.timestamp < base)):
-            base = data.timestamp
-
-    [reader.close() for reader in readers]
-    [reader.open() for reader in readers]
+    heap = []
+    for i in range(0, len(readers)):
+        data = _read_clip(readers[i], timestamp_end)
+        if (data is not None):
+            heap.append((data.timestamp, i, data))
+    heapq.heapify(heap)
 
+    # Packets are muxed in timestamp order, so the first packet written is the earliest, no extra pass is needed
+    base = None
     time_base = fractions.Fraction(1, hl2ss.TimeBase.HUNDREDS_OF_NANOSECONDS)
 
-    for i in range(0, len(input_filenames)):
-        while (True):
-            data = readers[i].read()
-            if (data is None):
-                break
-            for packet in codecs[i].parse(data.payload):
-                packet.stream = streams[i]
-                packet.pts = data.timestamp - base
-                packet.dts = packet.pts
-                packet.time_base = time_base
-                container.mux(packet)
+    while (len(heap) > 0):
+        timestamp, i, data = heap[0]
+        payload = hl2ss.unpack_pv(data.payload).image if (readers[i].header.port == hl2ss.StreamPort.PERSONAL_VIDEO) else data.payload
+        for packet in codecs[i].parse(payload):
+            if (base is None):
+                base = timestamp
+            packet.stream = streams[i]
+            packet.pts = timestamp - base
+            packet.dts = packet.pts
+            packet.time_base = time_base
+            container.mux(packet)
+        data = _read_clip(readers[i], timestamp_end)
+        if (data is None):
+            heapq.heappop(heap)
+        else:
+            heapq.heapreplace(heap, (data.timestamp, i, data))
 
     container.close()
     [reader.close() for reader in readers]
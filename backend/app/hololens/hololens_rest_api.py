@@ -45,7 +45,11 @@ def send_rest_get_request(get_url, params=None):
 def get_hostname(ip_address):
 	# Define the get URL to get the HostName
 	get_url = f"http://{ip_address}/api/os/machinename"
-	response = send_rest_get_request(get_url)
+	try:
+		response = send_rest_get_request(get_url)
+	except requests.exceptions.RequestException:
+		# No device portal, e.g. when capturing from the local stream simulator
+		return None
 	if not response.ok:
 		return None
 	hostname = response.json()['ComputerName']
@@ -47,21 +47,33 @@ class CompressDataService:
 	def compress_depth(self):
 		depth_dir = os.path.join(self.depth_root_dir, ppc_const.DEPTH)
 		ab_dir = os.path.join(self.depth_root_dir, ppc_const.AB)
+		# Recordings with depth frame containers have no frame directories to compress
+		if not os.path.exists(depth_dir) and os.path.exists(self.depth_root_dir):
+			logger.info(f'No depth frame directories in {self.depth_root_dir}, skipping compression')
+			return
 		self.compress_dir(depth_dir, ppc_const.DEPTH, self.depth_root_dir)
 		self.compress_dir(ab_dir, ppc_const.AB, self.depth_root_dir)
 	
 	def compress_pv(self):
 		frames_dir = os.path.join(self.pv_dir, ppc_const.FRAMES)
+		# Encoded PV recordings only have frames once they were decoded
+		if not os.path.exists(frames_dir):
+			logger.info(f'No PV frames directory in {self.pv_dir}, skipping compression')
+			return
 		self.compress_dir(frames_dir, ppc_const.FRAMES, self.pv_dir)
 	
 	def delete_depth_dir(self):
 		depth_dir = os.path.join(self.depth_root_dir, ppc_const.DEPTH)
 		ab_dir = os.path.join(self.depth_root_dir, ppc_const.AB)
+		if not os.path.exists(depth_dir) and os.path.exists(self.depth_root_dir):
+			return
 		self.delete_dir(depth_dir)
 		self.delete_dir(ab_dir)
 	
 	def delete_pv_dir(self):
 		frames_dir = os.path.join(self.pv_dir, ppc_const.FRAMES)
+		if not os.path.exists(frames_dir):
+			return
 		self.delete_dir(frames_dir)
 
 
@@ -0,0 +1,118 @@
+import os
+import time
+
+import cv2
+
+from ..hololens import hl2ss, hl2ss_io, hl2ss_utilities
+from ..utils.constants import Hololens_Constants as const
+from ..utils.logger_config import get_logger
+from ..utils.record_file import RECORD_FILE_EXTENSION, RECORD_KIND_POSE, write_record_file
+
+logger = get_logger(__name__)
+
+
+def create_directories(dir_path):
+	if not os.path.exists(dir_path):
+		os.makedirs(dir_path)
+
+
+class EncodedPvService:
+	# PV captured encoded is stored as the hl2ss_io file received from the device, <recording_id>_pv.bin
+	# Poses are extracted into a record file, the video is muxed into an mp4 without re-encoding
+	# and JPEG frames are only decoded when they are needed, e.g. to synchronize the streams
+
+	def __init__(self, recording_directory, recording_id):
+		self.recording_directory = recording_directory
+		self.recording_id = recording_id
+		self.pv_directory = os.path.join(self.recording_directory, const.PHOTOVIDEO)
+		self.pv_frames_directory = os.path.join(self.pv_directory, const.FRAMES)
+		self.encoded_file_path = os.path.join(
+			self.pv_directory, f'{self.recording_id}_{const.PHOTOVIDEO}{const.RAW_CAPTURE_EXTENSION}'
+		)
+		self.pose_file_path = os.path.join(
+			self.pv_directory, f'{self.recording_id}_{const.PHOTOVIDEO}_pose{RECORD_FILE_EXTENSION}'
+		)
+		self.mp4_file_path = os.path.join(
+			self.pv_directory, f'{self.recording_id}_{const.PHOTOVIDEO}{const.MP4_EXTENSION}'
+		)
+
+	def _create_reader(self):
+		reader = hl2ss_io.create_rd(False, self.encoded_file_path, hl2ss.ChunkSize.SINGLE_TRANSFER, None, mapped=True)
+		reader.open()
+		return reader
+
+	def is_encoded(self):
+		if not hl2ss_io.exists(self.encoded_file_path):
+			return False
+		reader = self._create_reader()
+		profile = reader.header.profile
+		reader.close()
+		return profile != hl2ss.VideoProfile.RAW
+
+	def extract_pose(self):
+		logger.info(f'Extracting PV poses of {self.recording_id} to {self.pose_file_path} STARTED')
+		start_time = time.time()
+		stream_records = []
+		reader = self._create_reader()
+		while True:
+			stream_packet = reader.read()
+			if stream_packet is None:
+				break
+			stream_records.append((stream_packet.timestamp, stream_packet.pose))
+		reader.close()
+		write_record_file(self.pose_file_path, RECORD_KIND_POSE, stream_records)
+		logger.info(
+			f'Extracting {len(stream_records)} PV poses of {self.recording_id} '
+			f'took {(time.time() - start_time):.2f} seconds'
+		)
+
+	def mux_to_mp4(self):
+		logger.info(f'Muxing PV of {self.recording_id} to {self.mp4_file_path} STARTED')
+		start_time = time.time()
+		hl2ss_utilities.unpack_to_mp4([self.encoded_file_path], self.mp4_file_path)
+		logger.info(f'Muxing PV of {self.recording_id} took {(time.time() - start_time):.2f} seconds')
+
+	def mux_clip_to_mp4(self, timestamp_begin, timestamp_end, clip_file_path):
+		# Clip of the PV video, e.g. of an annotated step, cut without reading the packets before it
+		hl2ss_utilities.unpack_to_mp4([self.encoded_file_path], clip_file_path, timestamp_begin, timestamp_end)
+
+	def extract_frames(self):
+		# The decoded reader of hl2ss_io drops the first frame, so frames are decoded here to keep all of them
+		logger.info(f'Decoding PV frames of {self.recording_id} to {self.pv_frames_directory} STARTED')
+		start_time = time.time()
+		create_directories(self.pv_frames_directory)
+		reader = self._create_reader()
+		codec = hl2ss.decode_pv(reader.header.profile)
+		codec.create()
+		num_of_frames = 0
+		while True:
+			stream_packet = reader.read()
+			if stream_packet is None:
+				break
+			frame = codec.decode(hl2ss.unpack_pv(stream_packet.payload).image, const.PV_DECODE_FORMAT)
+			if frame is None:
+				continue
+			pv_file_name = f'{self.recording_id}_{const.PHOTOVIDEO}_{stream_packet.timestamp}.jpg'
+			cv2.imwrite(os.path.join(self.pv_frames_directory, pv_file_name), frame)
+			num_of_frames += 1
+		reader.close()
+		logger.info(
+			f'Decoding {num_of_frames} PV frames of {self.recording_id} took {(time.time() - start_time):.2f} seconds'
+		)
+
+	def has_frames(self):
+		return os.path.exists(self.pv_frames_directory) and len(os.listdir(self.pv_frames_directory)) > 0
+
+	def prepare_frames(self):
+		# Frames and poses are what the synchronization reads for PV, decoded only when they are missing
+		if not self.is_encoded():
+			return False
+		if not os.path.exists(self.pose_file_path):
+			self.extract_pose()
+		if not self.has_frames():
+			self.extract_frames()
+		return True
+
+	def process(self):
+		self.extract_pose()
+		self.mux_to_mp4()
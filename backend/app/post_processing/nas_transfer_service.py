@@ -16,19 +16,30 @@ class NASTransferService:
         self.local_data_root_dir = local_data_root_dir
         self.remote_data_root_dir = const.NAS_DATA_ROOT_DIR
 
+    @staticmethod
+    def _is_updated_file(item):
+        # Manifests and indices change while a capture is recorded, they are transferred again on every run
+        return item.endswith(const.MANIFEST_FILE_EXTENSION) or item.endswith(const.INDEX_FILE_EXTENSION)
+
     def _transfer_directory(self, sftp_client, src_directory, dst_directory, is_file=False):
         if not is_file:
             sftp_client.makedirs(dst_directory)
-        for item in os.listdir(src_directory):
+        # Manifests go last, so that the segments they list are on the NAS before them
+        for item in sorted(os.listdir(src_directory), key=lambda item: item.endswith(const.MANIFEST_FILE_EXTENSION)):
             src_path = os.path.join(src_directory, item)
             dst_path = os.path.join(dst_directory, item)
             if os.path.isfile(src_path) or is_file:
-                try:
-                    sftp_client.stat(dst_path)
-                    logger.info(f"File {dst_path} already exists on NAS. Skipping transfer.")
+                if item.endswith(const.PART_FILE_EXTENSION) or \
+                        item.endswith(const.PART_FILE_EXTENSION + const.INDEX_FILE_EXTENSION):
+                    # Segment still being written by a capture and its index, transferred once it is closed
                     continue
-                except FileNotFoundError:
-                    logger.info(f"File {dst_path} does not exist on NAS. Transferring...")
+                if not self._is_updated_file(item):
+                    try:
+                        sftp_client.stat(dst_path)
+                        logger.info(f"File {dst_path} already exists on NAS. Skipping transfer.")
+                        continue
+                    except FileNotFoundError:
+                        logger.info(f"File {dst_path} does not exist on NAS. Transferring...")
                 sftp_client.put(src_path, dst_path)
                 logger.info(f'Transferred {item} to NAS')
             elif os.path.isdir(src_path):
@@ -0,0 +1,66 @@
+import os
+import time
+
+from ..hololens import hl2ss, hl2ss_io
+from ..services.hololens_service import (
+	Consumer, create_stream_directories, get_port_to_dir, get_port_to_stream, get_raw_capture_file_path
+)
+from ..utils.constants import Hololens_Constants as const
+from ..utils.logger_config import get_logger
+from .encoded_pv_service import EncodedPvService
+
+logger = get_logger(__name__)
+
+
+class RawCaptureProcessingService:
+	# Stores the frames, poses and samples of a raw capture, as the Consumer does while recording in redis mode
+	# Raw capture files are read with hl2ss_io.create_rd and go through the writers of the Consumer
+
+	def __init__(self, recording, recording_directory):
+		self.recording = recording
+		self.recording_directory = recording_directory
+		self.port_to_dir = get_port_to_dir(self.recording_directory)
+		self.port_to_stream = get_port_to_stream()
+
+	def fetch_raw_capture_file_paths(self):
+		port_to_raw_capture_file_path = {}
+		for stream_port, stream_name in self.port_to_stream.items():
+			raw_capture_file_path = get_raw_capture_file_path(
+				self.port_to_dir[stream_port], self.recording.get_recording_id(), stream_name
+			)
+			if hl2ss_io.exists(raw_capture_file_path):
+				port_to_raw_capture_file_path[stream_port] = raw_capture_file_path
+		return port_to_raw_capture_file_path
+
+	def process_raw_capture(self, delete_raw_capture_files=False):
+		port_to_raw_capture_file_path = self.fetch_raw_capture_file_paths()
+		if not port_to_raw_capture_file_path:
+			logger.info(f'No raw capture files found for {self.recording.id}')
+			return
+
+		# Encoded PV is kept as it is, only its poses and an mp4 are extracted
+		encoded_pv_service = EncodedPvService(self.recording_directory, self.recording.get_recording_id())
+		if (hl2ss.StreamPort.PHOTO_VIDEO in port_to_raw_capture_file_path) and encoded_pv_service.is_encoded():
+			encoded_pv_service.process()
+			del port_to_raw_capture_file_path[hl2ss.StreamPort.PHOTO_VIDEO]
+			if not port_to_raw_capture_file_path:
+				return
+
+		active_streams = list(port_to_raw_capture_file_path.keys())
+		create_stream_directories(self.port_to_dir, active_streams)
+
+		logger.info(f'Started processing raw capture of {self.recording.id}')
+		start_time = time.time()
+		consumer = Consumer(
+			None, self.recording, self.port_to_stream, active_streams, self.port_to_dir,
+			os.path.join(self.recording_directory, const.SPILL)
+		)
+		consumer.process_raw_capture_files(port_to_raw_capture_file_path)
+		logger.info(
+			f'Finished processing raw capture of {self.recording.id} in {(time.time() - start_time):.2f} seconds'
+		)
+
+		if delete_raw_capture_files:
+			for raw_capture_file_path in port_to_raw_capture_file_path.values():
+				for file_path in hl2ss_io.get_files(raw_capture_file_path):
+					os.remove(file_path)
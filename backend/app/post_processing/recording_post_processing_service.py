@@ -6,6 +6,7 @@ import os
 from .sequence_viewer import SequenceViewer
 from .compress_data_service import CompressDataService
 from .nas_transfer_service import NASTransferService
+from .raw_capture_processing_service import RawCaptureProcessingService
 from .synchronization_service import SynchronizationService
 from .video_conversion_service import VideoConversionService
 from ..utils.constants import Post_Processing_Constants as const
@@ -41,6 +42,10 @@ class RecordingPostProcessingService:
 		logger.info(f'Finished changing video resolution for {self.recording.id}')
 		return converted_file_path
 	
+	def process_raw_capture(self):
+		# Recordings captured in raw files mode only hold the hl2ss_io files of their streams until this step
+		RawCaptureProcessingService(self.recording, self.hololens_data_directory).process_raw_capture()
+	
 	def synchronize_data(self):
 		base_stream = const.PHOTOVIDEO
 		sync_streams = [const.DEPTH_AHAT, const.SPATIAL]
@@ -119,6 +124,7 @@ class RecordingPostProcessingService:
 		self.nas_transfer_service.transfer_from_local_to_nas()
 	
 	def process_and_push_data_to_nas(self):
+		self.process_raw_capture()
 		self.synchronize_data()
 		self.compress_data()
 		self.delete_uncompressed_data()
@@ -9,7 +9,9 @@ import logging
 
 import torch
 
-from ..hololens import hl2ss, hl2ss_3dcv, hl2ss_utilities
+from ..hololens import hl2ss, hl2ss_3dcv
+from ..hololens.calibration_store import get_calibration_store
+from ..utils.frame_container import FrameContainerReader, get_frame_container_path
 
 DATA_ROOT = str(Path(__file__).resolve().parents[5] / "data")
 
@@ -52,6 +54,13 @@ class SequenceLoader:
             str(self._data_folder / "depth_ahat" / "depth" / f"depth-{i:06d}.png")
             for i in range(self._num_frames)
         ]
+        # Sequences synchronized from frame containers keep all depth frames in one container keyed by frame id
+        depth_container_path = get_frame_container_path(
+            str(self._data_folder / "depth_ahat"), rec_id, "depth_ahat", "depth"
+        )
+        self._depth_container = (
+            FrameContainerReader(depth_container_path) if os.path.exists(depth_container_path) else None
+        )
 
         self._frame_id = -1
         self._points = None
@@ -103,6 +112,17 @@ class SequenceLoader:
         )  # shape: [H, W]
         return depth
 
+    def _load_depth_frame_as_tensor(self, frame_id):
+        if self._depth_container is None:
+            return self._load_depth_image_as_tensor(self._depth_files[frame_id])
+        depth = self._depth_container.get_frame_by_key(frame_id)
+        if depth is None:
+            depth = np.zeros((self._depth_height, self._depth_width), dtype=np.uint16)
+        depth = torch.from_numpy(depth.astype(np.float32)).to(
+            self._device
+        )  # shape: [H, W]
+        return depth
+
     def _colorize_depth(self, depth, min_depth=0.0, max_depth=2.0):
         # Min-max depth normalization
         depth_scale = depth / self._depth_scale
@@ -126,77 +146,32 @@ class SequenceLoader:
         self._num_frames = data["num_of_frames"]
         self._logger.debug("Meta data loaded.")
 
-    def _load_extrinsic_matrix(self, file_path):
-        data = self._load_data_from_bin_file(file_path)
-        T = data.reshape(4, 4).transpose()
-        return torch.from_numpy(T).to(self._device)
+    def _load_extrinsic_matrix(self, extrinsics):
+        return torch.from_numpy(extrinsics.transpose().copy()).to(self._device)
 
-    def _load_intrinsic_matrix(self, file_path):
-        data = self._load_data_from_bin_file(file_path)
-        K = data.reshape(4, 4).transpose()
-        return torch.from_numpy(K[:3, :3]).to(self._device)
+    def _load_intrinsic_matrix(self, intrinsics):
+        return torch.from_numpy(intrinsics.transpose()[:3, :3].copy()).to(self._device)
 
     def _load_pv_calibration_info(self):
-        pv_calib_folder = self._calib_folder / self._device_id / "personal_video"
-        self._pv2rig = self._load_extrinsic_matrix(
-            str(pv_calib_folder / "extrinsics.bin")
-        )
-        self._pv_intrinsic = self._load_intrinsic_matrix(
-            str(
-                pv_calib_folder
-                / f"1000_{self._pv_width}_{self._pv_height}"
-                / "intrinsics.bin",
-            )
+        # Calibrations come from the process-wide store, only the first loader of a headset reads the NAS
+        self._pv_calibration = get_calibration_store().get_pv_calibration(
+            self._calib_folder, self._device_id, self._pv_width, self._pv_height
         )
+        self._pv2rig = self._load_extrinsic_matrix(self._pv_calibration["extrinsics"])
+        self._pv_intrinsic = self._load_intrinsic_matrix(self._pv_calibration["intrinsics"])
 
     def _load_depth_calibration_info(self):
-        depth_calib_folder = (
-            self._calib_folder / self._device_id / f"rm_depth_{self._depth_mode}"
-        )
-        self._depth2rig = self._load_extrinsic_matrix(
-            str(depth_calib_folder / "extrinsics.bin")
+        self._depth_calibration = get_calibration_store().get_depth_calibration(
+            self._calib_folder, self._device_id, self._depth_mode, self._depth_width, self._depth_height
         )
-        if self._depth_mode == "long":
-            self._depth_scale = 1000.0
-        elif self._depth_mode == "ahat":
-            self._depth_scale = 250.0
-        else:
-            self._depth_scale = self._depth_scale = self._load_data_from_bin_file(
-                str(depth_calib_folder / "scale.bin")
-            ).item()
-        uv2xy = self._load_data_from_bin_file(
-            str(depth_calib_folder / "uv2xy.bin")
-        ).reshape((-1, 2))
-        xy1 = np.concatenate(
-            (uv2xy, np.ones((uv2xy.shape[0], 1), dtype=np.float32)), axis=-1
-        )
-        self._depth_xy1 = torch.from_numpy(xy1).to(self._device)
+        self._depth2rig = self._load_extrinsic_matrix(self._depth_calibration["extrinsics"])
+        self._depth_scale = self._depth_calibration["scale"].item()
+        self._depth_xy1 = torch.from_numpy(self._depth_calibration["xy1"]).to(self._device)
 
     def _load_calibration_data(self):
-        pv_calib_folder = self._calib_folder / self._device_id / "personal_video"
-        self._principal_point = self._load_data_from_bin_file(
-            str(
-                pv_calib_folder
-                / f"1000_{self._pv_width}_{self._pv_height}"
-                / "principal_point.bin"
-            )
-        )
-        self._focal_length = self._load_data_from_bin_file(
-            str(
-                pv_calib_folder
-                / f"1000_{self._pv_width}_{self._pv_height}"
-                / "focal_length.bin"
-            )
-        )
-        self._intrinsics = torch.tensor(
-            [
-                [-self._focal_length[0], 0, self._principal_point[0]],
-                [0, self._focal_length[1], self._principal_point[1]],
-                [0, 0, 1],
-            ],
-            dtype=torch.float32,
-            device=self._device,
-        )
+        self._principal_point = self._pv_calibration["principal_point"]
+        self._focal_length = self._pv_calibration["focal_length"]
+        self._intrinsics = torch.from_numpy(self._pv_calibration["camera_matrix"]).to(self._device)
 
     def _deproject(self, depth, scale=1000.0, depth_min=0.1, depth_max=2.0):
         # process depth image
@@ -221,7 +196,8 @@ class SequenceLoader:
         )
         spatial_data = list(spatial_data.values())
         print(len(spatial_data))
-        return spatial_data
+        # All the frames are decoded at once, project_spatial indexes the batch by frame id
+        return hl2ss.unpack_si_batch([data_si for data_si, _ in spatial_data])
 
     def load_pv_pose_data(self):
         pv_pose_data = self._load_data_from_pickle_file(
@@ -236,35 +212,30 @@ class SequenceLoader:
         for x, y in hl2ss_3dcv.project(points, P):
             cv2.circle(image, (int(x), (int(y))), radius, color, thickness)
 
-    def project_spatial(self, image, pv_pose, data_si: hl2ss.unpack_si):
+    def project_spatial(self, image, pv_pose, data_si, si_index=0):
+        # data_si is one hl2ss.unpack_si or a batch of all the frames from hl2ss.unpack_si_batch
         # Marker properties
         radius = 5
         color = (0, 255, 255)
         thickness = 3
 
         if hl2ss.is_valid_pose(pv_pose) and (data_si is not None):
+            if isinstance(data_si, hl2ss.unpack_si):
+                data_si, si_index = hl2ss.unpack_si_batch([data_si]), 0
             projection = hl2ss_3dcv.world_to_reference(
                 pv_pose
             ) @ hl2ss_3dcv.camera_to_image(self._intrinsics)
-            si = data_si
-            if si.is_valid_hand_left():
-                self.project_points(
-                    image,
-                    projection,
-                    hl2ss_utilities.si_unpack_hand(si.get_hand_left()).positions,
-                    radius,
-                    color,
-                    thickness,
-                )
-            if si.is_valid_hand_right():
-                self.project_points(
-                    image,
-                    projection,
-                    hl2ss_utilities.si_unpack_hand(si.get_hand_right()).positions,
-                    radius,
-                    color,
-                    thickness,
-                )
+            is_valid_hand = data_si.is_valid_hand()[si_index]
+            for hand in [hl2ss.SI_HandIndex.LEFT, hl2ss.SI_HandIndex.RIGHT]:
+                if is_valid_hand[hand]:
+                    self.project_points(
+                        image,
+                        projection,
+                        data_si.hand_positions[si_index, hand],
+                        radius,
+                        color,
+                        thickness,
+                    )
 
     def step(self):
         self._frame_id = (self._frame_id + 1) % self._num_frames
@@ -272,17 +243,14 @@ class SequenceLoader:
 
     def step_by_frame_id(self, frame_id):
         self._frame_id = frame_id % self._num_frames
-        self._depth_img = self._load_depth_image_as_tensor(
-            self._depth_files[self._frame_id]
-        )
+        self._depth_img = self._load_depth_frame_as_tensor(self._frame_id)
         self._depth_colored = self._colorize_depth(self._depth_img)
         self._color_img = self._load_color_image_as_tensor(
             self._color_files[self._frame_id]
         )
         self._points = self._deproject(self._depth_img, self._depth_scale)
         # self._color_pose = self.pv_pose_data[self._frame_id][0]
-        # self._spatial = self.spatial_data[self._frame_id][0]
-        # self.project_spatial(self._color_img, self._color_pose, self._spatial)
+        # self.project_spatial(self._color_img, self._color_pose, self.spatial_data, self._frame_id)
 
     @property
     def rec_id(self):
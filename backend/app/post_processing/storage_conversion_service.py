@@ -0,0 +1,137 @@
+import os
+import shutil
+import time
+
+import cv2
+
+from ..utils.constants import Post_Processing_Constants as ppc_const
+from ..utils.frame_container import (
+	FRAME_CONTAINER_INDEX_EXTENSION, FrameContainerReader, FrameContainerWriter, get_frame_container_path
+)
+from ..utils.logger_config import get_logger
+from ..utils.record_file import (
+	RECORD_KIND_IMU, RECORD_KIND_POSE, RECORD_KIND_SPATIAL, get_record_file_path, write_record_file
+)
+from .synchronization_service import read_stream_pkl_data
+
+logger = get_logger(__name__)
+
+
+def get_timestamp_from_frame_file_name(frame_file_name):
+	return int(os.path.splitext(frame_file_name)[0].split('_')[-1])
+
+
+class StorageConversionService:
+	# Converts the recorded streams of a raw recording directory between storage layouts
+	# AHAT depth and AB frames: one PNG per frame <-> frame containers
+	# Pose, spatial input and IMU streams: appended pickles -> record files
+
+	def __init__(self, recording_directory, recording_id):
+		self.recording_directory = recording_directory
+		self.recording_id = recording_id
+		self.depth_root_dir = os.path.join(self.recording_directory, ppc_const.DEPTH_AHAT)
+		self.stream_pkl_files = [
+			(ppc_const.PHOTOVIDEO, f'{self.recording_id}_{ppc_const.PHOTOVIDEO}_pose.pkl', RECORD_KIND_POSE),
+			(ppc_const.DEPTH_AHAT, f'{self.recording_id}_{ppc_const.DEPTH_AHAT}_pose.pkl', RECORD_KIND_POSE),
+			(ppc_const.SPATIAL, f'{self.recording_id}_{ppc_const.SPATIAL}.pkl', RECORD_KIND_SPATIAL),
+		] + [
+			(ppc_const.IMU, f'{self.recording_id}_{imu_stream}.pkl', RECORD_KIND_IMU)
+			for imu_stream in [ppc_const.IMU_ACCELEROMETER, ppc_const.IMU_GYROSCOPE, ppc_const.IMU_MAGNETOMETER]
+		]
+
+	@classmethod
+	def convert_png_frames_to_container(cls, png_directory, container_path):
+		frame_file_names = sorted(
+			[file_name for file_name in os.listdir(png_directory) if file_name.endswith(ppc_const.PNG_EXTENSION)],
+			key=get_timestamp_from_frame_file_name
+		)
+		logger.info(f'Converting {png_directory} ({len(frame_file_names)} frames) to {container_path} STARTED')
+		start_time = time.time()
+		container_writer = None
+		for frame_file_name in frame_file_names:
+			frame = cv2.imread(os.path.join(png_directory, frame_file_name), cv2.IMREAD_ANYDEPTH)
+			if container_writer is None:
+				container_writer = FrameContainerWriter(container_path, frame.shape[0], frame.shape[1])
+			container_writer.write(get_timestamp_from_frame_file_name(frame_file_name), frame)
+		if container_writer is not None:
+			container_writer.close()
+		logger.info(f'Converting {png_directory} to {container_path} took {(time.time() - start_time):.2f} seconds')
+
+	@classmethod
+	def convert_container_to_png_frames(cls, container_path, png_directory, frame_file_name_prefix):
+		container_reader = FrameContainerReader(container_path)
+		if not os.path.exists(png_directory):
+			os.makedirs(png_directory)
+		logger.info(f'Converting {container_path} ({len(container_reader)} frames) to {png_directory} STARTED')
+		start_time = time.time()
+		for timestamp in container_reader.get_sorted_keys():
+			frame_file_name = f'{frame_file_name_prefix}_{timestamp}{ppc_const.PNG_EXTENSION}'
+			cv2.imwrite(os.path.join(png_directory, frame_file_name), container_reader.get_frame_by_key(timestamp))
+		logger.info(f'Converting {container_path} to {png_directory} took {(time.time() - start_time):.2f} seconds')
+
+	@classmethod
+	def convert_pkl_to_record_file(cls, pkl_file_path, record_kind):
+		record_file_path = get_record_file_path(pkl_file_path)
+		logger.info(f'Converting {pkl_file_path} to {record_file_path} STARTED')
+		start_time = time.time()
+		stream_records = []
+		for pkl_frame in read_stream_pkl_data(pkl_file_path):
+			stream_records.append(pkl_frame if type(pkl_frame) is tuple else (pkl_frame.timestamp, pkl_frame.payload))
+		write_record_file(record_file_path, record_kind, stream_records)
+		logger.info(
+			f'Converting {pkl_file_path} ({len(stream_records)} records) to {record_file_path} '
+			f'took {(time.time() - start_time):.2f} seconds'
+		)
+		return record_file_path
+
+	def convert_stream_pkls_to_record_files(self, delete_pkl_files=False):
+		for stream_name, pkl_file_name, record_kind in self.stream_pkl_files:
+			pkl_file_path = os.path.join(self.recording_directory, stream_name, pkl_file_name)
+			if not os.path.exists(pkl_file_path):
+				logger.info(f'No {pkl_file_name} found for {self.recording_id}')
+				continue
+			if os.path.exists(get_record_file_path(pkl_file_path)):
+				logger.info(f'{get_record_file_path(pkl_file_path)} already exists, skipping conversion')
+				continue
+			self.convert_pkl_to_record_file(pkl_file_path, record_kind)
+			if delete_pkl_files:
+				os.remove(pkl_file_path)
+
+	def convert_depth_ahat_to_containers(self, delete_png_frames=False):
+		for frame_kind in [ppc_const.DEPTH, ppc_const.AB]:
+			png_directory = os.path.join(self.depth_root_dir, frame_kind)
+			container_path = get_frame_container_path(
+				self.depth_root_dir, self.recording_id, ppc_const.DEPTH_AHAT, frame_kind
+			)
+			if not os.path.exists(png_directory):
+				# Zipped frames need to be extracted first
+				logger.info(f'No {frame_kind} frames directory found for {self.recording_id}')
+				continue
+			if os.path.exists(container_path):
+				logger.info(f'{container_path} already exists, skipping conversion')
+				continue
+			self.convert_png_frames_to_container(png_directory, container_path)
+			if delete_png_frames:
+				shutil.rmtree(png_directory)
+
+	def convert_depth_ahat_to_png(self, delete_containers=False):
+		for frame_kind in [ppc_const.DEPTH, ppc_const.AB]:
+			png_directory = os.path.join(self.depth_root_dir, frame_kind)
+			container_path = get_frame_container_path(
+				self.depth_root_dir, self.recording_id, ppc_const.DEPTH_AHAT, frame_kind
+			)
+			if not os.path.exists(container_path):
+				logger.info(f'No {frame_kind} frame container found for {self.recording_id}')
+				continue
+			self.convert_container_to_png_frames(
+				container_path, png_directory, f'{self.recording_id}_{ppc_const.DEPTH_AHAT}_{frame_kind}'
+			)
+			if delete_containers:
+				os.remove(container_path)
+				os.remove(container_path + FRAME_CONTAINER_INDEX_EXTENSION)
+
+
+if __name__ == '__main__':
+	scs = StorageConversionService(recording_directory='../../../../../data/hololens/13_43', recording_id='13_43')
+	scs.convert_depth_ahat_to_containers()
+	scs.convert_stream_pkls_to_record_files()
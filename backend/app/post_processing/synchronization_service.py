@@ -10,7 +10,10 @@ from ..hololens import hl2ss
 from ..models.recording import Recording
 from ..utils.constants import Post_Processing_Constants as ppc_const
 from ..post_processing.compress_data_service import CompressDataService
+from ..post_processing.encoded_pv_service import EncodedPvService
+from ..utils.frame_container import FrameContainerReader, FrameContainerWriter, get_frame_container_path
 from ..utils.logger_config import get_logger
+from ..utils.record_file import RecordFileReader, get_record_file_path
 
 logger = get_logger(__name__)
 UNIX_EPOCH = 11644473600
@@ -134,22 +137,30 @@ class SynchronizationService:
         return image.shape[1], image.shape[0]
 
     def create_synchronized_stream_pkl_data(self, stream_pkl_file_path, synchronized_stream_output_directory):
-        # 1. Load pickle file data into a dictionary
-        timestamp_to_stream_payload = {}
-        pkl_frames = read_stream_pkl_data(stream_pkl_file_path)
-        for pkl_frame in pkl_frames:
-            # TODO: Remove the else part after the pickle file is fixed
-            ts, payload = pkl_frame if type(pkl_frame) is tuple else (pkl_frame.timestamp, pkl_frame.payload)
-            if type(payload) is bytearray:
-                payload = hl2ss.unpack_si(payload)
-            timestamp_to_stream_payload[ts] = payload
-        # 2. Use the base_stream_keys and loaded pickle file data to synchronize them
-        stream_keys = sorted(timestamp_to_stream_payload.keys())
+        record_file_path = get_record_file_path(stream_pkl_file_path)
+        if os.path.exists(record_file_path):
+            # 1. Map the record file of the stream, payloads are read only for the synchronized timestamps
+            record_file_reader = RecordFileReader(record_file_path)
+            stream_keys = record_file_reader.get_sorted_timestamps()
+            get_stream_payload = record_file_reader.get_payload
+        else:
+            # 1. Load pickle file data into a dictionary
+            timestamp_to_stream_payload = {}
+            pkl_frames = read_stream_pkl_data(stream_pkl_file_path)
+            for pkl_frame in pkl_frames:
+                # TODO: Remove the else part after the pickle file is fixed
+                ts, payload = pkl_frame if type(pkl_frame) is tuple else (pkl_frame.timestamp, pkl_frame.payload)
+                timestamp_to_stream_payload[ts] = payload
+            stream_keys = sorted(timestamp_to_stream_payload.keys())
+            get_stream_payload = timestamp_to_stream_payload.get
+        # 2. Use the base_stream_keys and loaded stream data to synchronize them
         synced_timestamp_to_stream_payload = {}
         for base_stream_key in self.base_stream_keys:
             stream_ts_idx = get_nearest_timestamp(stream_keys, base_stream_key)
             stream_timestamp = stream_keys[stream_ts_idx]
-            stream_payload = timestamp_to_stream_payload[stream_timestamp]
+            stream_payload = get_stream_payload(stream_timestamp)
+            if type(stream_payload) is bytearray:
+                stream_payload = hl2ss.unpack_si(stream_payload)
             synced_timestamp_to_stream_payload[base_stream_key] = (stream_payload, stream_timestamp)
         # TODO: Add a logger statement here
         write_pickle_data(synced_timestamp_to_stream_payload, synchronized_stream_output_directory)
@@ -166,6 +177,21 @@ class SynchronizationService:
                         os.path.join(synchronized_stream_output_directory, stream_suffix % base_stream_counter))
         return
 
+    def create_synchronized_frame_container(self, container_path, synchronized_container_path):
+        container_reader = FrameContainerReader(container_path)
+        stream_keys = container_reader.get_sorted_keys()
+        synchronized_container_writer = FrameContainerWriter(
+            synchronized_container_path, container_reader.height, container_reader.width
+        )
+        for base_stream_counter, base_stream_key in enumerate(self.base_stream_keys):
+            stream_ts_idx = get_nearest_timestamp(stream_keys, base_stream_key)
+            # Synchronized containers are keyed by frame id, like the names of synchronized PNG frames
+            synchronized_container_writer.write(
+                base_stream_counter, container_reader.get_frame_by_key(stream_keys[stream_ts_idx])
+            )
+        synchronized_container_writer.close()
+        return container_reader
+
     # TODO: Complete code when Microphone data is considered as base stream for synchronization
     # --------- Base streams: PV, Microphone
     # --------- Synchronize Streams: PV, Depth-Ahat, Depth-Lt, Spatial, VLC frames
@@ -182,6 +208,8 @@ class SynchronizationService:
         if self.base_stream == ppc_const.PHOTOVIDEO:
             # 1. Create base stream keys used to synchronize the rest of the data
             base_stream_frames_dir = os.path.join(self.base_stream_directory, "frames")
+            # Recordings with encoded PV get their frames and poses decoded here
+            EncodedPvService(self.data_directory, self.recording_id).prepare_frames()
             self.timestamp_to_base_stream_frame = get_timestamp_to_stream_frame(base_stream_frames_dir,
                                                                                 stream_extension=".jpg",
                                                                                 timestamp_index=-1)
@@ -221,6 +249,27 @@ class SynchronizationService:
                     sync_depth_pose_file_path = os.path.join(synchronized_depth_parent_directory, depth_ahat_pkl)
                     self.create_synchronized_stream_pkl_data(depth_pose_file_path, sync_depth_pose_file_path)
 
+                    depth_container_path = get_frame_container_path(
+                        depth_parent_directory, self.recording.id, ppc_const.DEPTH_AHAT, ppc_const.DEPTH
+                    )
+                    if os.path.exists(depth_container_path):
+                        # 2. Synchronize Depth data and 3. Synchronize Active Brightness data from frame containers
+                        for frame_kind in [ppc_const.DEPTH, ppc_const.AB]:
+                            container_reader = self.create_synchronized_frame_container(
+                                get_frame_container_path(
+                                    depth_parent_directory, self.recording.id, ppc_const.DEPTH_AHAT, frame_kind
+                                ),
+                                get_frame_container_path(
+                                    synchronized_depth_parent_directory, self.recording.id, ppc_const.DEPTH_AHAT,
+                                    frame_kind
+                                )
+                            )
+                        self.depth_width, self.depth_height = container_reader.width, container_reader.height
+                        meta_yaml_data["depth_mode"] = ppc_const.AHAT
+                        meta_yaml_data["depth_width"] = self.depth_width
+                        meta_yaml_data["depth_height"] = self.depth_height
+                        continue
+
                     # 2. Synchronize Depth data
                     # ToDo: change it to DEPTH variables
                     depth_data_directory = os.path.join(depth_parent_directory, ppc_const.DEPTH)
@@ -266,6 +315,38 @@ class SynchronizationService:
                 else:
                     logger.log(logging.ERROR, f"Cannot synchronize {stream_name} data with PV as base stream")
                     continue
+        elif self.base_stream == ppc_const.DEPTH_AHAT and os.path.exists(get_frame_container_path(
+                self.base_stream_directory, self.recording.id, ppc_const.DEPTH_AHAT, ppc_const.DEPTH
+        )):
+            # 1. Create base stream keys from the index of the depth frame container
+            depth_container_reader = FrameContainerReader(get_frame_container_path(
+                self.base_stream_directory, self.recording.id, ppc_const.DEPTH_AHAT, ppc_const.DEPTH
+            ))
+            self.base_stream_keys = depth_container_reader.get_sorted_keys()
+            self.num_of_frames = len(self.base_stream_keys)
+            meta_yaml_data["num_of_frames"] = self.num_of_frames
+
+            # 2. Copy the depth and ab frames into synchronized containers, in the order of the base stream keys
+            create_directories(self.synchronized_base_stream_directory)
+            for frame_kind in [ppc_const.DEPTH, ppc_const.AB]:
+                container_reader = self.create_synchronized_frame_container(
+                    get_frame_container_path(
+                        self.base_stream_directory, self.recording.id, ppc_const.DEPTH_AHAT, frame_kind
+                    ),
+                    get_frame_container_path(
+                        self.synchronized_base_stream_directory, self.recording.id, ppc_const.DEPTH_AHAT, frame_kind
+                    )
+                )
+            self.depth_width, self.depth_height = container_reader.width, container_reader.height
+            meta_yaml_data["depth_mode"] = ppc_const.AHAT
+            meta_yaml_data["depth_width"] = self.depth_width
+            meta_yaml_data["depth_height"] = self.depth_height
+
+            # Synchronize Depth Pose
+            depth_ahat_pose_pkl = f'{self.recording.id}_depth_ahat_pose.pkl'
+            depth_ahat_pose_file_path = os.path.join(self.base_stream_directory, depth_ahat_pose_pkl)
+            sync_depth_ahat_pose_file_path = os.path.join(self.synchronized_base_stream_directory, depth_ahat_pose_pkl)
+            self.create_synchronized_stream_pkl_data(depth_ahat_pose_file_path, sync_depth_ahat_pose_file_path)
         elif self.base_stream == ppc_const.DEPTH_AHAT:
             # 1. Create base stream keys used to synchronize the rest of the data
             base_stream_frames_dir = os.path.join(self.base_stream_directory, "depth")
@@ -92,6 +92,7 @@ class BoxService:
 		for file_name in os.listdir(folder_path):
 			if not file_name.endswith(".zip") \
 					and not file_name.endswith(".pkl") \
+					and not file_name.endswith(".rec") \
 					and not file_name.endswith(".MP4") \
 					and not file_name.endswith(".mp4"):
 				logger.info(f"[{recording_id}] Skipping file: {file_name}")
@@ -0,0 +1,139 @@
+import json
+import time
+
+from ..utils.constants import Hololens_Constants as const
+from ..utils.logger_config import get_logger
+
+logger = get_logger(__name__)
+
+
+def get_stream_queue_name(recording_id, stream_name):
+	# Queues are named per recording, so that the backlog of a recording being drained is never mixed with the
+	# packets of the next recording
+	return f'{recording_id}:{stream_name}'
+
+
+def get_drain_progress_key(recording_id):
+	return f'{const.REDIS_DRAIN_PROGRESS_KEY_PREFIX}{recording_id}'
+
+
+class StreamDrainProgress:
+
+	def __init__(self, stream_name, remaining_packet_count):
+		self.stream_name = stream_name
+		self.start_time = time.time()
+		self.initial_remaining_packet_count = remaining_packet_count
+		self.remaining_packet_count = remaining_packet_count
+		self.processed_packet_count = 0
+		self.is_done = False
+
+	def update(self, remaining_packet_count, processed_packet_count, is_done):
+		self.remaining_packet_count = remaining_packet_count
+		self.processed_packet_count = processed_packet_count
+		self.is_done = is_done
+
+	def get_rate(self):
+		elapsed_time = time.time() - self.start_time
+		return (self.processed_packet_count / elapsed_time) if elapsed_time > 0 else 0.0
+
+	def get_eta(self):
+		if self.is_done:
+			return 0.0
+		rate = self.get_rate()
+		return (self.remaining_packet_count / rate) if rate > 0 else None
+
+	def to_dict(self):
+		eta = self.get_eta()
+		return {
+			"remaining_packets": self.remaining_packet_count,
+			"processed_packets": self.processed_packet_count,
+			"packets_per_second": round(self.get_rate(), 2),
+			"eta_seconds": None if eta is None else round(eta, 1),
+			"is_done": self.is_done,
+		}
+
+
+class CaptureDrainProgress:
+	# Progress of the drain of a recording after capture stopped
+	# Recordings run in their own process, so the progress is published to redis for the flask server to read
+
+	def __init__(self, redis_client, recording_id):
+		self.redis_client = redis_client
+		self.recording_id = recording_id
+		self.start_time = time.time()
+		self.stream_progress = {}
+		self.last_report_time = 0.0
+
+	def start_stream(self, stream_name, remaining_packet_count):
+		self.stream_progress[stream_name] = StreamDrainProgress(stream_name, remaining_packet_count)
+
+	def update_stream(self, stream_name, remaining_packet_count, processed_packet_count, is_done):
+		self.stream_progress[stream_name].update(remaining_packet_count, processed_packet_count, is_done)
+
+	def is_done(self):
+		return all(stream_progress.is_done for stream_progress in self.stream_progress.values())
+
+	def get_eta(self):
+		stream_etas = [stream_progress.get_eta() for stream_progress in self.stream_progress.values()]
+		if any(stream_eta is None for stream_eta in stream_etas):
+			return None
+		return max(stream_etas, default=0.0)
+
+	def to_dict(self):
+		eta = self.get_eta()
+		return {
+			"recording_id": self.recording_id,
+			"elapsed_seconds": round(time.time() - self.start_time, 1),
+			"remaining_packets": sum(
+				stream_progress.remaining_packet_count for stream_progress in self.stream_progress.values()
+			),
+			"eta_seconds": None if eta is None else round(eta, 1),
+			"is_done": self.is_done(),
+			"streams": {
+				stream_name: stream_progress.to_dict() for stream_name, stream_progress in self.stream_progress.items()
+			},
+		}
+
+	def publish(self):
+		# The key expires unless it is refreshed, so a drain that died does not look like it is still running
+		progress = self.to_dict()
+		expire_time = const.REDIS_DRAIN_PROGRESS_DONE_EXPIRE_TIME if progress["is_done"] \
+			else const.REDIS_DRAIN_PROGRESS_EXPIRE_TIME
+		try:
+			self.redis_client.set(get_drain_progress_key(self.recording_id), json.dumps(progress), ex=expire_time)
+		except Exception as e:
+			logger.error(f"Could not publish drain progress of {self.recording_id}: {e}")
+
+	def report(self):
+		self.last_report_time = time.time()
+		progress = self.to_dict()
+		eta = "unknown" if progress["eta_seconds"] is None else f'{progress["eta_seconds"]:.0f}s'
+		logger.info(
+			f"[{self.recording_id}] Drain progress: {progress['remaining_packets']} packets remaining, ETA {eta}, "
+			+ ", ".join(
+				f"{stream_name} {stream_progress['remaining_packets']} remaining "
+				f"at {stream_progress['packets_per_second']}/s"
+				for stream_name, stream_progress in progress["streams"].items()
+			)
+		)
+
+	def is_report_due(self):
+		return (time.time() - self.last_report_time) >= const.DRAIN_PROGRESS_REPORT_PERIOD
+
+
+def fetch_capture_drain_progress(redis_client, recording_id=None):
+	if recording_id is not None:
+		progress = redis_client.get(get_drain_progress_key(recording_id))
+		return None if progress is None else json.loads(progress)
+	return [
+		json.loads(progress)
+		for progress in (
+			redis_client.get(progress_key)
+			for progress_key in redis_client.scan_iter(match=f'{const.REDIS_DRAIN_PROGRESS_KEY_PREFIX}*')
+		)
+		if progress is not None
+	]
+
+
+def is_capture_draining(redis_client):
+	return any(not progress["is_done"] for progress in fetch_capture_drain_progress(redis_client))
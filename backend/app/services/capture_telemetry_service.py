@@ -0,0 +1,218 @@
+import json
+import threading
+import time
+
+import redis
+
+from ..hololens import hl2ss, hl2ss_utilities
+from ..utils.constants import Hololens_Constants as const
+from ..utils.logger_config import get_logger
+
+logger = get_logger(__name__)
+
+
+def get_telemetry_key(recording_id):
+	return f'{const.REDIS_TELEMETRY_KEY_PREFIX}{recording_id}'
+
+
+class ReceiveCounter:
+	# Written only by the Producer thread of the stream, so the counters need no lock
+
+	def __init__(self, stream_period):
+		self.packet_count = 0
+		self.byte_count = 0
+		self.queue_depth = 0
+		self.gap_count = 0
+		self.max_gap = 0
+		self.last_timestamp = None
+		self._continuity_analyzer = hl2ss_utilities.continuity_analyzer(stream_period) if stream_period else None
+
+	def update(self, timestamp, packet_size):
+		self.packet_count += 1
+		self.byte_count += packet_size
+		self.last_timestamp = timestamp
+		if self._continuity_analyzer is not None:
+			status, delta = self._continuity_analyzer.push(timestamp)
+			if status == 1:
+				self.gap_count += 1
+				self.max_gap = max(self.max_gap, delta)
+
+
+class WriteCounter:
+	# Written only by the Consumer worker it was registered for
+
+	def __init__(self):
+		self.packet_count = 0
+		self.byte_count = 0
+
+	def update(self, packet_count, byte_count):
+		self.packet_count += packet_count
+		self.byte_count += byte_count
+
+
+class StreamTelemetry:
+
+	def __init__(self, stream_name):
+		self.stream_name = stream_name
+		stream_fps = const.TELEMETRY_STREAM_FPS.get(stream_name)
+		stream_period = (hl2ss.TimeBase.HUNDREDS_OF_NANOSECONDS / stream_fps) if stream_fps else None
+		self.receive_counter = ReceiveCounter(stream_period)
+		self.write_counters = []
+		self._last_sample = {
+			"time": time.perf_counter(), "received_packets": 0, "received_bytes": 0,
+			"written_packets": 0, "written_bytes": 0, "queue_depth": 0,
+		}
+
+	def register_writer(self):
+		write_counter = WriteCounter()
+		# Appending to a list is atomic, the reporter iterates over a copy
+		self.write_counters.append(write_counter)
+		return write_counter
+
+	def sample(self):
+		# Rates are computed over the period since the previous sample, only the reporter thread samples
+		now = time.perf_counter()
+		write_counters = list(self.write_counters)
+		sample = {
+			"time": now,
+			"received_packets": self.receive_counter.packet_count,
+			"received_bytes": self.receive_counter.byte_count,
+			"written_packets": sum(write_counter.packet_count for write_counter in write_counters),
+			"written_bytes": sum(write_counter.byte_count for write_counter in write_counters),
+			"queue_depth": self.receive_counter.queue_depth,
+		}
+		last_sample = self._last_sample
+		self._last_sample = sample
+		elapsed_time = max(now - last_sample["time"], 1e-6)
+
+		receive_fps = (sample["received_packets"] - last_sample["received_packets"]) / elapsed_time
+		write_fps = (sample["written_packets"] - last_sample["written_packets"]) / elapsed_time
+		return {
+			"receive_fps": round(receive_fps, 2),
+			"write_fps": round(write_fps, 2),
+			"receive_bytes_per_second": round((sample["received_bytes"] - last_sample["received_bytes"]) / elapsed_time),
+			"write_bytes_per_second": round((sample["written_bytes"] - last_sample["written_bytes"]) / elapsed_time),
+			"queue_depth": sample["queue_depth"],
+			"received_packets": sample["received_packets"],
+			"written_packets": sample["written_packets"],
+			"gap_count": self.receive_counter.gap_count,
+			"max_gap_ms": self.receive_counter.max_gap / 10000,
+			"last_timestamp": self.receive_counter.last_timestamp,
+			# The queue keeps growing when the Consumer does not write as fast as packets are received
+			"is_falling_behind": (sample["queue_depth"] > last_sample["queue_depth"]) and
+								 (sample["queue_depth"] >= const.TELEMETRY_FALLING_BEHIND_QUEUE_DEPTH) and
+								 (write_fps < receive_fps),
+		}
+
+
+class CaptureTelemetry:
+	# Per-stream counters of a recording, updated by the Producer and Consumer threads
+	# Recordings run in their own process, so a reporter thread publishes them to redis for the flask server
+
+	def __init__(self, recording_id, redis_pool=None):
+		self.recording_id = recording_id
+		self.redis_pool = redis_pool
+		self.stream_telemetry = {}
+		self._stream_telemetry_lock = threading.Lock()
+		self._enable_reporter = False
+		self._reporter_thread = None
+
+	def get_stream_telemetry(self, stream_name):
+		# Only used when the threads of a stream start, the counters themselves are lock-free
+		with self._stream_telemetry_lock:
+			if stream_name not in self.stream_telemetry:
+				self.stream_telemetry[stream_name] = StreamTelemetry(stream_name)
+			return self.stream_telemetry[stream_name]
+
+	def get_receive_counter(self, stream_name):
+		return self.get_stream_telemetry(stream_name).receive_counter
+
+	def register_writer(self, stream_name):
+		return self.get_stream_telemetry(stream_name).register_writer()
+
+	def to_dict(self):
+		return {
+			"recording_id": self.recording_id,
+			"time": time.time(),
+			"streams": {
+				stream_name: stream_telemetry.sample()
+				for stream_name, stream_telemetry in list(self.stream_telemetry.items())
+			},
+		}
+
+	def publish(self, redis_client):
+		telemetry = self.to_dict()
+		try:
+			redis_client.set(
+				get_telemetry_key(self.recording_id), json.dumps(telemetry), ex=const.REDIS_TELEMETRY_EXPIRE_TIME
+			)
+		except Exception as e:
+			logger.error(f"Could not publish capture telemetry of {self.recording_id}: {e}")
+		return telemetry
+
+	def _report(self):
+		redis_client = redis.Redis(connection_pool=self.redis_pool)
+		while self._enable_reporter:
+			telemetry = self.publish(redis_client)
+			for stream_name, stream_telemetry in telemetry["streams"].items():
+				if stream_telemetry["is_falling_behind"]:
+					logger.warning(
+						f"[{self.recording_id}] {stream_name} is falling behind: "
+						f"receiving {stream_telemetry['receive_fps']} fps, writing {stream_telemetry['write_fps']} fps, "
+						f"queue depth {stream_telemetry['queue_depth']}"
+					)
+			time.sleep(const.TELEMETRY_PUBLISH_PERIOD)
+
+	def start_reporter(self):
+		if self.redis_pool is None:
+			return
+		self._enable_reporter = True
+		self._reporter_thread = threading.Thread(target=self._report, daemon=True)
+		self._reporter_thread.start()
+
+	def stop_reporter(self):
+		self._enable_reporter = False
+		if self._reporter_thread is not None:
+			self._reporter_thread.join()
+			self._reporter_thread = None
+
+
+def fetch_capture_telemetry(redis_client, recording_id=None):
+	if recording_id is not None:
+		telemetry = redis_client.get(get_telemetry_key(recording_id))
+		return None if telemetry is None else json.loads(telemetry)
+	return [
+		json.loads(telemetry)
+		for telemetry in (
+			redis_client.get(telemetry_key)
+			for telemetry_key in redis_client.scan_iter(match=f'{const.REDIS_TELEMETRY_KEY_PREFIX}*')
+		)
+		if telemetry is not None
+	]
+
+
+def to_prometheus_text(telemetries):
+	# Prometheus text exposition format, one sample per stream and metric
+	metrics = [
+		("receive_fps", "gauge", "Packets received from the device per second"),
+		("write_fps", "gauge", "Packets written by the Consumer per second"),
+		("receive_bytes_per_second", "gauge", "Bytes received from the device per second"),
+		("write_bytes_per_second", "gauge", "Bytes written by the Consumer per second"),
+		("queue_depth", "gauge", "Packets waiting in the redis queue"),
+		("received_packets", "counter", "Packets received from the device"),
+		("written_packets", "counter", "Packets written by the Consumer"),
+		("gap_count", "counter", "Timestamp discontinuities detected in the received packets"),
+		("is_falling_behind", "gauge", "1 when the Consumer does not keep up with the stream"),
+	]
+	lines = []
+	for metric_name, metric_type, metric_help in metrics:
+		prometheus_name = f'{const.TELEMETRY_PROMETHEUS_PREFIX}{metric_name}'
+		lines.append(f'# HELP {prometheus_name} {metric_help}')
+		lines.append(f'# TYPE {prometheus_name} {metric_type}')
+		for telemetry in telemetries:
+			for stream_name, stream_telemetry in telemetry["streams"].items():
+				lines.append(
+					f'{prometheus_name}{{recording_id="{telemetry["recording_id"]}",stream="{stream_name}"}} '
+					f'{float(stream_telemetry[metric_name])}'
+				)
+	return "\n".join(lines) + "\n"
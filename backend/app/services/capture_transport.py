@@ -0,0 +1,213 @@
+import os
+import socket
+import time
+
+import redis
+
+from ..utils.constants import Hololens_Constants as const
+from ..utils.logger_config import get_logger
+
+logger = get_logger(__name__)
+
+
+def get_dead_letter_name(queue_name):
+	return f'{const.REDIS_DEAD_LETTER_KEY_PREFIX}{queue_name}'
+
+
+def is_dead_letter_name(key):
+	return key.decode().startswith(const.REDIS_DEAD_LETTER_KEY_PREFIX)
+
+
+def create_consumer_name(stream_name, worker_index):
+	# Unique across hosts and processes so that entries of a crashed worker can be told apart and reclaimed
+	return f'{socket.gethostname()}-{os.getpid()}-{stream_name}-{worker_index}'
+
+
+class RedisListTransport:
+	# One redis list per stream, filled with LPUSH and drained with BRPOP by a single worker
+
+	def __init__(self, redis_client):
+		self.redis_client = redis_client
+
+	def create_queue(self, queue_name):
+		# A queue of the same recording marked as orphaned at startup is in use again
+		self.redis_client.persist(queue_name)
+
+	def push(self, pipeline, queue_name, packets):
+		# A single LPUSH with multiple values keeps the packets in arrival order for the BRPOP in the Consumer
+		# Its reply, the last one of the pipeline, is the depth of the queue
+		pipeline.lpush(queue_name, *packets)
+
+	def get_queue_depth(self, queue_name):
+		return self.redis_client.llen(queue_name)
+
+	def read(self, queue_name, consumer_name, timeout):
+		stream_data = self.redis_client.brpop([queue_name], timeout=timeout)
+		if stream_data is None:
+			return []
+		return [(None, stream_data[1])]
+
+	def acknowledge(self, queue_name, entry_ids):
+		pass
+
+	def reject(self, queue_name, entry_ids):
+		# Popped packets cannot be read again, the packets that failed are lost
+		logger.warning(f"Dropped {len(entry_ids)} packets of {queue_name} that failed to be processed")
+
+	def has_pending(self, queue_name):
+		return False
+
+
+class RedisStreamTransport:
+	# One redis stream per stream, filled with XADD and shared by all workers of a consumer group through XREADGROUP
+	# An entry stays pending until the worker that read it acknowledges it, entries left pending by a worker that
+	# died are claimed by the other workers once they have been idle for the reclaim time
+
+	def __init__(self, redis_client, group_name=const.REDIS_STREAM_CONSUMER_GROUP):
+		self.redis_client = redis_client
+		self.group_name = group_name
+		self.read_count = const.REDIS_STREAM_READ_COUNT
+		self.reclaim_idle_time = const.REDIS_STREAM_RECLAIM_IDLE_TIME
+		self.max_deliveries = const.REDIS_STREAM_MAX_DELIVERIES
+		self._last_reclaim_time = {}
+
+	def create_queue(self, queue_name):
+		try:
+			self.redis_client.xgroup_create(queue_name, self.group_name, id='0', mkstream=True)
+		except redis.ResponseError as error:
+			# Group was already created by the Producer or by another worker
+			if 'BUSYGROUP' not in str(error):
+				raise
+		# A queue of the same recording marked as orphaned at startup is in use again
+		self.redis_client.persist(queue_name)
+
+	def push(self, pipeline, queue_name, packets):
+		for packet in packets:
+			pipeline.xadd(queue_name, {const.REDIS_STREAM_ENTRY_FIELD: packet})
+		# Last reply of the pipeline is the depth of the queue
+		pipeline.xlen(queue_name)
+
+	def get_queue_depth(self, queue_name):
+		# Acknowledged entries are deleted, so the length counts the entries waiting or being processed
+		return self.redis_client.xlen(queue_name)
+
+	def _reclaim(self, queue_name, consumer_name):
+		last_reclaim_time = self._last_reclaim_time.get((queue_name, consumer_name))
+		if (last_reclaim_time is not None) and ((time.time() - last_reclaim_time) < self.reclaim_idle_time):
+			return []
+		self._last_reclaim_time[(queue_name, consumer_name)] = time.time()
+
+		response = self.redis_client.xautoclaim(
+			queue_name, self.group_name, consumer_name,
+			min_idle_time=int(self.reclaim_idle_time * 1000), start_id='0-0', count=self.read_count
+		)
+		stream_entries = response[1]
+		if stream_entries:
+			logger.info(f"{consumer_name} reclaimed {len(stream_entries)} unacknowledged entries from {queue_name}")
+			# More entries may be left, try again on the next read
+			self._last_reclaim_time.pop((queue_name, consumer_name))
+		return stream_entries
+
+	def read(self, queue_name, consumer_name, timeout):
+		stream_entries = self._reclaim(queue_name, consumer_name)
+		if not stream_entries:
+			response = self.redis_client.xreadgroup(
+				self.group_name, consumer_name, {queue_name: '>'},
+				count=self.read_count, block=int(timeout * 1000)
+			)
+			stream_entries = response[0][1] if response else []
+		# Entries deleted while pending are returned without fields
+		return [
+			(entry_id, entry_fields[const.REDIS_STREAM_ENTRY_FIELD.encode()])
+			for entry_id, entry_fields in stream_entries if entry_fields
+		]
+
+	def acknowledge(self, queue_name, entry_ids):
+		# Acknowledged entries are deleted as well, so that the stream does not keep every frame in memory
+		pipeline = self.redis_client.pipeline(transaction=False)
+		pipeline.xack(queue_name, self.group_name, *entry_ids)
+		pipeline.xdel(queue_name, *entry_ids)
+		pipeline.execute()
+
+	def reject(self, queue_name, entry_ids):
+		# Entries that failed stay pending and are reclaimed and processed again by a worker
+		# Once delivered max_deliveries times they are moved to the dead-letter stream of the queue and acknowledged,
+		# otherwise an entry that always fails would keep has_pending true and the workers would never finish
+		dead_entries = []
+		for entry_id in entry_ids:
+			pending_entries = self.redis_client.xpending_range(
+				queue_name, self.group_name, min=entry_id, max=entry_id, count=1
+			)
+			if pending_entries and (pending_entries[0]['times_delivered'] >= self.max_deliveries):
+				dead_entries.extend(self.redis_client.xrange(queue_name, min=entry_id, max=entry_id))
+		if len(dead_entries) < len(entry_ids):
+			logger.warning(
+				f"{len(entry_ids) - len(dead_entries)} entries of {queue_name} failed to be processed, "
+				f"leaving them pending to be retried"
+			)
+		if not dead_entries:
+			return
+		dead_letter_name = get_dead_letter_name(queue_name)
+		pipeline = self.redis_client.pipeline(transaction=False)
+		for _, entry_fields in dead_entries:
+			pipeline.xadd(dead_letter_name, entry_fields)
+		pipeline.expire(dead_letter_name, const.REDIS_DEAD_LETTER_EXPIRE_TIME)
+		pipeline.execute()
+		self.acknowledge(queue_name, [entry_id for entry_id, _ in dead_entries])
+		logger.error(
+			f"Moved {len(dead_entries)} entries of {queue_name} to {dead_letter_name} "
+			f"after {self.max_deliveries} failed deliveries"
+		)
+
+	def has_pending(self, queue_name):
+		return self.redis_client.xpending(queue_name, self.group_name)['pending'] > 0
+
+
+def create_capture_transport(redis_client, transport_name=const.CAPTURE_TRANSPORT):
+	if transport_name == const.CAPTURE_TRANSPORT_STREAM:
+		return RedisStreamTransport(redis_client)
+	return RedisListTransport(redis_client)
+
+
+def _is_orphaned_stream(redis_client, queue_name):
+	# No consumer of the group has read from the stream recently, the recording process that owned it is gone
+	consumers = [
+		consumer for group in redis_client.xinfo_groups(queue_name)
+		for consumer in redis_client.xinfo_consumers(queue_name, group['name'])
+	]
+	return all(consumer['idle'] >= const.REDIS_ORPHANED_QUEUE_IDLE_TIME * 1000 for consumer in consumers)
+
+
+def delete_finished_capture_queues(redis_client):
+	# Replaces the flush of the database at startup
+	# Acknowledged stream entries are deleted, so an empty stream has nothing pending and its recording is finished
+	# List queues are removed by redis once they are empty, so every list left is unfinished
+	# Reclaim of pending entries only happens while workers of the same recording are running, a recording whose
+	# process died is not resumed: its queues are kept with their entries and consumer group until they expire
+	# Dead-letter streams are not queues, they expire on their own
+	finished_queue_names = [
+		queue_name for queue_name in redis_client.scan_iter(_type='stream')
+		if (not is_dead_letter_name(queue_name)) and (redis_client.xlen(queue_name) == 0)
+	]
+	if finished_queue_names:
+		redis_client.delete(*finished_queue_names)
+	unfinished_queue_names = [
+		queue_name.decode() for queue_type in ('stream', 'list')
+		for queue_name in redis_client.scan_iter(_type=queue_type) if not is_dead_letter_name(queue_name)
+	]
+	if unfinished_queue_names:
+		logger.warning(f"Keeping the unfinished capture queues {', '.join(unfinished_queue_names)}")
+	# Lists cannot tell whether they are still read, an expire time is harmless for a recording still being captured
+	orphaned_queue_names = [
+		queue_name for queue_name in unfinished_queue_names
+		if (redis_client.type(queue_name) != b'stream') or _is_orphaned_stream(redis_client, queue_name)
+	]
+	for queue_name in orphaned_queue_names:
+		if redis_client.ttl(queue_name) < 0:
+			redis_client.expire(queue_name, const.REDIS_ORPHANED_QUEUE_EXPIRE_TIME)
+	if orphaned_queue_names:
+		logger.error(
+			f"Capture queues {', '.join(orphaned_queue_names)} were left by a recording process that died, "
+			f"they expire in {const.REDIS_ORPHANED_QUEUE_EXPIRE_TIME} seconds"
+		)
+	return unfinished_queue_names
@@ -0,0 +1,86 @@
+import concurrent.futures
+import multiprocessing as mp
+import threading
+
+import cv2
+import numpy as np
+
+from ..hololens import hl2ss
+from ..utils.constants import Hololens_Constants as const
+from ..utils.logger_config import get_logger
+
+logger = get_logger(__name__)
+
+
+# Encoding functions run in the worker processes of the pool, they receive the packed packet as it was
+# received from redis so that the Consumer does not have to copy the payload before sending it
+
+def encode_pv_frame(stream_data, pv_file_path):
+	stream_packet = hl2ss.unpack_packet_view(stream_data)
+	frame_nv12 = np.frombuffer(
+		stream_packet.payload, dtype=np.uint8,
+		count=int((const.PV_STRIDE * const.PV_FRAME_HEIGHT * 3) / 2)
+	).reshape((int(const.PV_FRAME_HEIGHT * 3 / 2), const.PV_STRIDE))
+	frame_bgr = cv2.cvtColor(frame_nv12[:, :const.PV_FRAME_WIDTH], cv2.COLOR_YUV2BGR_NV12)
+	cv2.imwrite(pv_file_path, frame_bgr)
+
+
+def encode_depth_ahat_frame(stream_data, ab_file_path, depth_file_path):
+	stream_packet = hl2ss.unpack_packet_view(stream_data)
+	ab_data = np.frombuffer(
+		stream_packet.payload, dtype=np.uint16,
+		offset=hl2ss.Parameters_RM_DEPTH_AHAT.PIXELS * hl2ss._SIZEOF.WORD,
+		count=hl2ss.Parameters_RM_DEPTH_AHAT.PIXELS
+	).reshape(hl2ss.Parameters_RM_DEPTH_AHAT.SHAPE)
+	cv2.imwrite(ab_file_path, ab_data)
+
+	depth_data = np.frombuffer(
+		stream_packet.payload, dtype=np.uint16, count=hl2ss.Parameters_RM_DEPTH_AHAT.PIXELS
+	).reshape(hl2ss.Parameters_RM_DEPTH_AHAT.SHAPE)
+	cv2.imwrite(depth_file_path, depth_data)
+
+
+def _initialize_encoding_worker():
+	# Every worker process encodes a single frame at a time, OpenCV threads would only compete with the other workers
+	cv2.setNumThreads(1)
+
+
+class FrameEncodingPool:
+
+	def __init__(self, num_workers=const.FRAME_ENCODING_WORKERS, max_in_flight=const.FRAME_ENCODING_MAX_IN_FLIGHT):
+		# Spawned workers do not inherit the sockets, redis connections and threads of the capture process
+		# They import the main module again as __mp_main__, flaskserver skips setting up its services for them
+		self._executor = concurrent.futures.ProcessPoolExecutor(
+			max_workers=num_workers, mp_context=mp.get_context('spawn'), initializer=_initialize_encoding_worker
+		)
+		# Submitting blocks once max_in_flight frames are queued or being encoded, so a slow pool holds the backlog
+		# in redis instead of in the memory of the capture process
+		self._in_flight = threading.BoundedSemaphore(max_in_flight)
+		# Frames are submitted by every Consumer worker thread, done callbacks run in the executor thread
+		self._count_lock = threading.Lock()
+		self.submitted_count = 0
+		self.failed_count = 0
+
+	def _on_encoded(self, future):
+		self._in_flight.release()
+		if future.exception() is not None:
+			with self._count_lock:
+				self.failed_count += 1
+			logger.error(f"Failed to encode frame: {future.exception()}")
+
+	def submit(self, encode_function, *args):
+		self._in_flight.acquire()
+		try:
+			future = self._executor.submit(encode_function, *args)
+		except BaseException:
+			self._in_flight.release()
+			raise
+		with self._count_lock:
+			self.submitted_count += 1
+		future.add_done_callback(self._on_encoded)
+		return future
+
+	def shutdown(self):
+		# Waits for every submitted frame to be written
+		self._executor.shutdown(wait=True)
+		logger.info(f"Encoded {self.submitted_count - self.failed_count} of {self.submitted_count} frames")
@@ -1,19 +1,30 @@
+import asyncio
+import collections
 import logging
 import os
 import pickle
 import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 from typing import List
 
 import numpy as np
 import redis
-import cv2
 
 from ..models.hololens_info import HololensInfo
 from ..models.recording import Recording
 from ..hololens import hl2ss
+from ..hololens import hl2ss_io
 from ..hololens.hololens_rest_api import *
+from .capture_drain_service import CaptureDrainProgress, get_stream_queue_name, is_capture_draining
+from .capture_telemetry_service import CaptureTelemetry
+from .capture_transport import create_capture_transport, create_consumer_name, delete_finished_capture_queues
+from .frame_encoding_service import FrameEncodingPool, encode_depth_ahat_frame, encode_pv_frame
+from .spatial_mapping_capture_service import SpatialMappingCapture
 from ..utils.constants import Hololens_Constants as const
+from ..utils.frame_container import FrameContainerWriter, get_frame_container_path
+from ..utils.record_file import RECORD_KIND_IMU, RECORD_KIND_POSE, RECORD_KIND_SPATIAL, RecordFileWriter
 from ..utils.logger_config import get_logger
 
 logger = get_logger(__name__)
@@ -24,6 +35,111 @@ def create_directories(dir_path):
 		os.makedirs(dir_path)
 
 
+def get_port_to_stream():
+	return {
+		hl2ss.StreamPort.RM_DEPTH_AHAT: const.DEPTH_AHAT,
+		hl2ss.StreamPort.PHOTO_VIDEO: const.PHOTOVIDEO,
+		hl2ss.StreamPort.MICROPHONE: const.MICROPHONE,
+		hl2ss.StreamPort.SPATIAL_INPUT: const.SPATIAL,
+		hl2ss.StreamPort.RM_DEPTH_LONGTHROW: const.DEPTH_LT,
+		hl2ss.StreamPort.RM_IMU_MAGNETOMETER: const.IMU_MAGNETOMETER,
+		hl2ss.StreamPort.RM_IMU_GYROSCOPE: const.IMU_GYROSCOPE,
+		hl2ss.StreamPort.RM_IMU_ACCELEROMETER: const.IMU_ACCELEROMETER,
+		hl2ss.StreamPort.RM_VLC_LEFTLEFT: const.VLC_LEFTLEFT,
+		hl2ss.StreamPort.RM_VLC_LEFTFRONT: const.VLC_LEFTFRONT,
+		hl2ss.StreamPort.RM_VLC_RIGHTRIGHT: const.VLC_RIGHTRIGHT,
+		hl2ss.StreamPort.RM_VLC_RIGHTFRONT: const.VLC_RIGHTFRONT
+	}
+
+
+def get_port_to_dir(rec_data_dir):
+	return {
+		hl2ss.StreamPort.PHOTO_VIDEO: os.path.join(rec_data_dir, const.PHOTOVIDEO),
+		hl2ss.StreamPort.MICROPHONE: os.path.join(rec_data_dir, const.MICROPHONE),
+		hl2ss.StreamPort.RM_DEPTH_AHAT: os.path.join(rec_data_dir, const.DEPTH_AHAT),
+		hl2ss.StreamPort.SPATIAL_INPUT: os.path.join(rec_data_dir, const.SPATIAL),
+		hl2ss.StreamPort.RM_IMU_ACCELEROMETER: os.path.join(rec_data_dir, const.IMU),
+		hl2ss.StreamPort.RM_IMU_GYROSCOPE: os.path.join(rec_data_dir, const.IMU),
+		hl2ss.StreamPort.RM_IMU_MAGNETOMETER: os.path.join(rec_data_dir, const.IMU),
+		hl2ss.StreamPort.RM_VLC_LEFTFRONT: os.path.join(rec_data_dir, const.VLC_LEFTFRONT),
+		hl2ss.StreamPort.RM_VLC_LEFTLEFT: os.path.join(rec_data_dir, const.VLC_LEFTLEFT),
+		hl2ss.StreamPort.RM_VLC_RIGHTFRONT: os.path.join(rec_data_dir, const.VLC_RIGHTFRONT),
+		hl2ss.StreamPort.RM_VLC_RIGHTRIGHT: os.path.join(rec_data_dir, const.VLC_RIGHTRIGHT),
+		hl2ss.StreamPort.RM_DEPTH_LONGTHROW: os.path.join(rec_data_dir, const.DEPTH_LT),
+	}
+
+
+def create_stream_directories(port_to_dir, active_streams):
+	for port in active_streams:
+		create_directories(port_to_dir[port])
+		if ((port == hl2ss.StreamPort.RM_DEPTH_AHAT) and (const.DEPTH_AHAT_STORAGE == const.DEPTH_AHAT_STORAGE_PNG)) or \
+				(port == hl2ss.StreamPort.RM_DEPTH_LONGTHROW):
+			create_directories(os.path.join(port_to_dir[port], const.AB))
+			create_directories(os.path.join(port_to_dir[port], const.DEPTH))
+		if port == hl2ss.StreamPort.PHOTO_VIDEO:
+			create_directories(os.path.join(port_to_dir[port], const.FRAMES))
+
+
+def get_raw_capture_file_path(stream_directory, recording_id, stream_name):
+	return os.path.join(stream_directory, f'{recording_id}_{stream_name}{const.RAW_CAPTURE_EXTENSION}')
+
+
+# Currently we capture data from streams from only PHOTO VIDEO, DEPTH AHAT, SPATIAL INPUT, MICROPHONE
+# If the RAW images takes a lot of time to transfer
+# 1. Change the resolution of video frames and check
+# 2. Else use encoded format for frames
+# 3. Else move to REST-API approach
+def create_stream_client(device_ip, stream_port, is_async=False):
+	# The asyncio receivers take the same parameters, their methods are awaited
+	if is_async:
+		rx_pv, rx_rm_depth_ahat, rx_microphone, rx_si, rx_rm_imu = (
+			hl2ss.rx_async_pv, hl2ss.rx_async_rm_depth_ahat, hl2ss.rx_async_microphone,
+			hl2ss.rx_async_si, hl2ss.rx_async_rm_imu
+		)
+	else:
+		rx_pv, rx_rm_depth_ahat, rx_microphone, rx_si, rx_rm_imu = (
+			hl2ss.rx_pv, hl2ss.rx_rm_depth_ahat, hl2ss.rx_microphone, hl2ss.rx_si, hl2ss.rx_rm_imu
+		)
+	
+	stream_client = None
+	if stream_port == hl2ss.StreamPort.PHOTO_VIDEO:
+		if const.PV_CAPTURE_FORMAT == const.PV_CAPTURE_FORMAT_ENCODED:
+			pv_profile, pv_bitrate = const.PV_VIDEO_PROFILE_ENCODED, const.PV_VIDEO_BITRATE_ENCODED
+		else:
+			pv_profile, pv_bitrate = const.PV_VIDEO_PROFILE_RAW, const.PV_VIDEO_BITRATE_RAW
+		stream_client = rx_pv(
+			device_ip, stream_port, hl2ss.ChunkSize.PHOTO_VIDEO, hl2ss.StreamMode.MODE_1,
+			const.PV_FRAME_WIDTH, const.PV_FRAME_HEIGHT,
+			const.PV_FRAMERATE, pv_profile, pv_bitrate
+		)
+	elif stream_port == hl2ss.StreamPort.RM_DEPTH_AHAT:
+		stream_client = rx_rm_depth_ahat(
+			device_ip, stream_port, hl2ss.ChunkSize.RM_DEPTH_AHAT, hl2ss.StreamMode.MODE_1,
+			const.AHAT_PROFILE_RAW, const.AHAT_BITRATE_RAW
+		)
+	elif stream_port == hl2ss.StreamPort.MICROPHONE:
+		stream_client = rx_microphone(
+			device_ip, stream_port, hl2ss.ChunkSize.MICROPHONE, const.AUDIO_PROFILE_DECODED
+		)
+	elif stream_port == hl2ss.StreamPort.SPATIAL_INPUT:
+		stream_client = rx_si(
+			device_ip, stream_port, hl2ss.ChunkSize.SPATIAL_INPUT
+		)
+	elif stream_port == hl2ss.StreamPort.RM_IMU_ACCELEROMETER:
+		stream_client = rx_rm_imu(
+			device_ip, stream_port, hl2ss.ChunkSize.RM_IMU_ACCELEROMETER, hl2ss.StreamMode.MODE_1
+		)
+	elif stream_port == hl2ss.StreamPort.RM_IMU_GYROSCOPE:
+		stream_client = rx_rm_imu(
+			device_ip, stream_port, hl2ss.ChunkSize.RM_IMU_GYROSCOPE, hl2ss.StreamMode.MODE_1
+		)
+	elif stream_port == hl2ss.StreamPort.RM_IMU_MAGNETOMETER:
+		stream_client = rx_rm_imu(
+			device_ip, stream_port, hl2ss.ChunkSize.RM_IMU_MAGNETOMETER, hl2ss.StreamMode.MODE_1
+		)
+	return stream_client
+
+
 class StreamProcessor:
 	
 	def __init__(self, redis_pool, recording, port_to_stream, active_streams):
@@ -49,60 +165,277 @@ class StreamProcessor:
 			stream_thread.join()
 
 
+class StreamPushStatistics:
+	
+	def __init__(self, stream_name):
+		self.stream_name = stream_name
+		self.batch_count = 0
+		self.packet_count = 0
+		self.last_batch_size = 0
+		self.max_batch_size = 0
+		# Batch latency is the time between the arrival of the oldest packet of a batch and its acknowledgement by redis
+		self.total_batch_latency = 0.0
+		self.max_batch_latency = 0.0
+		# Push time is the duration of the redis round trip alone
+		self.total_push_time = 0.0
+		self.queue_depth = 0
+		self.max_queue_depth = 0
+		self.is_spilling = False
+		self.spill_segment_count = 0
+		self.spilled_packet_count = 0
+		self.spilled_bytes = 0
+		self._last_report_time = time.perf_counter()
+	
+	def update(self, batch_size, batch_latency, push_time):
+		self.batch_count += 1
+		self.packet_count += batch_size
+		self.last_batch_size = batch_size
+		self.max_batch_size = max(self.max_batch_size, batch_size)
+		self.total_batch_latency += batch_latency
+		self.max_batch_latency = max(self.max_batch_latency, batch_latency)
+		self.total_push_time += push_time
+	
+	def update_queue_depth(self, queue_depth):
+		self.queue_depth = queue_depth
+		self.max_queue_depth = max(self.max_queue_depth, queue_depth)
+	
+	def update_spill(self, packet_count, spilled_bytes):
+		self.spilled_packet_count += packet_count
+		self.spilled_bytes += spilled_bytes
+	
+	def is_report_due(self):
+		return (time.perf_counter() - self._last_report_time) >= const.REDIS_PUSH_STATISTICS_REPORT_PERIOD
+	
+	def report(self):
+		self._last_report_time = time.perf_counter()
+		statistics = self.to_dict()
+		logger.info(
+			f"{self.stream_name} Producer pushed {statistics['packet_count']} packets in {statistics['batch_count']} batches, "
+			f"mean batch size {statistics['mean_batch_size']:.2f}, "
+			f"mean batch latency {statistics['mean_batch_latency_ms']:.2f} ms, "
+			f"max batch latency {statistics['max_batch_latency_ms']:.2f} ms, "
+			f"mean push time {statistics['mean_push_time_ms']:.2f} ms, "
+			f"queue depth {statistics['queue_depth']} (max {statistics['max_queue_depth']}), "
+			f"spilled {statistics['spilled_packet_count']} packets ({statistics['spilled_bytes']} bytes) "
+			f"in {statistics['spill_segment_count']} segments"
+		)
+	
+	def to_dict(self):
+		batch_count = max(self.batch_count, 1)
+		return {
+			"batch_count": self.batch_count,
+			"packet_count": self.packet_count,
+			"last_batch_size": self.last_batch_size,
+			"max_batch_size": self.max_batch_size,
+			"mean_batch_size": self.packet_count / batch_count,
+			"mean_batch_latency_ms": 1000 * self.total_batch_latency / batch_count,
+			"max_batch_latency_ms": 1000 * self.max_batch_latency,
+			"mean_push_time_ms": 1000 * self.total_push_time / batch_count,
+			"queue_depth": self.queue_depth,
+			"max_queue_depth": self.max_queue_depth,
+			"is_spilling": self.is_spilling,
+			"spill_segment_count": self.spill_segment_count,
+			"spilled_packet_count": self.spilled_packet_count,
+			"spilled_bytes": self.spilled_bytes,
+		}
+
+
+def get_spill_segment_path(spill_directory, stream_name, segment_index):
+	return os.path.join(spill_directory, f'{stream_name}_{segment_index:05d}{const.SPILL_SEGMENT_EXTENSION}')
+
+
+def get_spill_segment_paths(spill_directory, stream_name):
+	# Closed segments of a stream, oldest first
+	if not os.path.exists(spill_directory):
+		return []
+	return sorted(
+		os.path.join(spill_directory, file_name) for file_name in os.listdir(spill_directory)
+		if file_name.startswith(f'{stream_name}_') and file_name.endswith(const.SPILL_SEGMENT_EXTENSION)
+	)
+
+
+class StreamSpill:
+	# Append-only hl2ss_io file of the packets of a stream that did not fit in redis
+	# A segment is written under a temporary name and renamed once closed, so the Consumer only reads complete files
+	
+	def __init__(self, spill_directory, stream_name, stream_client, user):
+		self.spill_directory = spill_directory
+		self.stream_name = stream_name
+		self.stream_client = stream_client
+		self.user = user
+		self.segment_index = 0
+		self._segment_path = None
+		self._writer = None
+	
+	def is_open(self):
+		return self._writer is not None
+	
+	def open(self):
+		create_directories(self.spill_directory)
+		self._segment_path = get_spill_segment_path(self.spill_directory, self.stream_name, self.segment_index)
+		self._writer = hl2ss_io.create_wr_from_rx(
+			self._segment_path + const.SPILL_SEGMENT_PART_EXTENSION, self.stream_client, self.user, index=False
+		)
+		self._writer.open()
+	
+	def write(self, stream_packet):
+		self._writer.write(stream_packet)
+	
+	def close(self):
+		self._writer.close()
+		self._writer = None
+		os.rename(self._segment_path + const.SPILL_SEGMENT_PART_EXTENSION, self._segment_path)
+		self.segment_index += 1
+
+
+class StreamPushState:
+	# Redis queue, pending batch and spill of a stream pushed by the Producer
+	
+	def __init__(
+			self, stream_queue_name, stream_transport, stream_pipeline, push_statistics, receive_counter,
+			stream_spill, batch_max_packets, high_watermark, low_watermark
+	):
+		self.stream_queue_name = stream_queue_name
+		self.stream_transport = stream_transport
+		self.stream_pipeline = stream_pipeline
+		self.push_statistics = push_statistics
+		self.receive_counter = receive_counter
+		self.stream_spill = stream_spill
+		self.batch_max_packets = batch_max_packets
+		self.high_watermark = high_watermark
+		self.low_watermark = low_watermark
+		self.stream_batch = []
+		self.batch_start_time = None
+		# Held by the receiving thread and by the flush thread of the Producer
+		self.lock = threading.Lock()
+		# asyncio Producer only, batches are flushed one at a time and in order by a single thread per stream
+		self.flush_executor = None
+		self.pending_flush = None
+
+
 class Producer(StreamProcessor):
 	
-	def __init__(self, redis_pool, recording, port_to_stream, active_streams):
+	def __init__(self, redis_pool, recording, port_to_stream, active_streams, spill_dir, telemetry=None):
 		super().__init__(redis_pool, recording, port_to_stream, active_streams)
 		self.redis_pool = redis_pool
 		self.recording = recording
 		
 		self.port_to_stream = port_to_stream
 		self.active_streams = active_streams
+		self.spill_dir = spill_dir
+		self.telemetry = telemetry if (telemetry is not None) else CaptureTelemetry(recording.get_recording_id())
 		
 		self.enable_streams = True
 		self.stream_threads = []
 		
 		self.device_ip = self.recording.recording_info.hololens_info.device_ip
+		
+		self.enable_push_batching = const.REDIS_PUSH_BATCHING
+		self.push_batch_max_delay = const.REDIS_PUSH_BATCH_MAX_DELAY
+		self.push_statistics = {}
+		self.push_states = {}
+	
+	def _fetch_push_batch_max_packets(self, stream_port):
+		if not self.enable_push_batching:
+			return 1
+		return const.REDIS_PUSH_BATCH_MAX_PACKETS.get(
+			self.port_to_stream[stream_port], const.REDIS_PUSH_BATCH_DEFAULT_MAX_PACKETS
+		)
+	
+	def _fetch_queue_watermarks(self, stream_port):
+		stream_name = self.port_to_stream[stream_port]
+		return (
+			const.REDIS_QUEUE_HIGH_WATERMARK.get(stream_name, const.REDIS_QUEUE_DEFAULT_HIGH_WATERMARK),
+			const.REDIS_QUEUE_LOW_WATERMARK.get(stream_name, const.REDIS_QUEUE_DEFAULT_LOW_WATERMARK)
+		)
+	
+	def get_push_statistics(self):
+		return {stream_name: statistics.to_dict() for stream_name, statistics in self.push_statistics.items()}
+	
+	def get_spilled_packet_count(self):
+		return {stream_name: statistics.spilled_packet_count for stream_name, statistics in self.push_statistics.items()}
 	
-	# Currently we capture data from streams from only PHOTO VIDEO, DEPTH AHAT, SPATIAL INPUT, MICROPHONE
-	# If the RAW images takes a lot of time to transfer
-	# 1. Change the resolution of video frames and check
-	# 2. Else use encoded format for frames
-	# 3. Else move to REST-API approach
 	def _fetch_stream_client(self, stream_port):
-		stream_client = None
-		if stream_port == hl2ss.StreamPort.PHOTO_VIDEO:
-			stream_client = hl2ss.rx_pv(
-				self.device_ip, stream_port, hl2ss.ChunkSize.PHOTO_VIDEO, hl2ss.StreamMode.MODE_1,
-				const.PV_FRAME_WIDTH, const.PV_FRAME_HEIGHT,
-				const.PV_FRAMERATE, const.PV_VIDEO_PROFILE_RAW, const.PV_VIDEO_BITRATE_RAW
-			)
-		elif stream_port == hl2ss.StreamPort.RM_DEPTH_AHAT:
-			stream_client = hl2ss.rx_rm_depth_ahat(
-				self.device_ip, stream_port, hl2ss.ChunkSize.RM_DEPTH_AHAT, hl2ss.StreamMode.MODE_1,
-				const.AHAT_PROFILE_RAW, const.AHAT_BITRATE_RAW
-			)
-		elif stream_port == hl2ss.StreamPort.MICROPHONE:
-			stream_client = hl2ss.rx_microphone(
-				self.device_ip, stream_port, hl2ss.ChunkSize.MICROPHONE, const.AUDIO_PROFILE_DECODED
-			)
-		elif stream_port == hl2ss.StreamPort.SPATIAL_INPUT:
-			stream_client = hl2ss.rx_si(
-				self.device_ip, stream_port, hl2ss.ChunkSize.SPATIAL_INPUT
-			)
-		elif stream_port == hl2ss.StreamPort.RM_IMU_ACCELEROMETER:
-			stream_client = hl2ss.rx_rm_imu(
-				self.device_ip, stream_port, hl2ss.ChunkSize.RM_IMU_ACCELEROMETER, hl2ss.StreamMode.MODE_1
-			)
-		elif stream_port == hl2ss.StreamPort.RM_IMU_GYROSCOPE:
-			stream_client = hl2ss.rx_rm_imu(
-				self.device_ip, stream_port, hl2ss.ChunkSize.RM_IMU_GYROSCOPE, hl2ss.StreamMode.MODE_1
-			)
-		elif stream_port == hl2ss.StreamPort.RM_IMU_MAGNETOMETER:
-			stream_client = hl2ss.rx_rm_imu(
-				self.device_ip, stream_port, hl2ss.ChunkSize.RM_IMU_MAGNETOMETER, hl2ss.StreamMode.MODE_1
-			)
-		return stream_client
+		return create_stream_client(self.device_ip, stream_port)
+	
+	def _open_stream_push(self, stream_port, stream_client):
+		# Create a redis client and push the stream data to the queue named stream_port continuously
+		stream_redis_client = redis.Redis(connection_pool=self.redis_pool)
+		
+		stream_name = self.port_to_stream[stream_port]
+		stream_queue_name = get_stream_queue_name(self.recording.get_recording_id(), stream_name)
+		stream_transport = create_capture_transport(stream_redis_client)
+		stream_transport.create_queue(stream_queue_name)
+		
+		push_statistics = StreamPushStatistics(stream_name)
+		self.push_statistics[stream_name] = push_statistics
+		
+		high_watermark, low_watermark = self._fetch_queue_watermarks(stream_port)
+		push_state = StreamPushState(
+			stream_queue_name=stream_queue_name,
+			stream_transport=stream_transport,
+			stream_pipeline=stream_redis_client.pipeline(transaction=False),
+			push_statistics=push_statistics,
+			receive_counter=self.telemetry.get_receive_counter(stream_name),
+			stream_spill=StreamSpill(
+				self.spill_dir, stream_name, stream_client, self.recording.get_recording_id().encode()
+			),
+			batch_max_packets=self._fetch_push_batch_max_packets(stream_port),
+			high_watermark=high_watermark,
+			low_watermark=low_watermark
+		)
+		self.push_states[stream_name] = push_state
+		return push_state
+	
+	def _push_stream_data(self, push_state, stream_data):
+		# Packet views reference the received frame, redis sends them without an extra copy
+		push_state.receive_counter.update(stream_data.timestamp, len(stream_data.frame))
+		with push_state.lock:
+			if not push_state.stream_batch:
+				push_state.batch_start_time = time.perf_counter()
+			push_state.stream_batch.append(stream_data)
+			
+			if (len(push_state.stream_batch) >= push_state.batch_max_packets) or self._is_batch_due(push_state):
+				self._flush_push_state(push_state)
+	
+	def _is_batch_due(self, push_state):
+		return bool(push_state.stream_batch) and \
+			((time.perf_counter() - push_state.batch_start_time) >= self.push_batch_max_delay)
+	
+	def _flush_due_batches(self):
+		# A stream that stops receiving would otherwise keep its partial batch until its next packet
+		while self.enable_streams:
+			time.sleep(self.push_batch_max_delay)
+			for push_state in list(self.push_states.values()):
+				with push_state.lock:
+					if self._is_batch_due(push_state):
+						self._flush_push_state(push_state)
+	
+	def _flush_push_state(self, push_state):
+		self._flush_batch(push_state, *self._take_batch(push_state))
+	
+	@staticmethod
+	def _take_batch(push_state):
+		stream_batch, batch_start_time = push_state.stream_batch, push_state.batch_start_time
+		push_state.stream_batch = []
+		return stream_batch, batch_start_time
+	
+	def _flush_batch(self, push_state, stream_batch, batch_start_time):
+		self._flush_stream_batch(
+			push_state.stream_transport, push_state.stream_pipeline, push_state.stream_queue_name,
+			stream_batch, batch_start_time, push_state.push_statistics,
+			push_state.stream_spill, push_state.high_watermark, push_state.low_watermark
+		)
+		push_state.receive_counter.queue_depth = push_state.push_statistics.queue_depth
+	
+	def _close_stream_push(self, push_state):
+		with push_state.lock:
+			if push_state.stream_batch:
+				self._flush_push_state(push_state)
+		if push_state.stream_spill.is_open():
+			push_state.stream_spill.close()
+			push_state.push_statistics.is_spilling = False
+		push_state.push_statistics.report()
 	
 	def _process_stream(self, stream_port):
 		logger.info(f"Configuring {self.port_to_stream[stream_port]} Producer for recording {self.recording.__str__()}")
@@ -117,30 +450,186 @@ class Producer(StreamProcessor):
 		
 		logger.info(f"Created stream client for {self.port_to_stream[stream_port]}")
 		
-		# Create a redis client and push the stream data to the queue named stream_port continuously
-		stream_redis_client = redis.Redis(connection_pool=self.redis_pool)
-		
-		stream_queue_name = self.port_to_stream[stream_port]
-		
+		push_state = self._open_stream_push(stream_port, stream_client)
 		while self.enable_streams:
-			stream_data = stream_client.get_next_packet()
-			stream_redis_client.lpush(stream_queue_name, bytes(hl2ss.pack_packet(stream_data)))
+			self._push_stream_data(push_state, stream_client.get_next_packet_view())
+		self._close_stream_push(push_state)
 		
 		logger.info(f"Closing stream client for {self.port_to_stream[stream_port]}")
 		stream_client.close()
+	
+	async def _process_stream_async(self, stream_port):
+		logger.info(f"Configuring {self.port_to_stream[stream_port]} asyncio Producer for recording {self.recording.__str__()}")
+		
+		stream_client = create_stream_client(self.device_ip, stream_port, is_async=True)
+		
+		if stream_client is None:
+			logger.info(f'Stream client is not configured for stream {self.port_to_stream[stream_port]}')
+			return
+		
+		await stream_client.open()
+		
+		logger.info(f"Created asyncio stream client for {self.port_to_stream[stream_port]}")
+		
+		# Batches are filled on the event loop, redis round trips and spill writes run in the flush thread of the stream
+		push_state = self._open_stream_push(stream_port, stream_client)
+		push_state.flush_executor = ThreadPoolExecutor(max_workers=1)
+		try:
+			while self.enable_streams:
+				await self._push_stream_data_async(push_state, await stream_client.get_next_packet_view())
+		finally:
+			# The packets received before an error are still pushed
+			await self._close_stream_push_async(push_state)
+			logger.info(f"Closing asyncio stream client for {self.port_to_stream[stream_port]}")
+			await stream_client.close()
+	
+	async def _push_stream_data_async(self, push_state, stream_data):
+		# Batches of the asyncio Producer are only touched on the event loop, the lock of the flush thread is not needed
+		push_state.receive_counter.update(stream_data.timestamp, len(stream_data.frame))
+		if not push_state.stream_batch:
+			push_state.batch_start_time = time.perf_counter()
+		push_state.stream_batch.append(stream_data)
+		
+		if (len(push_state.stream_batch) >= push_state.batch_max_packets) or self._is_batch_due(push_state):
+			await self._flush_push_state_async(push_state)
+	
+	async def _wait_pending_flush(self, push_state):
+		while (push_state.pending_flush is not None) and (not push_state.pending_flush.done()):
+			await asyncio.wait([push_state.pending_flush])
+		if push_state.pending_flush is not None:
+			# Raises the error of the previous flush
+			push_state.pending_flush.result()
+	
+	async def _flush_push_state_async(self, push_state):
+		# A stream waits for its previous flush only, receiving of the other streams goes on meanwhile
+		await self._wait_pending_flush(push_state)
+		if not push_state.stream_batch:
+			# Already flushed by _flush_due_batches_async while waiting
+			return
+		push_state.pending_flush = asyncio.get_running_loop().run_in_executor(
+			push_state.flush_executor, self._flush_batch, push_state, *self._take_batch(push_state)
+		)
+	
+	async def _flush_due_batches_async(self):
+		# Counterpart of _flush_due_batches on the event loop, a stream whose flush is running is left to the next check
+		while self.enable_streams:
+			await asyncio.sleep(self.push_batch_max_delay)
+			for push_state in list(self.push_states.values()):
+				is_flush_running = (push_state.pending_flush is not None) and (not push_state.pending_flush.done())
+				if self._is_batch_due(push_state) and (not is_flush_running):
+					await self._flush_push_state_async(push_state)
+	
+	async def _close_stream_push_async(self, push_state):
+		try:
+			await self._flush_push_state_async(push_state)
+			await self._wait_pending_flush(push_state)
+		finally:
+			await asyncio.get_running_loop().run_in_executor(
+				push_state.flush_executor, self._close_stream_push, push_state
+			)
+			push_state.flush_executor.shutdown()
+	
+	async def _run_stream_async(self, stream_port):
+		# An error in one stream ends that stream only, the other streams keep being received
+		try:
+			await self._process_stream_async(stream_port)
+		except Exception as e:
+			logger.exception(f"asyncio Producer of {self.port_to_stream[stream_port]} failed: {e}")
+	
+	async def _process_streams_async(self):
+		stream_tasks = [self._run_stream_async(stream_port) for stream_port in self.active_streams]
+		if self.enable_push_batching:
+			stream_tasks.append(self._flush_due_batches_async())
+		await asyncio.gather(*stream_tasks, return_exceptions=True)
+	
+	def start_processing_streams(self):
+		if not const.PRODUCER_ASYNCIO:
+			super().start_processing_streams()
+			if self.enable_push_batching:
+				flush_thread = threading.Thread(target=self._flush_due_batches)
+				self.stream_threads.append(flush_thread)
+				flush_thread.start()
+		else:
+			# All the streams are received in a single thread running one event loop, due batches are flushed on it too
+			stream_thread = threading.Thread(target=asyncio.run, args=(self._process_streams_async(),))
+			self.stream_threads.append(stream_thread)
+			stream_thread.start()
+	
+	@staticmethod
+	def _flush_stream_batch(
+			stream_transport, stream_pipeline, stream_queue_name, stream_batch, batch_start_time,
+			push_statistics, stream_spill, high_watermark, low_watermark
+	):
+		if stream_spill.is_open():
+			# Packets keep going to the spill file until the Consumer has brought the queue under the low watermark
+			for stream_packet in stream_batch:
+				stream_spill.write(stream_packet)
+			push_statistics.update_spill(
+				len(stream_batch), sum(len(hl2ss.pack_packet_view(stream_packet)) for stream_packet in stream_batch)
+			)
+			queue_depth = stream_transport.get_queue_depth(stream_queue_name)
+			push_statistics.update_queue_depth(queue_depth)
+			if queue_depth <= low_watermark:
+				stream_spill.close()
+				push_statistics.is_spilling = False
+				logger.info(f"{stream_queue_name} queue depth {queue_depth} is under its low watermark, stopped spilling")
+		else:
+			push_start_time = time.perf_counter()
+			stream_transport.push(
+				stream_pipeline, stream_queue_name,
+				[hl2ss.pack_packet_view(stream_packet) for stream_packet in stream_batch]
+			)
+			queue_depth = stream_pipeline.execute()[-1]
+			push_end_time = time.perf_counter()
+			
+			push_statistics.update(len(stream_batch), push_end_time - batch_start_time, push_end_time - push_start_time)
+			push_statistics.update_queue_depth(queue_depth)
+			if queue_depth >= high_watermark:
+				stream_spill.open()
+				push_statistics.is_spilling = True
+				push_statistics.spill_segment_count += 1
+				logger.warning(
+					f"{stream_queue_name} queue depth {queue_depth} is over its high watermark, "
+					f"spilling packets to segment {stream_spill.segment_index}"
+				)
+		
+		if push_statistics.is_report_due():
+			push_statistics.report()
 
 
 class FileWriter:
 	
-	def __init__(self, file_path, file_extension: str):
+	def __init__(self, file_path, file_extension: str, is_shared=False):
 		self._opened_file = open(file_path, 'ab')
 		self._file_extension = file_extension
+		# Shared files are written by several Consumer workers, possibly in different processes
+		# Every record is flushed on its own so that appends of different processes never interleave
+		self._is_shared = is_shared
+		self._lock = threading.Lock()
+	
+	@staticmethod
+	def _to_picklable(stream_record):
+		# Payloads arrive as memoryviews into the redis reply, which cannot be pickled
+		# The copy is kept here only, the synchronization services expect bytearray payloads in the pickle files
+		if isinstance(stream_record, memoryview):
+			return bytearray(stream_record)
+		if isinstance(stream_record, tuple):
+			return tuple(FileWriter._to_picklable(item) for item in stream_record)
+		return stream_record
 	
 	def write(self, stream_packet):
-		if self._file_extension == '.pkl':
-			pickle.dump(stream_packet, self._opened_file)
-		else:
-			self._opened_file.write(stream_packet)
+		with self._lock:
+			if self._file_extension == '.pkl':
+				pickle.dump(self._to_picklable(stream_packet), self._opened_file)
+			else:
+				self._opened_file.write(stream_packet)
+			if self._is_shared:
+				self._opened_file.flush()
+	
+	def truncate(self):
+		# Drops the records already in the file, e.g. those left by an earlier run that failed
+		with self._lock:
+			self._opened_file.truncate(0)
 	
 	def close(self):
 		self._opened_file.close()
@@ -153,7 +642,7 @@ class FileWriter:
 
 class Consumer(StreamProcessor):
 	
-	def __init__(self, redis_pool, recording, port_to_stream, active_streams, port_to_dir):
+	def __init__(self, redis_pool, recording, port_to_stream, active_streams, port_to_dir, spill_dir, telemetry=None):
 		super().__init__(redis_pool, recording, port_to_stream, active_streams)
 		self.redis_pool = redis_pool
 		self.recording = recording
@@ -161,15 +650,149 @@ class Consumer(StreamProcessor):
 		self.port_to_stream = port_to_stream
 		self.active_streams = active_streams
 		self.port_to_dir = port_to_dir
+		self.spill_dir = spill_dir
+		self.telemetry = telemetry if (telemetry is not None) else CaptureTelemetry(recording.get_recording_id())
+		self.drained_spill_packet_count = {}
 		
 		self.store_frame_as_binary = False
 		self.enable_streams = True
 		self.stream_threads = []
+		
+		self.capture_transport = const.CAPTURE_TRANSPORT
+		self.stream_kwargs = {}
+		self.frame_encoding_pool = None
+		
+		self.stream_port_threads = {}
+		self.processed_packet_count = {}
+		self.processed_packet_count_lock = threading.Lock()
+		self.drain_progress = None
+		self.drain_progress_thread = None
+	
+	def _fetch_stream_workers(self, stream_port):
+		# Only the stream transport lets several workers share the packets of a stream
+		if self.capture_transport != const.CAPTURE_TRANSPORT_STREAM:
+			return 1
+		return const.CONSUMER_STREAM_WORKERS.get(self.port_to_stream[stream_port], 1)
+	
+	def _encode_frame(self, encode_function, stream_data, *file_paths):
+		# Returns the future of the frame when it is encoded by the pool, None once it is written
+		if self.frame_encoding_pool is None:
+			encode_function(stream_data, *file_paths)
+			return None
+		# Frames read from a memory-mapped file are copied once to be sent to the worker
+		return self.frame_encoding_pool.submit(
+			encode_function, bytes(stream_data) if isinstance(stream_data, memoryview) else stream_data, *file_paths
+		)
+	
+	def _start_frame_encoding_pool(self):
+		if (const.FRAME_ENCODING_WORKERS > 0) and \
+				((hl2ss.StreamPort.PHOTO_VIDEO in self.active_streams) or
+				 (hl2ss.StreamPort.RM_DEPTH_AHAT in self.active_streams)):
+			self.frame_encoding_pool = FrameEncodingPool()
+	
+	def start_processing_streams(self):
+		self._start_frame_encoding_pool()
+		
+		for stream_port in self.active_streams:
+			self.stream_kwargs[stream_port] = self._fetch_stream_kwargs(stream_port)
+			self.stream_port_threads[stream_port] = []
+			for worker_index in range(self._fetch_stream_workers(stream_port)):
+				self._start_stream_worker(stream_port, worker_index)
+	
+	def _start_stream_worker(self, stream_port, worker_index):
+		stream_thread = threading.Thread(target=self._process_stream, args=(stream_port, worker_index))
+		self.stream_threads.append(stream_thread)
+		self.stream_port_threads[stream_port].append(stream_thread)
+		stream_thread.start()
+	
+	def _count_processed_packets(self, stream_name, packet_count):
+		with self.processed_packet_count_lock:
+			self.processed_packet_count[stream_name] = self.processed_packet_count.get(stream_name, 0) + packet_count
+	
+	def _fetch_remaining_packet_count(self, stream_transport, stream_port, spilled_packet_count):
+		stream_name = self.port_to_stream[stream_port]
+		queue_depth = stream_transport.get_queue_depth(
+			get_stream_queue_name(self.recording.get_recording_id(), stream_name)
+		)
+		# Spilled packets are counted as drained once their whole segment is processed
+		spill_packet_count = spilled_packet_count.get(stream_name, 0) - self.drained_spill_packet_count.get(stream_name, 0)
+		return queue_depth + max(spill_packet_count, 0)
+	
+	def start_drain(self, spilled_packet_count):
+		# Capture stopped, the workers finish once the backlog left in redis and in the spill files is processed
+		# Streams with a large backlog get extra workers for the drain
+		self.enable_streams = False
+		drain_start_packet_count = dict(self.processed_packet_count)
+		
+		drain_redis_client = redis.Redis(connection_pool=self.redis_pool)
+		drain_transport = create_capture_transport(drain_redis_client, self.capture_transport)
+		self.drain_progress = CaptureDrainProgress(drain_redis_client, self.recording.get_recording_id())
+		for stream_port in self.active_streams:
+			stream_name = self.port_to_stream[stream_port]
+			self.drain_progress.start_stream(
+				stream_name, self._fetch_remaining_packet_count(drain_transport, stream_port, spilled_packet_count)
+			)
+			stream_workers = self._fetch_stream_workers(stream_port)
+			for worker_index in range(stream_workers, stream_workers + const.CONSUMER_DRAIN_WORKERS.get(stream_name, 0)):
+				self._start_stream_worker(stream_port, worker_index)
+		
+		self.drain_progress_thread = threading.Thread(
+			target=self._report_drain_progress, args=(drain_transport, spilled_packet_count, drain_start_packet_count)
+		)
+		self.drain_progress_thread.start()
+	
+	def _report_drain_progress(self, drain_transport, spilled_packet_count, drain_start_packet_count):
+		while True:
+			for stream_port in self.active_streams:
+				stream_name = self.port_to_stream[stream_port]
+				is_stream_done = not any(stream_thread.is_alive() for stream_thread in self.stream_port_threads[stream_port])
+				self.drain_progress.update_stream(
+					stream_name,
+					0 if is_stream_done else self._fetch_remaining_packet_count(
+						drain_transport, stream_port, spilled_packet_count
+					),
+					self.processed_packet_count.get(stream_name, 0) - drain_start_packet_count.get(stream_name, 0),
+					is_stream_done
+				)
+			
+			is_drain_done = self.drain_progress.is_done()
+			if is_drain_done or self.drain_progress.is_report_due():
+				self.drain_progress.report()
+			self.drain_progress.publish()
+			if is_drain_done:
+				return
+			time.sleep(const.DRAIN_PROGRESS_UPDATE_PERIOD)
+	
+	def get_drain_progress(self):
+		if self.drain_progress is None:
+			return None
+		return self.drain_progress.to_dict()
+	
+	def stop_processing_streams(self):
+		super().stop_processing_streams()
+		if self.drain_progress_thread is not None:
+			self.drain_progress_thread.join()
+		
+		if self.frame_encoding_pool is not None:
+			self.frame_encoding_pool.shutdown()
+		
+		# Writers are shared by all workers of a stream, so they are closed once every worker is done
+		for stream_kwargs in self.stream_kwargs.values():
+			for stream_writer in stream_kwargs.values():
+				if isinstance(stream_writer, (FileWriter, FrameContainerWriter, RecordFileWriter)):
+					stream_writer.close()
+		
+		if os.path.exists(self.spill_dir) and not os.listdir(self.spill_dir):
+			os.rmdir(self.spill_dir)
+	
+	def get_drain_statistics(self):
+		return dict(self.drained_spill_packet_count)
 	
 	def _process_stream_data(self, stream_port, stream_data, **kwargs):
 		# Unpack the raw data
 		# This packet has timestamp, payload and necessary pose information
-		stream_packet = hl2ss.unpack_packet(stream_data)
+		# Payload and pose are views into the data received from redis
+		stream_packet = hl2ss.unpack_packet_view(stream_data)
 		stream_name = self.port_to_stream[stream_port]
 
 		if stream_port == hl2ss.StreamPort.PHOTO_VIDEO:
@@ -178,15 +801,10 @@ class Consumer(StreamProcessor):
 			kwargs[const.PV_POSE_WRITER].write((stream_packet.timestamp, stream_packet.pose))
 			
 			# 2. PV payload information - decoded
+			# Frames are named by their timestamp, so they keep their order whichever worker encodes them first
 			pv_file_name = f'{self.recording.get_recording_id()}_{stream_name}_{stream_packet.timestamp}.jpg'
 			pv_file_path = os.path.join(kwargs[const.PV_DATA_DIRECTORY], pv_file_name)
-			
-			frame_nv12 = np.frombuffer(
-				stream_packet.payload, dtype=np.uint8,
-				count=int((const.PV_STRIDE * const.PV_FRAME_HEIGHT * 3) / 2)
-			).reshape((int(const.PV_FRAME_HEIGHT * 3 / 2), const.PV_STRIDE))
-			frame_bgr = cv2.cvtColor(frame_nv12[:, :const.PV_FRAME_WIDTH], cv2.COLOR_YUV2BGR_NV12)
-			cv2.imwrite(pv_file_path, frame_bgr)
+			return self._encode_frame(encode_pv_frame, stream_data, pv_file_path)
 
 		elif stream_port == hl2ss.StreamPort.RM_DEPTH_AHAT:
 			# Here we need to save
@@ -194,25 +812,31 @@ class Consumer(StreamProcessor):
 			# np.savez(os.path.join(stream_directory, kwargs[DEPTH_AHAT_POSE_FILE_NAME]), stream_packet.pose)
 			kwargs[const.DEPTH_AHAT_POSE_WRITER].write((stream_packet.timestamp, stream_packet.pose))
 			
+			if const.DEPTH_AHAT_STORAGE == const.DEPTH_AHAT_STORAGE_CONTAINER:
+				# 2. AHAT AB and 3. AHAT depth information, appended to the frame containers as they are
+				kwargs[const.DEPTH_AHAT_AB_WRITER].write(
+					stream_packet.timestamp,
+					np.frombuffer(
+						stream_packet.payload, dtype=np.uint16,
+						offset=hl2ss.Parameters_RM_DEPTH_AHAT.PIXELS * hl2ss._SIZEOF.WORD,
+						count=hl2ss.Parameters_RM_DEPTH_AHAT.PIXELS
+					)
+				)
+				kwargs[const.DEPTH_AHAT_DEPTH_WRITER].write(
+					stream_packet.timestamp,
+					np.frombuffer(stream_packet.payload, dtype=np.uint16, count=hl2ss.Parameters_RM_DEPTH_AHAT.PIXELS)
+				)
+				return
+			
 			# 2. AHAT AB information
 			ab_file_name = f'{self.recording.get_recording_id()}_{stream_name}_ab_{stream_packet.timestamp}.png'
 			ab_file_path = os.path.join(kwargs[const.DEPTH_AHAT_AB_DATA_DIRECTORY], ab_file_name)
 			
-			ab_data = np.frombuffer(
-				stream_packet.payload, dtype=np.uint16,
-				offset=hl2ss.Parameters_RM_DEPTH_AHAT.PIXELS * hl2ss._SIZEOF.WORD,
-				count=hl2ss.Parameters_RM_DEPTH_AHAT.PIXELS
-			).reshape(hl2ss.Parameters_RM_DEPTH_AHAT.SHAPE)
-			cv2.imwrite(ab_file_path, ab_data)
-			
 			# 3. AHAT depth information
 			depth_file_name = f'{self.recording.get_recording_id()}_{stream_name}_depth_{stream_packet.timestamp}.png'
 			depth_file_path = os.path.join(kwargs[const.DEPTH_AHAT_DEPTH_DATA_DIRECTORY], depth_file_name)
 			
-			depth_data = np.frombuffer(
-				stream_packet.payload, dtype=np.uint16, count=hl2ss.Parameters_RM_DEPTH_AHAT.PIXELS
-			).reshape(hl2ss.Parameters_RM_DEPTH_AHAT.SHAPE)
-			cv2.imwrite(depth_file_path, depth_data)
+			return self._encode_frame(encode_depth_ahat_frame, stream_data, ab_file_path, depth_file_path)
 
 		elif stream_port == hl2ss.StreamPort.MICROPHONE:
 			kwargs[const.MICROPHONE_DATA_WRITER].write(
@@ -235,30 +859,45 @@ class Consumer(StreamProcessor):
 				(stream_packet.timestamp, (stream_packet.payload, stream_packet.pose))
 			)
 	
+	def _create_stream_writer(self, stream_file_path, record_kind, is_shared=False):
+		# Both writers take the same (timestamp, ...) tuples, stream_file_path has no extension
+		if const.STREAM_RECORD_STORAGE == const.STREAM_RECORD_STORAGE_RECORD:
+			return RecordFileWriter(f'{stream_file_path}.rec', record_kind, is_shared=is_shared)
+		return FileWriter(f'{stream_file_path}.pkl', file_extension=".pkl", is_shared=is_shared)
+	
 	def _fetch_stream_kwargs(self, stream_port):
 		stream_directory = self.port_to_dir[stream_port]
 		stream_name = self.port_to_stream[stream_port]
 		kwargs = {}
+		# Pose files of the PV and depth streams are shared when they are decoded by several workers
+		is_shared = self.capture_transport == const.CAPTURE_TRANSPORT_STREAM
 		if stream_port == hl2ss.StreamPort.PHOTO_VIDEO:
 			# Here we need to save
 			# 1. Pose information
 			# 2. PV payload information
-			stream_file_path = os.path.join(
-				stream_directory, f'{self.recording.get_recording_id()}_{stream_name}_pose.pkl'
-			)
-			kwargs[const.PV_POSE_WRITER] = FileWriter(stream_file_path, file_extension=".pkl")
+			stream_file_path = os.path.join(stream_directory, f'{self.recording.get_recording_id()}_{stream_name}_pose')
+			kwargs[const.PV_POSE_WRITER] = self._create_stream_writer(stream_file_path, RECORD_KIND_POSE, is_shared)
 			kwargs[const.PV_DATA_DIRECTORY] = os.path.join(stream_directory, const.FRAMES)
 		elif stream_port == hl2ss.StreamPort.RM_DEPTH_AHAT:
 			# Here we need to save
 			# 1. Pose information
 			# 2. AHAT AB information
 			# 3. AHAT depth information
-			stream_file_path = os.path.join(
-				stream_directory, f'{self.recording.get_recording_id()}_{stream_name}_pose.pkl'
+			stream_file_path = os.path.join(stream_directory, f'{self.recording.get_recording_id()}_{stream_name}_pose')
+			kwargs[const.DEPTH_AHAT_POSE_WRITER] = self._create_stream_writer(
+				stream_file_path, RECORD_KIND_POSE, is_shared
 			)
-			kwargs[const.DEPTH_AHAT_POSE_WRITER] = FileWriter(stream_file_path, file_extension=".pkl")
-			kwargs[const.DEPTH_AHAT_AB_DATA_DIRECTORY] = os.path.join(stream_directory, const.AB)
-			kwargs[const.DEPTH_AHAT_DEPTH_DATA_DIRECTORY] = os.path.join(stream_directory, const.DEPTH)
+			if const.DEPTH_AHAT_STORAGE == const.DEPTH_AHAT_STORAGE_CONTAINER:
+				for frame_kind, writer_name in [
+					(const.AB, const.DEPTH_AHAT_AB_WRITER), (const.DEPTH, const.DEPTH_AHAT_DEPTH_WRITER)
+				]:
+					kwargs[writer_name] = FrameContainerWriter(
+						get_frame_container_path(stream_directory, self.recording.get_recording_id(), stream_name, frame_kind),
+						hl2ss.Parameters_RM_DEPTH_AHAT.HEIGHT, hl2ss.Parameters_RM_DEPTH_AHAT.WIDTH
+					)
+			else:
+				kwargs[const.DEPTH_AHAT_AB_DATA_DIRECTORY] = os.path.join(stream_directory, const.AB)
+				kwargs[const.DEPTH_AHAT_DEPTH_DATA_DIRECTORY] = os.path.join(stream_directory, const.DEPTH)
 		elif stream_port == hl2ss.StreamPort.MICROPHONE:
 			# Here we need to save
 			# 1. Dump of the decoded microphone data into a pickle file
@@ -267,95 +906,222 @@ class Consumer(StreamProcessor):
 			kwargs[const.MICROPHONE_DATA_WRITER] = FileWriter(stream_file_path, file_extension=".pkl")
 		elif stream_port == hl2ss.StreamPort.SPATIAL_INPUT:
 			# Here we need to save
-			# 1. Dump of the spatial data into a pickle file
-			stream_file_path = os.path.join(stream_directory, f'{self.recording.get_recording_id()}_{stream_name}.pkl')
-			kwargs[const.SPATIAL_DATA_WRITER] = FileWriter(stream_file_path, file_extension=".pkl")
+			# 1. Dump of the spatial data into a record file
+			stream_file_path = os.path.join(stream_directory, f'{self.recording.get_recording_id()}_{stream_name}')
+			kwargs[const.SPATIAL_DATA_WRITER] = self._create_stream_writer(stream_file_path, RECORD_KIND_SPATIAL)
 
 		# IMU Data Writers
 		elif stream_port == hl2ss.StreamPort.RM_IMU_ACCELEROMETER:
 			# Here we need to save
-			# 1. Dump of the IMU accelerometer data into a pickle file
-			stream_file_path = os.path.join(stream_directory, f'{self.recording.get_recording_id()}_{stream_name}.pkl')
-			kwargs[const.IMU_ACCELEROMETER_DATA_WRITER] = FileWriter(stream_file_path, file_extension=".pkl")
+			# 1. Dump of the IMU accelerometer data into a record file
+			stream_file_path = os.path.join(stream_directory, f'{self.recording.get_recording_id()}_{stream_name}')
+			kwargs[const.IMU_ACCELEROMETER_DATA_WRITER] = self._create_stream_writer(stream_file_path, RECORD_KIND_IMU)
 		elif stream_port == hl2ss.StreamPort.RM_IMU_GYROSCOPE:
 			# Here we need to save
-			# 1. Dump of the IMU gyroscope data into a pickle file
-			stream_file_path = os.path.join(stream_directory, f'{self.recording.get_recording_id()}_{stream_name}.pkl')
-			kwargs[const.IMU_GYROSCOPE_DATA_WRITER] = FileWriter(stream_file_path, file_extension=".pkl")
+			# 1. Dump of the IMU gyroscope data into a record file
+			stream_file_path = os.path.join(stream_directory, f'{self.recording.get_recording_id()}_{stream_name}')
+			kwargs[const.IMU_GYROSCOPE_DATA_WRITER] = self._create_stream_writer(stream_file_path, RECORD_KIND_IMU)
 		elif stream_port == hl2ss.StreamPort.RM_IMU_MAGNETOMETER:
 			# Here we need to save
-			# 1. Dump of the IMU magnetometer data into a pickle file
-			stream_file_path = os.path.join(stream_directory, f'{self.recording.get_recording_id()}_{stream_name}.pkl')
-			kwargs[const.IMU_MAGNETOMETER_DATA_WRITER] = FileWriter(stream_file_path, file_extension=".pkl")
+			# 1. Dump of the IMU magnetometer data into a record file
+			stream_file_path = os.path.join(stream_directory, f'{self.recording.get_recording_id()}_{stream_name}')
+			kwargs[const.IMU_MAGNETOMETER_DATA_WRITER] = self._create_stream_writer(stream_file_path, RECORD_KIND_IMU)
 		
 		return kwargs
 	
-	def _process_stream(self, stream_port):
+	def _process_stream(self, stream_port, worker_index=0):
 		stream_name = self.port_to_stream[stream_port]
+		consumer_name = create_consumer_name(stream_name, worker_index)
 		
-		logger.log(logging.INFO, f"Configuring {stream_name} Consumer for recording {self.recording.__str__()}")
+		logger.log(logging.INFO, f"Configuring {consumer_name} Consumer for recording {self.recording.__str__()}")
 		
-		# Create a redis client and push the stream data to the queue named stream_port continuously
+		# Create a redis client and pop the stream data from the queue named stream_port continuously
 		stream_redis_client = redis.Redis(connection_pool=self.redis_pool)
-		done_processing = False
+		stream_queue_name = get_stream_queue_name(self.recording.get_recording_id(), stream_name)
+		stream_transport = create_capture_transport(stream_redis_client, self.capture_transport)
+		stream_transport.create_queue(stream_queue_name)
 		
-		kwargs = self._fetch_stream_kwargs(stream_port)
+		kwargs = self.stream_kwargs[stream_port]
+		write_counter = self.telemetry.register_writer(stream_name)
+		# Batches read but not yet acknowledged, waiting for their frames to be encoded by the pool
+		encoding_batches = collections.deque()
 		
 		while True:
-			stream_data = stream_redis_client.brpop([stream_name], timeout=3)
+			stream_entries = stream_transport.read(stream_queue_name, consumer_name, timeout=3)
 			
-			if stream_data is None:
+			if not stream_entries:
+				self._acknowledge_encoded_batches(stream_transport, stream_queue_name, encoding_batches, wait=True)
+				# Redis queue is empty, packets spilled to disk are processed before waiting again
+				if self._drain_stream_spill(stream_port, consumer_name, kwargs, write_counter):
+					continue
+				
 				# Finished processing of the streams
-				if not self.enable_streams:
-					done_processing = True
+				# Entries still pending belong to other workers or to a crashed worker and get reclaimed
+				if not self.enable_streams and not stream_transport.has_pending(stream_queue_name):
 					logger.log(
 						logging.INFO,
-						f"Finished {stream_name} Consumer processing for recording {self.recording.__str__()}"
+						f"Finished {consumer_name} Consumer processing for recording {self.recording.__str__()}"
 					)
+					return
+				# Might be a temporary hold on the data, can come back in sometime
+				logger.log(
+					logging.INFO,
+					f"Reached Timeout {consumer_name} "
+					f"Consumer but stream data is not yet done, so continuing processing"
+				)
+				continue
+			
+			encoding_batches.append([
+				(entry_id, self._process_stream_data(stream_port, stream_data, **kwargs))
+				for entry_id, stream_data in stream_entries
+			])
+			self._acknowledge_encoded_batches(stream_transport, stream_queue_name, encoding_batches, wait=False)
+			self._count_processed_packets(stream_name, len(stream_entries))
+			write_counter.update(len(stream_entries), sum(len(stream_data) for _, stream_data in stream_entries))
+	
+	@staticmethod
+	def _acknowledge_encoded_batches(stream_transport, stream_queue_name, encoding_batches, wait):
+		# A batch is acknowledged once all of its frames are written, in the order the batches were read
+		# Entries whose frame failed to encode are rejected, the transport retries them or gives up on them
+		while encoding_batches and (wait or all(
+				(encode_future is None) or encode_future.done() for _, encode_future in encoding_batches[0]
+		)):
+			entry_futures = encoding_batches.popleft()
+			entry_ids, failed_entry_ids = [], []
+			for entry_id, encode_future in entry_futures:
+				if (encode_future is None) or (encode_future.exception() is None):
+					entry_ids.append(entry_id)
+				else:
+					failed_entry_ids.append(entry_id)
+			if entry_ids:
+				stream_transport.acknowledge(stream_queue_name, entry_ids)
+			if failed_entry_ids:
+				stream_transport.reject(stream_queue_name, failed_entry_ids)
+
+
+	def _process_stream_file(self, stream_port, stream_file_path, kwargs, write_counter=None):
+		# Packets stored with the hl2ss_io writers, by a spill or by a raw capture, go through the same writers
+		# Packets are read in place from a memory map of the file, without copying them
+		stream_reader = hl2ss_io.create_rd(False, stream_file_path, const.SPILL_READ_CHUNK_SIZE, None, mapped=True)
+		stream_reader.open()
+		packet_count = 0
+		while True:
+			stream_packet = stream_reader.read()
+			if stream_packet is None:
 				break
-			else:
-				# Convert the bytes received from stream data into byte array
-				self._process_stream_data(stream_port, bytearray(stream_data[1]), **kwargs)
-		
-		if not done_processing:
-			# Might be a temporary hold on the data, can come back in sometime
-			# So make the process recursive
-			logger.log(
-				logging.INFO,
-				f"Reached Timeout {self.port_to_stream[stream_port]} "
-				f"Consumer but stream data is not yet done, so initialized processing again"
+			stream_data = hl2ss.pack_packet_view(stream_packet)
+			self._process_stream_data(stream_port, stream_data, **kwargs)
+			self._count_processed_packets(self.port_to_stream[stream_port], 1)
+			if write_counter is not None:
+				write_counter.update(1, len(stream_data))
+			packet_count += 1
+		stream_reader.close()
+		return packet_count
+	
+	def _process_raw_capture_file(self, stream_port, raw_capture_file_path):
+		logger.info(f"Processing raw capture file {raw_capture_file_path}")
+		packet_count = self._process_stream_file(stream_port, raw_capture_file_path, self.stream_kwargs[stream_port])
+		logger.info(f"Processed {packet_count} packets from raw capture file {raw_capture_file_path}")
+	
+	def process_raw_capture_files(self, port_to_raw_capture_file_path):
+		# Deferred processing of a raw capture, one thread per stream file instead of the redis readers
+		self._start_frame_encoding_pool()
+		for stream_port, raw_capture_file_path in port_to_raw_capture_file_path.items():
+			self.stream_kwargs[stream_port] = self._fetch_stream_kwargs(stream_port)
+			# Every packet of the file is written again, so a run after a partial failure does not duplicate them
+			# Frames written as separate files are named by their timestamp and simply overwritten
+			for stream_writer in self.stream_kwargs[stream_port].values():
+				if isinstance(stream_writer, (FileWriter, FrameContainerWriter, RecordFileWriter)):
+					stream_writer.truncate()
+			stream_thread = threading.Thread(
+				target=self._process_raw_capture_file, args=(stream_port, raw_capture_file_path)
 			)
-			self._process_stream(stream_port)
-		else:
-			if stream_port == hl2ss.StreamPort.MICROPHONE:
-				kwargs[const.MICROPHONE_DATA_WRITER].close()
-			elif stream_port == hl2ss.StreamPort.SPATIAL_INPUT:
-				kwargs[const.SPATIAL_DATA_WRITER].close()
-			elif stream_port == hl2ss.StreamPort.RM_DEPTH_AHAT:
-				kwargs[const.DEPTH_AHAT_POSE_WRITER].close()
-			elif stream_port == hl2ss.StreamPort.PHOTO_VIDEO:
-				kwargs[const.PV_POSE_WRITER].close()
-			elif stream_port == hl2ss.StreamPort.RM_IMU_ACCELEROMETER:
-				kwargs[const.IMU_ACCELEROMETER_DATA_WRITER].close()
-			elif stream_port == hl2ss.StreamPort.RM_IMU_GYROSCOPE:
-				kwargs[const.IMU_GYROSCOPE_DATA_WRITER].close()
-			elif stream_port == hl2ss.StreamPort.RM_IMU_MAGNETOMETER:
-				kwargs[const.IMU_MAGNETOMETER_DATA_WRITER].close()
-			return
+			self.stream_threads.append(stream_thread)
+			stream_thread.start()
+		self.stop_processing_streams()
+	
+	def _drain_stream_spill(self, stream_port, consumer_name, kwargs, write_counter=None):
+		stream_name = self.port_to_stream[stream_port]
+		for spill_segment_path in get_spill_segment_paths(self.spill_dir, stream_name):
+			# Renaming claims the segment, it fails when another worker of the stream claimed it first
+			claimed_segment_path = f'{spill_segment_path}.{consumer_name}'
+			try:
+				os.rename(spill_segment_path, claimed_segment_path)
+			except FileNotFoundError:
+				continue
+			
+			logger.info(f"{consumer_name} Consumer draining spill segment {spill_segment_path}")
+			drained_packet_count = self._process_stream_file(stream_port, claimed_segment_path, kwargs, write_counter)
+			os.remove(claimed_segment_path)
+			
+			self.drained_spill_packet_count[stream_name] = \
+				self.drained_spill_packet_count.get(stream_name, 0) + drained_packet_count
+			logger.info(f"{consumer_name} Consumer drained {drained_packet_count} packets from {spill_segment_path}")
+			return True
+		return False
+
+
+class RawCapture:
+	# Writes the raw hl2ss packets of every active stream to a file at network speed, one wr_process_rx per stream
+	# Frames, poses and samples are extracted later from the files by the RawCaptureProcessingService
+	
+	def __init__(self, recording, port_to_stream, active_streams, port_to_dir):
+		self.recording = recording
+		self.port_to_stream = port_to_stream
+		self.active_streams = active_streams
+		self.port_to_dir = port_to_dir
+		self.device_ip = self.recording.recording_info.hololens_info.device_ip
+		self.stream_writers = {}
+	
+	def start(self):
+		for stream_port in self.active_streams:
+			stream_name = self.port_to_stream[stream_port]
+			stream_client = create_stream_client(self.device_ip, stream_port)
+			if stream_client is None:
+				logger.info(f'Stream client is not configured for stream {stream_name}')
+				continue
+			raw_capture_file_path = get_raw_capture_file_path(
+				self.port_to_dir[stream_port], self.recording.get_recording_id(), stream_name
+			)
+			stream_writer = hl2ss_io.wr_process_rx(
+				raw_capture_file_path, stream_client, self.recording.get_recording_id().encode(),
+				const.RAW_CAPTURE_COMPRESSION, const.RAW_CAPTURE_SEGMENT_DURATION, const.RAW_CAPTURE_SEGMENT_SIZE
+			)
+			stream_writer.start()
+			self.stream_writers[stream_name] = stream_writer
+			logger.info(f"Started raw capture of {stream_name} into {raw_capture_file_path}")
+	
+	def stop(self):
+		for stream_writer in self.stream_writers.values():
+			stream_writer.stop()
+		# A writer stops after the next packet of its stream
+		for stream_name, stream_writer in self.stream_writers.items():
+			stream_writer.join()
+			logger.info(f"Stopped raw capture of {stream_name}")
 
 
 class HololensService:
 	
-	def __init__(self):
+	def __init__(self, redis_db=const.REDIS_DB):
 		self.rm_enable = True
 		self.is_recording = False
 		self.lock = threading.Lock()
 		
-		self.redis_pool = redis.ConnectionPool(host=const.REDIS_HOST, port=const.REDIS_PORT)
+		self.capture_mode = const.CAPTURE_MODE
+		if self.capture_mode == const.CAPTURE_MODE_RAW_FILES:
+			# Raw captures are written to disk by the receivers, redis is not used
+			self.redis_pool = None
+			return
+		
+		self.redis_pool = redis.ConnectionPool(host=const.REDIS_HOST, port=const.REDIS_PORT, db=redis_db)
 		
-		# # Flush all the keys currently present in the database
+		# Delete the queues of finished recordings, unless a previous recording is still draining its queues
+		# Status keys expire on their own, queues with entries left by a process that died expire after a while
 		self.redis_connection = redis.Redis(connection_pool=self.redis_pool)
-		self.redis_connection.flushdb()
+		if is_capture_draining(self.redis_connection):
+			logger.info("A previous recording is still draining, keeping the keys of its queues")
+		else:
+			delete_finished_capture_queues(self.redis_connection)
 	
 	@staticmethod
 	def save_hololens2_info(ip_address, folder_path, client_rc):
@@ -378,45 +1144,12 @@ class HololensService:
 		self.device_name = get_hostname(self.device_ip)
 		
 		self.rec_data_dir = os.path.join(self.data_dir, self.recording.id)
-		self.port_to_dir = {
-			hl2ss.StreamPort.PHOTO_VIDEO: os.path.join(self.rec_data_dir, const.PHOTOVIDEO),
-			hl2ss.StreamPort.MICROPHONE: os.path.join(self.rec_data_dir, const.MICROPHONE),
-			hl2ss.StreamPort.RM_DEPTH_AHAT: os.path.join(self.rec_data_dir, const.DEPTH_AHAT),
-			hl2ss.StreamPort.SPATIAL_INPUT: os.path.join(self.rec_data_dir, const.SPATIAL),
-			hl2ss.StreamPort.RM_IMU_ACCELEROMETER: os.path.join(self.rec_data_dir, const.IMU),
-			hl2ss.StreamPort.RM_IMU_GYROSCOPE: os.path.join(self.rec_data_dir, const.IMU),
-			hl2ss.StreamPort.RM_IMU_MAGNETOMETER: os.path.join(self.rec_data_dir, const.IMU),
-			hl2ss.StreamPort.RM_VLC_LEFTFRONT: os.path.join(self.rec_data_dir, const.VLC_LEFTFRONT),
-			hl2ss.StreamPort.RM_VLC_LEFTLEFT: os.path.join(self.rec_data_dir, const.VLC_LEFTLEFT),
-			hl2ss.StreamPort.RM_VLC_RIGHTFRONT: os.path.join(self.rec_data_dir, const.VLC_RIGHTFRONT),
-			hl2ss.StreamPort.RM_VLC_RIGHTRIGHT: os.path.join(self.rec_data_dir, const.VLC_RIGHTRIGHT),
-			hl2ss.StreamPort.RM_DEPTH_LONGTHROW: os.path.join(self.rec_data_dir, const.DEPTH_LT),
-		}
-		
-		self.port_to_stream = {
-			hl2ss.StreamPort.RM_DEPTH_AHAT: const.DEPTH_AHAT,
-			hl2ss.StreamPort.PHOTO_VIDEO: const.PHOTOVIDEO,
-			hl2ss.StreamPort.MICROPHONE: const.MICROPHONE,
-			hl2ss.StreamPort.SPATIAL_INPUT: const.SPATIAL,
-			hl2ss.StreamPort.RM_DEPTH_LONGTHROW: const.DEPTH_LT,
-			hl2ss.StreamPort.RM_IMU_MAGNETOMETER: const.IMU_MAGNETOMETER,
-			hl2ss.StreamPort.RM_IMU_GYROSCOPE: const.IMU_GYROSCOPE,
-			hl2ss.StreamPort.RM_IMU_ACCELEROMETER: const.IMU_ACCELEROMETER,
-			hl2ss.StreamPort.RM_VLC_LEFTLEFT: const.VLC_LEFTLEFT,
-			hl2ss.StreamPort.RM_VLC_LEFTFRONT: const.VLC_LEFTFRONT,
-			hl2ss.StreamPort.RM_VLC_RIGHTRIGHT: const.VLC_RIGHTRIGHT,
-			hl2ss.StreamPort.RM_VLC_RIGHTFRONT: const.VLC_RIGHTFRONT
-		}
+		self.spill_dir = os.path.join(self.rec_data_dir, const.SPILL)
+		self.port_to_dir = get_port_to_dir(self.rec_data_dir)
+		self.port_to_stream = get_port_to_stream()
 		
 		self.active_streams = active_streams
-		
-		for port in self.active_streams:
-			create_directories(self.port_to_dir[port])
-			if (port == hl2ss.StreamPort.RM_DEPTH_AHAT) or (port == hl2ss.StreamPort.RM_DEPTH_LONGTHROW):
-				create_directories(os.path.join(self.port_to_dir[port], const.AB))
-				create_directories(os.path.join(self.port_to_dir[port], const.DEPTH))
-			if port == hl2ss.StreamPort.PHOTO_VIDEO:
-				create_directories(os.path.join(self.port_to_dir[port], const.FRAMES))
+		create_stream_directories(self.port_to_dir, self.active_streams)
 		
 		# Start PV
 		self.client_rc = hl2ss.ipc_rc(self.device_ip, hl2ss.IPCPort.REMOTE_CONFIGURATION)
@@ -429,15 +1162,48 @@ class HololensService:
 	def _start_record_sensor_streams(self, recording: Recording, active_streams: List[int]):
 		# Initialize all Parameters, Producers, Consumers, Display Map, Writer Map
 		logger.info("Initializing parameters")
+		self.rm_enable = True
 		self._init_params(recording, active_streams)
 		HololensService.save_hololens2_info(self.device_ip, self.rec_data_dir, self.client_rc)
 		
-		self.producer = Producer(self.redis_pool, self.recording, self.port_to_stream, self.active_streams)
-		self.producer.start_processing_streams()
+		# Streams written to raw capture files as they are received, the others go through redis
+		if self.capture_mode == const.CAPTURE_MODE_RAW_FILES:
+			self.raw_capture_streams = list(self.active_streams)
+		elif (const.PV_CAPTURE_FORMAT == const.PV_CAPTURE_FORMAT_ENCODED) and \
+				(hl2ss.StreamPort.PHOTO_VIDEO in self.active_streams):
+			# Encoded PV has to be stored in order, and takes little enough bandwidth to be written as it arrives
+			self.raw_capture_streams = [hl2ss.StreamPort.PHOTO_VIDEO]
+		else:
+			self.raw_capture_streams = []
+		self.redis_streams = [
+			stream_port for stream_port in self.active_streams if stream_port not in self.raw_capture_streams
+		]
 		
-		self.consumer = Consumer(self.redis_pool, self.recording, self.port_to_stream, self.active_streams,
-								 self.port_to_dir)
-		self.consumer.start_processing_streams()
+		if self.raw_capture_streams:
+			self.raw_capture = RawCapture(
+				self.recording, self.port_to_stream, self.raw_capture_streams, self.port_to_dir
+			)
+			self.raw_capture.start()
+		
+		self.spatial_mapping_capture = None
+		if const.SM_CAPTURE_ENABLED:
+			spatial_mapping_dir = os.path.join(self.rec_data_dir, const.SPATIAL_MAPPING)
+			create_directories(spatial_mapping_dir)
+			self.spatial_mapping_capture = SpatialMappingCapture(self.recording, spatial_mapping_dir)
+			self.spatial_mapping_capture.start()
+		
+		if self.redis_streams:
+			self.telemetry = CaptureTelemetry(self.recording.get_recording_id(), self.redis_pool)
+			self.producer = Producer(
+				self.redis_pool, self.recording, self.port_to_stream, self.redis_streams, self.spill_dir,
+				self.telemetry
+			)
+			self.producer.start_processing_streams()
+			
+			self.consumer = Consumer(self.redis_pool, self.recording, self.port_to_stream, self.redis_streams,
+									 self.port_to_dir, self.spill_dir, self.telemetry)
+			self.consumer.start_processing_streams()
+			self.telemetry.start_reporter()
 		
 		while self.rm_enable:
 			time.sleep(10)
@@ -445,19 +1211,37 @@ class HololensService:
 	def _stop_record_sensor_streams(self):
 		
 		logger.log(logging.INFO, "Stopping all record streams")
+		# Ends the wait of start_recording
+		self.rm_enable = False
 		
-		self.producer.stop_processing_streams()
-		self.consumer.stop_processing_streams()
+		if self.raw_capture_streams:
+			self.raw_capture.stop()
+		if self.redis_streams:
+			self.producer.stop_processing_streams()
+		if self.spatial_mapping_capture is not None:
+			self.spatial_mapping_capture.stop()
 		
 		# Stopping PV systems
+		# The device is released before the drain, so that the next recording can start capturing
 		if hl2ss.StreamPort.PHOTO_VIDEO in self.active_streams:
 			hl2ss.stop_subsystem_pv(self.device_ip, hl2ss.StreamPort.PHOTO_VIDEO)
 			self.client_rc.wait_for_pv_subsystem(False)
 		
 		self.client_rc.close()
 		
+		if self.redis_streams:
+			logger.log(logging.INFO, "Stopped capture, draining the remaining packets")
+			self.consumer.start_drain(self.producer.get_spilled_packet_count())
+			self.consumer.stop_processing_streams()
+			self.telemetry.stop_reporter()
+		
 		logger.log(logging.INFO, "Stopped all systems")
 	
+	def get_drain_progress(self):
+		if not hasattr(self, 'consumer'):
+			return None
+		return self.consumer.get_drain_progress()
+	
 	def fetch_active_streams(self, recording: Recording):
 		
 		hololens_info: HololensInfo = recording.recording_info.hololens_info
@@ -0,0 +1,127 @@
+import threading
+import time
+
+from ..hololens import hl2ss
+from ..utils.constants import Hololens_Constants as const
+from ..utils.logger_config import get_logger
+from ..utils.mesh_file import MeshFileWriter, get_mesh_file_path
+
+logger = get_logger(__name__)
+
+
+class SpatialMappingCapture:
+	# Polls the surfaces observed by the device and appends a new version of every surface whose update time
+	# changed since the previous poll to the mesh file of the recording, unchanged surfaces are not downloaded again
+
+	def __init__(self, recording, output_directory):
+		self.recording = recording
+		self.device_ip = self.recording.recording_info.hololens_info.device_ip
+		self.mesh_file_path = get_mesh_file_path(output_directory, self.recording.get_recording_id())
+		self.update_times = {}
+		self.enable_capture = False
+		self.capture_thread = None
+
+	def _create_volumes(self):
+		volumes = hl2ss.sm_bounding_volume()
+		volumes.add_sphere(const.SM_VOLUME_CENTER, const.SM_VOLUME_RADIUS)
+		return volumes
+
+	def _create_tasks(self, surface_infos):
+		tasks = hl2ss.sm_mesh_task()
+		for surface_info in surface_infos:
+			tasks.add_task(
+				surface_info.id, const.SM_MAX_TRIANGLES_PER_CUBIC_METER, const.SM_VERTEX_POSITION_FORMAT,
+				const.SM_TRIANGLE_INDEX_FORMAT, const.SM_VERTEX_NORMAL_FORMAT, True, True
+			)
+		return tasks
+
+	def _poll(self, client_sm, mesh_writer):
+		surface_infos = client_sm.get_observed_surfaces()
+		observed_update_times = {bytes(surface_info.id): surface_info.update_time for surface_info in surface_infos}
+
+		updated_surface_infos = [
+			surface_info for surface_info in surface_infos
+			if self.update_times.get(bytes(surface_info.id)) != surface_info.update_time
+		]
+		if updated_surface_infos:
+			meshes = client_sm.get_meshes(self._create_tasks(updated_surface_infos), const.SM_MESH_THREADS)
+			for index, surface_info in enumerate(updated_surface_infos):
+				mesh = meshes.get(index)
+				if mesh is None:
+					# Downloaded again at the next poll
+					continue
+				surface_id = bytes(surface_info.id)
+				mesh_writer.write(surface_id, surface_info.update_time, mesh)
+				self.update_times[surface_id] = surface_info.update_time
+
+		# Surfaces that left the observed volume are marked as removed at the latest update time of this poll
+		removed_surface_ids = [surface_id for surface_id in self.update_times if surface_id not in observed_update_times]
+		removed_update_time = max(observed_update_times.values(), default=0)
+		for surface_id in removed_surface_ids:
+			mesh_writer.write_removed(surface_id, removed_update_time)
+			del self.update_times[surface_id]
+
+		return len(updated_surface_infos), len(removed_surface_ids)
+
+	def _connect(self):
+		client_sm = hl2ss.ipc_sm(self.device_ip, hl2ss.IPCPort.SPATIAL_MAPPING)
+		client_sm.open()
+		try:
+			client_sm.create_observer()
+			client_sm.set_volumes(self._create_volumes())
+		except Exception:
+			client_sm.close()
+			raise
+		return client_sm
+
+	@staticmethod
+	def _disconnect(client_sm):
+		try:
+			client_sm.close()
+		except Exception as e:
+			logger.warning(f"Failed to close the spatial mapping client: {e}")
+
+	def _capture(self):
+		mesh_writer = MeshFileWriter(
+			self.mesh_file_path, const.SM_VERTEX_POSITION_FORMAT, const.SM_TRIANGLE_INDEX_FORMAT,
+			const.SM_VERTEX_NORMAL_FORMAT
+		)
+		client_sm = None
+		num_of_versions = 0
+		try:
+			logger.info(f"Started spatial mapping capture into {self.mesh_file_path}")
+			while self.enable_capture:
+				poll_start_time = time.time()
+				try:
+					# Connected again at the next period after a failure, surfaces already stored are not downloaded again
+					if client_sm is None:
+						client_sm = self._connect()
+					num_of_updated_surfaces, num_of_removed_surfaces = self._poll(client_sm, mesh_writer)
+					num_of_versions += num_of_updated_surfaces
+					if num_of_updated_surfaces or num_of_removed_surfaces:
+						logger.info(
+							f"Spatial mapping: {num_of_updated_surfaces} surfaces updated, "
+							f"{num_of_removed_surfaces} removed, {len(self.update_times)} observed"
+						)
+				except Exception as e:
+					logger.error(f"Spatial mapping poll failed, retrying in {const.SM_POLL_PERIOD} seconds: {e}")
+					if client_sm is not None:
+						self._disconnect(client_sm)
+						client_sm = None
+				time.sleep(max(const.SM_POLL_PERIOD - (time.time() - poll_start_time), 0))
+		finally:
+			if client_sm is not None:
+				self._disconnect(client_sm)
+			mesh_writer.close()
+			logger.info(f"Stopped spatial mapping capture, {num_of_versions} surface versions stored")
+
+	def start(self):
+		self.enable_capture = True
+		self.capture_thread = threading.Thread(target=self._capture, daemon=True)
+		self.capture_thread.start()
+
+	def stop(self):
+		self.enable_capture = False
+		if self.capture_thread is not None:
+			self.capture_thread.join()
+			self.capture_thread = None
@@ -6,12 +6,16 @@ import zipfile
 from typing import List
 
 import cv2
+import numpy as np
 
 from ..hololens import hl2ss
 from ..models.recording import Recording
 from ..post_processing.compress_data_service import CompressDataService
+from ..post_processing.encoded_pv_service import EncodedPvService
 from ..utils.constants import Synchronization_Constants as const
+from ..utils.frame_container import FrameContainerReader, FrameContainerWriter, get_frame_container_path
 from ..utils.logger_config import get_logger
+from ..utils.record_file import RecordFileReader, get_record_file_path
 
 logger = get_logger(__name__)
 
@@ -37,6 +41,23 @@ def read_stream_pkl_data(stream_pkl_file_path):
     return pkl_frames
 
 
+def unpack_stream_payload(payload):
+    if type(payload) is bytearray:
+        return hl2ss.unpack_si(payload)
+    return payload
+
+
+def read_sync_imu_batch(sync_imu_file_path):
+    # Synchronized IMU pickle as one batch of samples, with the synchronized frame index of every sample
+    with open(sync_imu_file_path, 'rb') as sync_imu_file:
+        sync_imu_data = pickle.load(sync_imu_file)
+    frame_indices = sorted(sync_imu_data.keys())
+    payloads = [sync_imu_data[frame_index][1][0] for frame_index in frame_indices]
+    batch = hl2ss.unpack_rm_imu_batch(payloads, [sync_imu_data[frame_index][0] for frame_index in frame_indices])
+    sample_counts = [len(payload) // hl2ss.RM_IMU_SAMPLE_DTYPE.itemsize for payload in payloads]
+    return np.repeat(np.asarray(frame_indices, dtype=np.int64), sample_counts), batch
+
+
 def get_ts_to_stream_frame(
         stream_directory,
         stream_extension,
@@ -196,14 +217,25 @@ class SynchronizationServiceV2:
         pkl_frames = read_stream_pkl_data(stream_pkl_file_path)
         for pkl_frame in pkl_frames:
             ts, payload = pkl_frame if type(pkl_frame) is tuple else (pkl_frame.ts, pkl_frame.payload)
-            if type(payload) is bytearray:
-                payload = hl2ss.unpack_si(payload)
-            ts_to_stream_payload[ts] = payload
+            ts_to_stream_payload[ts] = unpack_stream_payload(payload)
         return ts_to_stream_payload
     
-    def create_sync_stream_pkl_data(self, stream_pkl_file_path, sync_stream_output_directory, base_ts_to_stream_ts):
-        # 1. Load pickle file data into a dictionary
+    def get_stream_payload_reader(self, stream_pkl_file_path):
+        # Streams recorded into record files are read from the memory-mapped records,
+        # older recordings from the pickle file of the same name
+        record_file_path = get_record_file_path(stream_pkl_file_path)
+        if os.path.exists(record_file_path):
+            record_file_reader = RecordFileReader(record_file_path)
+            return (
+                record_file_reader.get_sorted_timestamps(),
+                lambda ts: unpack_stream_payload(record_file_reader.get_payload(ts))
+            )
         ts_to_stream_payload = self.get_ts_pkl_frame_map(stream_pkl_file_path)
+        return sorted(ts_to_stream_payload.keys()), ts_to_stream_payload.get
+    
+    def create_sync_stream_pkl_data(self, stream_pkl_file_path, sync_stream_output_directory, base_ts_to_stream_ts):
+        # 1. Load the stream data
+        _, get_stream_payload = self.get_stream_payload_reader(stream_pkl_file_path)
         
         # 2. Use the base_stream_keys and loaded pickle file data to synchronize them
         synced_ts_to_stream_payload = {}
@@ -212,22 +244,22 @@ class SynchronizationServiceV2:
                 logger.info(f"[{self.recording_id}] Skipping pkl frame %s" % base_stream_key)
                 continue
             stream_ts = base_ts_to_stream_ts[base_stream_key]
-            stream_payload = ts_to_stream_payload[stream_ts]
+            stream_payload = get_stream_payload(stream_ts)
             synced_ts_to_stream_payload[base_stream_counter] = (stream_ts, stream_payload)
         write_pickle_data(synced_ts_to_stream_payload, sync_stream_output_directory)
         
     def create_sync_pv_stream_pkl_data(self, stream_pkl_file_path, sync_stream_output_path):
-        # 1. Load pickle file data into a dictionary
-        ts_to_stream_payload = self.get_ts_pkl_frame_map(stream_pkl_file_path)
+        # 1. Load the stream data
+        _, get_stream_payload = self.get_stream_payload_reader(stream_pkl_file_path)
         
         # 2. Use the base_stream_keys and loaded pickle file data to synchronize them
         synced_ts_to_stream_payload = {}
         for base_stream_counter, base_stream_key in enumerate(self.base_stream_keys):
-            if base_stream_key not in ts_to_stream_payload or ts_to_stream_payload[base_stream_key] is None:
+            stream_payload = get_stream_payload(base_stream_key)
+            if stream_payload is None:
                 logger.info(f"[{self.recording_id}] Skipping pkl frame %s" % base_stream_key)
                 continue
             stream_ts = base_stream_key
-            stream_payload = ts_to_stream_payload[stream_ts]
             synced_ts_to_stream_payload[base_stream_counter] = (stream_ts, stream_payload)
         write_pickle_data(synced_ts_to_stream_payload, sync_stream_output_path)
     
@@ -251,13 +283,76 @@ class SynchronizationServiceV2:
             )
         return
     
+    def create_sync_frame_container(self, raw_container_path, sync_container_path, base_ts_to_stream_ts):
+        raw_container_reader = FrameContainerReader(raw_container_path)
+        sync_container_writer = FrameContainerWriter(
+            sync_container_path, raw_container_reader.height, raw_container_reader.width
+        )
+        for base_stream_counter, base_stream_key in enumerate(self.base_stream_keys):
+            if base_stream_key not in base_ts_to_stream_ts or base_ts_to_stream_ts[base_stream_key] is None:
+                logger.info(f"[{self.recording_id}] Skipping frame %s" % base_stream_key)
+                continue
+            # Synchronized containers are keyed by frame id, like the names of synchronized PNG frames
+            sync_container_writer.write(
+                base_stream_counter, raw_container_reader.get_frame_by_key(base_ts_to_stream_ts[base_stream_key])
+            )
+        sync_container_writer.close()
+    
+    def sync_depth_ahat_frame_containers(self):
+        raw_depth_parent_directory = os.path.join(self.raw_data_directory, const.DEPTH_AHAT)
+        sync_depth_parent_directory = os.path.join(self.sync_data_directory, const.DEPTH_AHAT)
+        create_directories(sync_depth_parent_directory)
+        
+        depth_ahat_pkl = f'{self.recording.id}_depth_ahat_pose.pkl'
+        raw_depth_pose_file_path = os.path.join(raw_depth_parent_directory, depth_ahat_pkl)
+        sync_depth_pose_file_path = os.path.join(sync_depth_parent_directory, depth_ahat_pkl)
+        
+        raw_depth_container_reader = FrameContainerReader(
+            get_frame_container_path(raw_depth_parent_directory, self.recording.id, const.DEPTH_AHAT, const.DEPTH)
+        )
+        
+        # 0. Create base stream timestamp - synchronize stream timestamp mapping
+        base_ts_to_stream_ts = self.create_base_ts_to_stream_ts_map(raw_depth_container_reader.get_sorted_keys())
+        
+        if not os.path.exists(sync_depth_pose_file_path):
+            # 1. Synchronize Pose
+            logger.info(f"[{self.recording_id}] Synchronizing Depth Pose data")
+            self.create_sync_stream_pkl_data(raw_depth_pose_file_path, sync_depth_pose_file_path, base_ts_to_stream_ts)
+            logger.info(f"[{self.recording_id}] Done synchronizing Depth Pose data")
+        else:
+            logger.info(f"[{self.recording_id}] Skipping synchronizing Depth Pose data")
+        
+        # 2. Synchronize Depth data and 3. Synchronize Active Brightness data
+        for frame_kind in [const.DEPTH, const.AB]:
+            raw_container_path = get_frame_container_path(
+                raw_depth_parent_directory, self.recording.id, const.DEPTH_AHAT, frame_kind
+            )
+            sync_container_path = get_frame_container_path(
+                sync_depth_parent_directory, self.recording.id, const.DEPTH_AHAT, frame_kind
+            )
+            if not os.path.exists(sync_container_path):
+                logger.info(f"[{self.recording_id}] Synchronizing {frame_kind} frame container")
+                start_container_time = time.time()
+                self.create_sync_frame_container(raw_container_path, sync_container_path, base_ts_to_stream_ts)
+                total_container_time = time.strftime("%H:%M:%S", time.gmtime(time.time() - start_container_time))
+                logger.info(
+                    f"[{self.recording_id}] Done synchronizing {frame_kind} frame container : {total_container_time}")
+            else:
+                logger.info(f"[{self.recording_id}] Skipping synchronizing {frame_kind} frame container")
+        
+        self.depth_width, self.depth_height = raw_depth_container_reader.width, raw_depth_container_reader.height
+        self.meta_yaml_data["depth_mode"] = const.AHAT
+        self.meta_yaml_data["depth_width"] = self.depth_width
+        self.meta_yaml_data["depth_height"] = self.depth_height
+    
     def get_stream_keys_from_dir(self, stream_directory, stream_extension, ts_index):
         ts_to_stream_frame = get_ts_to_stream_frame(stream_directory, stream_extension, ts_index)
         return list(ts_to_stream_frame.keys())
     
     def get_stream_keys_from_pkl(self, pkl_file_path):
-        ts_to_stream_frame_pkl = self.get_ts_pkl_frame_map(pkl_file_path)
-        return list(ts_to_stream_frame_pkl.keys())
+        # Packets drained from spill files are appended after later packets, so records are not in timestamp order
+        stream_keys, _ = self.get_stream_payload_reader(pkl_file_path)
+        return stream_keys
     
     def create_base_ts_to_stream_ts_map(self, stream_keys):
         base_ts_to_stream_ts = {}
@@ -299,6 +394,9 @@ class SynchronizationServiceV2:
         raw_base_stream_frames_dir = os.path.join(self.raw_base_stream_directory, const.FRAMES)
         if os.path.exists(frames_zip_file_path):
             extract_zip_file(frames_zip_file_path, raw_base_stream_frames_dir, self.recording_id)
+        else:
+            # Recordings with encoded PV get their frames and poses decoded here
+            EncodedPvService(self.raw_data_directory, self.recording_id).prepare_frames()
         
         self.ts_to_base_stream_frame = get_ts_to_stream_frame(raw_base_stream_frames_dir, const.JPEG_EXTENSION, -1)
         self.base_stream_keys = sorted(self.ts_to_base_stream_frame.keys())
@@ -355,7 +453,13 @@ class SynchronizationServiceV2:
             logger.info(f"[{self.recording_id}] Skipping creation of recording base stream mp4 file")
         
         for stream_name in self.synchronize_streams:
-            if stream_name == const.DEPTH_AHAT:
+            if stream_name == const.DEPTH_AHAT and os.path.exists(get_frame_container_path(
+                    os.path.join(self.raw_data_directory, const.DEPTH_AHAT), self.recording.id, const.DEPTH_AHAT,
+                    const.DEPTH
+            )):
+                # Depth and AB frames recorded into frame containers
+                self.sync_depth_ahat_frame_containers()
+            elif stream_name == const.DEPTH_AHAT:
                 # Files and directories
                 raw_depth_parent_directory = os.path.join(self.raw_data_directory, const.DEPTH_AHAT)
                 sync_depth_parent_directory = os.path.join(self.sync_data_directory, const.DEPTH_AHAT)
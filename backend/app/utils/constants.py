@@ -127,6 +127,13 @@ class Post_Processing_Constants:
 	AHAT = "ahat"
 	FRAMES = "frames"
 	LONGTHROW = "longthrow"
+	PNG_EXTENSION = ".png"
+	# Files still being written, e.g. the open segment of a raw capture
+	PART_FILE_EXTENSION = ".part"
+	# Files of a raw capture that change while it is recorded: the manifest of a segmented stream lists the closed
+	# segments and the index of a stream grows with it
+	MANIFEST_FILE_EXTENSION = ".manifest"
+	INDEX_FILE_EXTENSION = ".idx"
 	
 	NAS_DATA_ROOT_DIR = "/NetBackup/PTG"
 	HOLOLENS_INFO_FILE_NAME = 'Hololens2Info.dat'
@@ -141,8 +148,87 @@ class Hololens_Constants:
 
 	REDIS_HOST = "localhost"
 	REDIS_PORT = 6379
+	REDIS_DB = 0
 	REDIS_MAX_CONNECTIONS = 20
 
+	# Producer pushes packets to redis in batches, a batch is flushed when it is full or when
+	# the oldest packet in it has waited for more than the maximum delay (in seconds)
+	REDIS_PUSH_BATCHING = True
+	REDIS_PUSH_BATCH_MAX_DELAY = 0.03
+	REDIS_PUSH_BATCH_DEFAULT_MAX_PACKETS = 8
+	REDIS_PUSH_STATISTICS_REPORT_PERIOD = 30
+
+	# The Producer receives every stream in its own thread, or all of them as tasks of one asyncio event loop
+	PRODUCER_ASYNCIO = False
+
+	# Packets are either passed through redis to the Consumer, which stores them while recording,
+	# or written as they are received to one hl2ss_io file per stream and stored after the recording
+	CAPTURE_MODE_REDIS = "redis"
+	CAPTURE_MODE_RAW_FILES = "raw_files"
+	CAPTURE_MODE = CAPTURE_MODE_REDIS
+	RAW_CAPTURE_EXTENSION = ".bin"
+	# Payloads of the raw capture files are compressed while recording when set to hl2ss_io.Compression.ZSTD (1)
+	# or hl2ss_io.Compression.LZ4 (2), which needs the zstandard or lz4 package, readers decompress them transparently
+	RAW_CAPTURE_COMPRESSION = 0
+	# Raw capture files roll over to a new segment after this many seconds or bytes, None writes a single file
+	# Closed segments are listed in <file>.manifest and can be processed or transferred while recording
+	RAW_CAPTURE_SEGMENT_DURATION = None
+	RAW_CAPTURE_SEGMENT_SIZE = None
+
+	# Packets travel from the Producer to the Consumer either through a redis list or a redis stream per stream
+	# Redis streams let several Consumer workers, in one process or several, share a stream through a consumer group
+	CAPTURE_TRANSPORT_LIST = "list"
+	CAPTURE_TRANSPORT_STREAM = "stream"
+	CAPTURE_TRANSPORT = CAPTURE_TRANSPORT_LIST
+
+	REDIS_STREAM_CONSUMER_GROUP = "consumers"
+	REDIS_STREAM_ENTRY_FIELD = "packet"
+	REDIS_STREAM_READ_COUNT = 4
+	# Entries read but not acknowledged for this long (in seconds) are reclaimed by the other workers
+	REDIS_STREAM_RECLAIM_IDLE_TIME = 30
+	# Entries that failed to be processed this many times are moved to the dead-letter stream of their queue,
+	# where they are kept for inspection until it expires (in seconds)
+	REDIS_STREAM_MAX_DELIVERIES = 3
+	# Queues left with entries by a recording process that died are not resumed, nothing starts a Consumer for them
+	# At startup they are kept for this long (in seconds) for their packets to be recovered by hand, then expire
+	# A stream queue counts as orphaned once none of its consumers has read from it for REDIS_ORPHANED_QUEUE_IDLE_TIME
+	REDIS_ORPHANED_QUEUE_EXPIRE_TIME = 24 * 3600
+	REDIS_ORPHANED_QUEUE_IDLE_TIME = 60
+	REDIS_DEAD_LETTER_KEY_PREFIX = "capture:dead:"
+	REDIS_DEAD_LETTER_EXPIRE_TIME = 7 * 24 * 3600
+
+	# PV and depth frames are encoded to JPEG/PNG in a pool of worker processes, 0 encodes them in the Consumer threads
+	# At most FRAME_ENCODING_MAX_IN_FLIGHT frames are queued or being encoded at any time
+	FRAME_ENCODING_WORKERS = 6
+	FRAME_ENCODING_MAX_IN_FLIGHT = 32
+
+	# Once a redis queue holds more packets than its high watermark, the Producer spills the packets of that stream
+	# to append-only hl2ss_io files until the queue is back under its low watermark
+	# The Consumer drains the closed spill files whenever its redis queue is empty
+	SPILL = "spill"
+	SPILL_SEGMENT_EXTENSION = ".bin"
+	SPILL_SEGMENT_PART_EXTENSION = ".part"
+	SPILL_READ_CHUNK_SIZE = 4 * 1024 * 1024
+	REDIS_QUEUE_DEFAULT_HIGH_WATERMARK = 20000
+	REDIS_QUEUE_DEFAULT_LOW_WATERMARK = 10000
+
+	# Once capture stops, the Consumer drains the backlog of the recording with extra workers per stream
+	# and publishes the drain progress to redis, where it expires unless refreshed (in seconds)
+	REDIS_DRAIN_PROGRESS_KEY_PREFIX = "capture:drain:"
+	REDIS_DRAIN_PROGRESS_EXPIRE_TIME = 60
+	REDIS_DRAIN_PROGRESS_DONE_EXPIRE_TIME = 3600
+	DRAIN_PROGRESS_UPDATE_PERIOD = 1
+	DRAIN_PROGRESS_REPORT_PERIOD = 10
+
+	# Per-stream receive and write rates, queue depth and timestamp gaps of a recording being captured
+	# are published to redis every period (in seconds) and expire once the capture is over
+	REDIS_TELEMETRY_KEY_PREFIX = "capture:telemetry:"
+	REDIS_TELEMETRY_EXPIRE_TIME = 10
+	TELEMETRY_PUBLISH_PERIOD = 1
+	TELEMETRY_FALLING_BEHIND_QUEUE_DEPTH = 50
+	TELEMETRY_PROMETHEUS_EXPORT = True
+	TELEMETRY_PROMETHEUS_PREFIX = "hololens_capture_"
+
 	PHOTOVIDEO = "pv"
 	MICROPHONE = "mc"
 	SPATIAL = "spatial"
@@ -157,6 +243,46 @@ class Hololens_Constants:
 	VLC_RIGHTFRONT = "vlc_rightleft"
 	VLC_RIGHTRIGHT = "vlc_rightright"
 
+	# Expected packet rate of the streams checked for timestamp gaps, the packet rate of the other streams varies
+	TELEMETRY_STREAM_FPS = {
+		PHOTOVIDEO: 30,
+		DEPTH_AHAT: 45,
+		SPATIAL: 60,
+	}
+
+	REDIS_PUSH_BATCH_MAX_PACKETS = {
+		PHOTOVIDEO: 4,
+		DEPTH_AHAT: 4,
+		MICROPHONE: 16,
+		SPATIAL: 16,
+		IMU_ACCELEROMETER: 8,
+		IMU_GYROSCOPE: 8,
+		IMU_MAGNETOMETER: 8,
+	}
+
+	# Number of Consumer workers per stream when the stream transport is used, other streams use a single worker
+	CONSUMER_STREAM_WORKERS = {
+		PHOTOVIDEO: 3,
+		DEPTH_AHAT: 2,
+	}
+
+	# Extra Consumer workers per stream while draining the backlog after capture stopped
+	# Streams that are not listed keep their packets in order with their single worker
+	CONSUMER_DRAIN_WORKERS = {
+		PHOTOVIDEO: 3,
+		DEPTH_AHAT: 2,
+	}
+
+	# A raw PV frame takes ~350 KB and an AHAT frame ~1 MB in redis
+	REDIS_QUEUE_HIGH_WATERMARK = {
+		PHOTOVIDEO: 1200,
+		DEPTH_AHAT: 400,
+	}
+	REDIS_QUEUE_LOW_WATERMARK = {
+		PHOTOVIDEO: 600,
+		DEPTH_AHAT: 200,
+	}
+
 	AB = "ab"
 	DEPTH = "depth"
 	FRAMES = "frames"
@@ -166,6 +292,17 @@ class Hololens_Constants:
 	PV_FRAMERATE = 30
 	PV_VIDEO_PROFILE_RAW = hl2ss.VideoProfile.RAW
 	PV_VIDEO_BITRATE_RAW = 250 * 1024 * 1024
+	# PV is either received as RAW NV12 frames, stored by the Consumer as JPEG frames,
+	# or received encoded and stored as it is in a raw capture file, frames are decoded when they are needed
+	PV_CAPTURE_FORMAT_RAW = "raw"
+	PV_CAPTURE_FORMAT_ENCODED = "encoded"
+	PV_CAPTURE_FORMAT = PV_CAPTURE_FORMAT_RAW
+	PV_VIDEO_PROFILE_ENCODED = hl2ss.VideoProfile.H264_MAIN
+	PV_VIDEO_BITRATE_ENCODED = hl2ss.get_video_codec_bitrate(
+		PV_FRAME_WIDTH, PV_FRAME_HEIGHT, PV_FRAMERATE, hl2ss.get_video_codec_default_factor(PV_VIDEO_PROFILE_ENCODED)
+	)
+	PV_DECODE_FORMAT = "bgr24"
+	MP4_EXTENSION = ".mp4"
 
 	AHAT_PROFILE_RAW = hl2ss.VideoProfile.RAW
 	AHAT_BITRATE_RAW = 1
@@ -191,8 +328,33 @@ class Hololens_Constants:
 	DEPTH_AHAT_POSE_WRITER = "depth_ahat_pose_writer"
 	PV_POSE_WRITER = "pv_pose_writer"
 
+	# Pose, spatial input and IMU packets are stored either as appended pickles or as fixed-size records
+	STREAM_RECORD_STORAGE_PICKLE = "pickle"
+	STREAM_RECORD_STORAGE_RECORD = "record"
+	STREAM_RECORD_STORAGE = STREAM_RECORD_STORAGE_RECORD
+
+	# AHAT depth and AB frames are stored either as one PNG per frame or in append-only frame containers
+	DEPTH_AHAT_STORAGE_PNG = "png"
+	DEPTH_AHAT_STORAGE_CONTAINER = "container"
+	DEPTH_AHAT_STORAGE = DEPTH_AHAT_STORAGE_CONTAINER
+	DEPTH_AHAT_DEPTH_WRITER = "depth_ahat_depth_writer"
+	DEPTH_AHAT_AB_WRITER = "depth_ahat_ab_writer"
+
 	PV_STRIDE = hl2ss.get_nv12_stride(PV_FRAME_WIDTH)
 
+	# Spatial mapping meshes are captured alongside the streams when enabled, the observed surfaces are polled
+	# every period (in seconds) and only the surfaces updated since the previous poll are downloaded
+	SPATIAL_MAPPING = "spatial_mapping"
+	SM_CAPTURE_ENABLED = False
+	SM_POLL_PERIOD = 2
+	SM_VOLUME_CENTER = [0.0, 0.0, 0.0]
+	SM_VOLUME_RADIUS = 5.0
+	SM_MAX_TRIANGLES_PER_CUBIC_METER = 1000
+	SM_MESH_THREADS = 2
+	SM_VERTEX_POSITION_FORMAT = hl2ss.SM_VertexPositionFormat.R32G32B32A32Float
+	SM_TRIANGLE_INDEX_FORMAT = hl2ss.SM_TriangleIndexFormat.R32Uint
+	SM_VERTEX_NORMAL_FORMAT = hl2ss.SM_VertexNormalFormat.R32G32B32A32Float
+
 
 # # ---------------------------------------------------------------------------------------
 # # ------------------------ GO PRO SERVICE PROPERTIES -----------------------------------
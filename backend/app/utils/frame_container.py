@@ -0,0 +1,135 @@
+import os
+import struct
+import threading
+
+import numpy as np
+
+# Append-only container of fixed-size uint16 frames, used for the AHAT depth and AB images
+#
+# <name>.frames : 64 byte header (magic, height, width) followed by height x width uint16 records
+# <name>.frames.idx : one uint64 key per record, the packet timestamp for raw recordings and the
+#                     synchronized frame id for synchronized recordings
+#
+# Records are appended in chunks, data first and keys second, so the index never refers to a record that is
+# not on disk. Readers memory-map the records and only trust as many of them as there are keys.
+
+FRAME_CONTAINER_MAGIC = b'HL2FRMC1'
+FRAME_CONTAINER_HEADER_FORMAT = '<8sII'
+FRAME_CONTAINER_HEADER_SIZE = 64
+FRAME_CONTAINER_EXTENSION = '.frames'
+FRAME_CONTAINER_INDEX_EXTENSION = '.idx'
+FRAME_CONTAINER_DTYPE = np.uint16
+FRAME_CONTAINER_CHUNK_FRAMES = 32
+
+
+def get_frame_container_path(directory, recording_id, stream_name, frame_kind):
+    return os.path.join(directory, f'{recording_id}_{stream_name}_{frame_kind}{FRAME_CONTAINER_EXTENSION}')
+
+
+def _pack_header(height, width):
+    header = struct.pack(FRAME_CONTAINER_HEADER_FORMAT, FRAME_CONTAINER_MAGIC, height, width)
+    return header + bytes(FRAME_CONTAINER_HEADER_SIZE - len(header))
+
+
+def _unpack_header(header):
+    magic, height, width = struct.unpack_from(FRAME_CONTAINER_HEADER_FORMAT, header)
+    if magic != FRAME_CONTAINER_MAGIC:
+        raise ValueError(f'Not a frame container, magic is {magic}')
+    return height, width
+
+
+class FrameContainerWriter:
+
+    def __init__(self, file_path, height, width, chunk_frames=FRAME_CONTAINER_CHUNK_FRAMES):
+        self.file_path = file_path
+        self.height = height
+        self.width = width
+        self.chunk_frames = chunk_frames
+        self._frames = []
+        self._keys = []
+        # Several Consumer workers of a stream share the writer
+        self._lock = threading.Lock()
+
+        is_new_container = (not os.path.exists(file_path)) or (os.path.getsize(file_path) == 0)
+        if not is_new_container:
+            # Appending to an existing container, e.g. when a recording is resumed
+            with open(file_path, 'rb') as container_file:
+                if _unpack_header(container_file.read(FRAME_CONTAINER_HEADER_SIZE)) != (height, width):
+                    raise ValueError(f'{file_path} holds frames of another shape')
+        self._data_file = open(file_path, 'ab')
+        self._index_file = open(file_path + FRAME_CONTAINER_INDEX_EXTENSION, 'ab')
+        if is_new_container:
+            self._data_file.write(_pack_header(height, width))
+
+    def write(self, key, frame):
+        with self._lock:
+            self._frames.append(np.ascontiguousarray(frame, dtype=FRAME_CONTAINER_DTYPE).tobytes())
+            self._keys.append(key)
+            if len(self._frames) >= self.chunk_frames:
+                self._flush()
+
+    def _flush(self):
+        if not self._frames:
+            return
+        self._data_file.write(b''.join(self._frames))
+        self._data_file.flush()
+        self._index_file.write(np.array(self._keys, dtype=np.uint64).tobytes())
+        self._index_file.flush()
+        self._frames = []
+        self._keys = []
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def truncate(self):
+        # Drops the frames already in the container, e.g. those left by an earlier run that failed
+        with self._lock:
+            self._frames = []
+            self._keys = []
+            self._data_file.truncate(FRAME_CONTAINER_HEADER_SIZE)
+            self._index_file.truncate(0)
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._data_file.close()
+            self._index_file.close()
+
+
+class FrameContainerReader:
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        with open(file_path, 'rb') as container_file:
+            self.height, self.width = _unpack_header(container_file.read(FRAME_CONTAINER_HEADER_SIZE))
+
+        frame_size = self.height * self.width * np.dtype(FRAME_CONTAINER_DTYPE).itemsize
+        num_frames = (os.path.getsize(file_path) - FRAME_CONTAINER_HEADER_SIZE) // frame_size
+        keys = np.fromfile(file_path + FRAME_CONTAINER_INDEX_EXTENSION, dtype=np.uint64)
+        num_frames = min(num_frames, len(keys))
+
+        self.keys = keys[:num_frames]
+        self.frames = np.memmap(
+            file_path, dtype=FRAME_CONTAINER_DTYPE, mode='r', offset=FRAME_CONTAINER_HEADER_SIZE,
+            shape=(num_frames, self.height, self.width)
+        ) if (num_frames > 0) else np.zeros((0, self.height, self.width), dtype=FRAME_CONTAINER_DTYPE)
+
+        # Records are appended in arrival order, which is not always key order
+        self._sorted_indices = np.argsort(self.keys, kind='stable')
+        self._sorted_keys = self.keys[self._sorted_indices]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def get_sorted_keys(self):
+        return [int(key) for key in self._sorted_keys]
+
+    def get_frame(self, index):
+        return self.frames[index]
+
+    def get_frame_by_key(self, key):
+        position = np.searchsorted(self._sorted_keys, key)
+        if (position >= len(self._sorted_keys)) or (self._sorted_keys[position] != key):
+            return None
+        return self.frames[self._sorted_indices[position]]
@@ -0,0 +1,212 @@
+import os
+import struct
+import threading
+
+import numpy as np
+
+from ..hololens import hl2ss
+
+# Append-only file of spatial mapping surface meshes, every downloaded version of a surface is kept
+#
+# <name>.mesh : 64 byte header (magic, vertex position, triangle index and vertex normal formats) followed by one
+#               entry per surface version: vertex position scale, pose, bounds, vertex positions, triangle indices
+#               and vertex normals, as received from hl2ss.ipc_sm
+# <name>.mesh.idx : one MESH_INDEX_DTYPE record per entry, with the surface id, its version and update time and
+#                   where the buffers of the entry are in the mesh file
+#
+# Surfaces that are no longer observed get an index record with the REMOVED flag and no data.
+# Entries are written data first and index second, so the index never refers to data that is not on disk.
+
+MESH_FILE_MAGIC = b'HL2MESH1'
+MESH_FILE_HEADER_FORMAT = '<8sIII'
+MESH_FILE_HEADER_SIZE = 64
+MESH_FILE_EXTENSION = '.mesh'
+MESH_FILE_INDEX_EXTENSION = '.idx'
+
+MESH_ENTRY_REMOVED = 1
+
+MESH_SCALE_SIZE = 3 * 4
+MESH_POSE_SIZE = 16 * 4
+
+MESH_INDEX_DTYPE = np.dtype([
+    ('surface_id', 'u1', (16,)),
+    ('update_time', '<u8'),
+    ('version', '<u4'),
+    ('flags', '<u4'),
+    ('offset', '<u8'),
+    ('bounds_size', '<u4'),
+    ('vertex_positions_size', '<u4'),
+    ('triangle_indices_size', '<u4'),
+    ('vertex_normals_size', '<u4'),
+])
+
+
+def get_mesh_file_path(directory, recording_id):
+    return os.path.join(directory, f'{recording_id}_spatial_mapping{MESH_FILE_EXTENSION}')
+
+
+def _pack_header(vertex_position_format, triangle_index_format, vertex_normal_format):
+    header = struct.pack(
+        MESH_FILE_HEADER_FORMAT, MESH_FILE_MAGIC, vertex_position_format, triangle_index_format, vertex_normal_format
+    )
+    return header + bytes(MESH_FILE_HEADER_SIZE - len(header))
+
+
+def _unpack_header(header):
+    magic, vertex_position_format, triangle_index_format, vertex_normal_format = struct.unpack_from(
+        MESH_FILE_HEADER_FORMAT, header
+    )
+    if magic != MESH_FILE_MAGIC:
+        raise ValueError(f'Not a mesh file, magic is {magic}')
+    return vertex_position_format, triangle_index_format, vertex_normal_format
+
+
+def _get_entry_size(index_record):
+    if index_record['flags'] & MESH_ENTRY_REMOVED:
+        return 0
+    return MESH_SCALE_SIZE + MESH_POSE_SIZE + int(index_record['bounds_size']) + \
+        int(index_record['vertex_positions_size']) + int(index_record['triangle_indices_size']) + \
+        int(index_record['vertex_normals_size'])
+
+
+def _read_index(file_path):
+    # Only the index records whose data is entirely on disk
+    index_file_path = file_path + MESH_FILE_INDEX_EXTENSION
+    if not os.path.exists(index_file_path):
+        return np.zeros(0, dtype=MESH_INDEX_DTYPE)
+    index = np.fromfile(index_file_path, dtype=MESH_INDEX_DTYPE)
+    data_size = os.path.getsize(file_path)
+    num_entries = len(index)
+    while (num_entries > 0) and (int(index[num_entries - 1]['offset']) + _get_entry_size(index[num_entries - 1]) > data_size):
+        num_entries -= 1
+    return index[:num_entries]
+
+
+class MeshFileWriter:
+
+    def __init__(self, file_path, vertex_position_format, triangle_index_format, vertex_normal_format):
+        self.file_path = file_path
+        self.formats = (vertex_position_format, triangle_index_format, vertex_normal_format)
+        self._lock = threading.Lock()
+        # Last version written of every surface, versions start at 0
+        self._versions = {}
+
+        is_new_file = (not os.path.exists(file_path)) or (os.path.getsize(file_path) == 0)
+        if not is_new_file:
+            # Appending to an existing mesh file, e.g. when a recording is resumed
+            with open(file_path, 'rb') as mesh_file:
+                if _unpack_header(mesh_file.read(MESH_FILE_HEADER_SIZE)) != self.formats:
+                    raise ValueError(f'{file_path} holds meshes of other formats')
+            for index_record in _read_index(file_path):
+                self._versions[index_record['surface_id'].tobytes()] = int(index_record['version'])
+        self._data_file = open(file_path, 'ab')
+        self._index_file = open(file_path + MESH_FILE_INDEX_EXTENSION, 'ab')
+        if is_new_file:
+            self._data_file.write(_pack_header(*self.formats))
+            self._data_file.flush()
+
+    def get_version(self, surface_id):
+        return self._versions.get(surface_id, None)
+
+    def _append(self, surface_id, update_time, flags, buffers):
+        version = self._versions.get(surface_id, -1) + 1
+        index_record = np.zeros(1, dtype=MESH_INDEX_DTYPE)
+        index_record['surface_id'] = np.frombuffer(surface_id, dtype=np.uint8)
+        index_record['update_time'] = update_time
+        index_record['version'] = version
+        index_record['flags'] = flags
+        index_record['offset'] = self._data_file.tell()
+        if buffers is not None:
+            _, _, bounds, vertex_positions, triangle_indices, vertex_normals = buffers
+            index_record['bounds_size'] = len(bounds)
+            index_record['vertex_positions_size'] = len(vertex_positions)
+            index_record['triangle_indices_size'] = len(triangle_indices)
+            index_record['vertex_normals_size'] = len(vertex_normals)
+            self._data_file.write(b''.join(buffers))
+            self._data_file.flush()
+        self._index_file.write(index_record.tobytes())
+        self._index_file.flush()
+        self._versions[surface_id] = version
+        return version
+
+    def write(self, surface_id, update_time, mesh):
+        # mesh as returned by ipc_sm.get_meshes, before it is unpacked
+        buffers = (
+            mesh.vertex_position_scale, mesh.pose, mesh.bounds,
+            mesh.vertex_positions, mesh.triangle_indices, mesh.vertex_normals
+        )
+        with self._lock:
+            return self._append(surface_id, update_time, 0, buffers)
+
+    def write_removed(self, surface_id, update_time):
+        with self._lock:
+            return self._append(surface_id, update_time, MESH_ENTRY_REMOVED, None)
+
+    def close(self):
+        with self._lock:
+            self._data_file.close()
+            self._index_file.close()
+
+
+class MeshFileReader:
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        with open(file_path, 'rb') as mesh_file:
+            self.formats = _unpack_header(mesh_file.read(MESH_FILE_HEADER_SIZE))
+        self.index = _read_index(file_path)
+        self.data = np.memmap(file_path, dtype=np.uint8, mode='r') if (len(self.index) > 0) else None
+
+        self._surface_entries = {}
+        for entry_index, index_record in enumerate(self.index):
+            self._surface_entries.setdefault(index_record['surface_id'].tobytes(), []).append(entry_index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def get_surface_ids(self):
+        return list(self._surface_entries.keys())
+
+    def get_versions(self, surface_id):
+        # Index records of every version of the surface, oldest first
+        return self.index[self._surface_entries.get(surface_id, [])]
+
+    def get_mesh(self, entry_index):
+        index_record = self.index[entry_index]
+        if index_record['flags'] & MESH_ENTRY_REMOVED:
+            return None
+        sizes = [
+            MESH_SCALE_SIZE, MESH_POSE_SIZE, int(index_record['bounds_size']), int(index_record['vertex_positions_size']),
+            int(index_record['triangle_indices_size']), int(index_record['vertex_normals_size'])
+        ]
+        buffers = []
+        offset = int(index_record['offset'])
+        for size in sizes:
+            buffers.append(self.data[offset:(offset + size)].tobytes())
+            offset += size
+        mesh = hl2ss._sm_mesh(*buffers)
+        mesh.unpack(*self.formats)
+        return mesh
+
+    def get_surface_mesh(self, surface_id, version=None):
+        # Latest version of the surface unless a version is given, None when the surface was removed
+        for entry_index in reversed(self._surface_entries.get(surface_id, [])):
+            if (version is None) or (int(self.index[entry_index]['version']) == version):
+                return self.get_mesh(entry_index)
+        return None
+
+    def get_meshes(self, update_time=None):
+        # Meshes of every surface observed at update_time, or at the end of the recording
+        meshes = {}
+        for surface_id, entry_indices in self._surface_entries.items():
+            selected_entry_index = None
+            for entry_index in entry_indices:
+                if (update_time is not None) and (int(self.index[entry_index]['update_time']) > update_time):
+                    break
+                selected_entry_index = entry_index
+            if selected_entry_index is None:
+                continue
+            mesh = self.get_mesh(selected_entry_index)
+            if mesh is not None:
+                meshes[surface_id] = mesh
+        return meshes
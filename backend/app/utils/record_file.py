@@ -0,0 +1,241 @@
+import os
+import struct
+import threading
+
+import numpy as np
+
+from ..hololens import hl2ss
+from .logger_config import get_logger
+
+logger = get_logger(__name__)
+
+# Append-only file of fixed-size records, used for the pose, spatial input and IMU streams
+#
+# <name>.rec : 64 byte header (magic, record kind, record size) followed by records of the kind
+#
+# POSE    : uint64 timestamp, float32 4x4 pose
+# SPATIAL : uint64 timestamp, raw spatial input payload
+# IMU     : uint64 timestamp of the packet, one packed hl2ss IMU sample, so a packet is one record per sample
+#           The poses of the IMU packets go into a POSE record file next to it, <name>_pose.rec
+#
+# Every packet is appended with a single write, readers memory-map the file and ignore a trailing partial record.
+
+RECORD_FILE_MAGIC = b'HL2RECF1'
+RECORD_FILE_HEADER_FORMAT = '<8sII'
+RECORD_FILE_HEADER_SIZE = 64
+RECORD_FILE_EXTENSION = '.rec'
+RECORD_FILE_POSE_SUFFIX = '_pose'
+
+RECORD_KIND_POSE = 1
+RECORD_KIND_SPATIAL = 2
+RECORD_KIND_IMU = 3
+
+SPATIAL_PAYLOAD_SIZE = hl2ss._Mode0Layout_SI.END_HAND_RIGHT
+
+POSE_RECORD_DTYPE = np.dtype([('timestamp', '<u8'), ('pose', '<f4', (4, 4))])
+SPATIAL_RECORD_DTYPE = np.dtype([('timestamp', '<u8'), ('payload', 'u1', (SPATIAL_PAYLOAD_SIZE,))])
+IMU_SAMPLE_DTYPE = hl2ss.RM_IMU_SAMPLE_DTYPE
+IMU_RECORD_DTYPE = np.dtype([('timestamp', '<u8'), ('sample', IMU_SAMPLE_DTYPE)])
+
+RECORD_DTYPES = {
+    RECORD_KIND_POSE: POSE_RECORD_DTYPE,
+    RECORD_KIND_SPATIAL: SPATIAL_RECORD_DTYPE,
+    RECORD_KIND_IMU: IMU_RECORD_DTYPE,
+}
+
+
+def get_record_file_path(pkl_file_path):
+    # Record files take the place of the pickle files of the same name
+    return os.path.splitext(pkl_file_path)[0] + RECORD_FILE_EXTENSION
+
+
+def get_pose_record_file_path(record_file_path):
+    return os.path.splitext(record_file_path)[0] + RECORD_FILE_POSE_SUFFIX + RECORD_FILE_EXTENSION
+
+
+def _pack_header(record_kind):
+    header = struct.pack(
+        RECORD_FILE_HEADER_FORMAT, RECORD_FILE_MAGIC, record_kind, RECORD_DTYPES[record_kind].itemsize
+    )
+    return header + bytes(RECORD_FILE_HEADER_SIZE - len(header))
+
+
+def _unpack_header(header):
+    magic, record_kind, record_size = struct.unpack_from(RECORD_FILE_HEADER_FORMAT, header)
+    if magic != RECORD_FILE_MAGIC:
+        raise ValueError(f'Not a record file, magic is {magic}')
+    if (record_kind not in RECORD_DTYPES) or (RECORD_DTYPES[record_kind].itemsize != record_size):
+        raise ValueError(f'Unknown record kind {record_kind} of size {record_size}')
+    return record_kind
+
+
+def _create_pose_records(timestamps, poses):
+    records = np.empty(len(timestamps), dtype=POSE_RECORD_DTYPE)
+    records['timestamp'] = timestamps
+    for index, pose in enumerate(poses):
+        # Packets received without pose keep a NaN pose, read back as None
+        records['pose'][index] = np.nan if (pose is None) else np.frombuffer(pose, dtype=np.float32).reshape(4, 4)
+    return records
+
+
+def _create_spatial_records(timestamps, payloads):
+    # Packets of another size are skipped, a malformed packet must not stop the writer of the stream
+    valid_records = []
+    for timestamp, payload in zip(timestamps, payloads):
+        if len(payload) == SPATIAL_PAYLOAD_SIZE:
+            valid_records.append((timestamp, payload))
+        else:
+            logger.warning(
+                f'Skipping spatial input packet {timestamp} of {len(payload)} bytes, expected {SPATIAL_PAYLOAD_SIZE}'
+            )
+    records = np.empty(len(valid_records), dtype=SPATIAL_RECORD_DTYPE)
+    for index, (timestamp, payload) in enumerate(valid_records):
+        records['timestamp'][index] = timestamp
+        records['payload'][index] = np.frombuffer(payload, dtype=np.uint8)
+    return records
+
+
+def _create_imu_records(timestamp, payload):
+    samples = np.frombuffer(payload, dtype=IMU_SAMPLE_DTYPE)
+    records = np.empty(len(samples), dtype=IMU_RECORD_DTYPE)
+    records['timestamp'] = timestamp
+    records['sample'] = samples
+    return records
+
+
+def create_records(record_kind, stream_records):
+    # Converts (timestamp, pose), (timestamp, payload) and (timestamp, (payload, pose)) tuples, as written to the
+    # pickle files, into records of the kind. The IMU poses are returned as pose records
+    timestamps = [stream_record[0] for stream_record in stream_records]
+    if record_kind == RECORD_KIND_POSE:
+        return _create_pose_records(timestamps, [stream_record[1] for stream_record in stream_records]), None
+    if record_kind == RECORD_KIND_SPATIAL:
+        return _create_spatial_records(timestamps, [stream_record[1] for stream_record in stream_records]), None
+    records = [_create_imu_records(timestamp, payload) for timestamp, (payload, _) in stream_records]
+    pose_records = _create_pose_records(timestamps, [pose for _, (_, pose) in stream_records])
+    return (np.concatenate(records) if records else np.zeros(0, dtype=IMU_RECORD_DTYPE)), pose_records
+
+
+class RecordFileWriter:
+    # Takes the same records as the pickle FileWriter of the Consumer
+
+    def __init__(self, file_path, record_kind, is_shared=False):
+        self.file_path = file_path
+        self.record_kind = record_kind
+        # Shared files are written by several Consumer workers, possibly in different processes
+        # Every packet is flushed on its own so that appends of different processes never interleave
+        self._is_shared = is_shared
+        self._lock = threading.Lock()
+        self._record_file = self._open(file_path, record_kind)
+        self._pose_record_file = self._open(
+            get_pose_record_file_path(file_path), RECORD_KIND_POSE
+        ) if (record_kind == RECORD_KIND_IMU) else None
+
+    @staticmethod
+    def _open(file_path, record_kind):
+        is_new_file = (not os.path.exists(file_path)) or (os.path.getsize(file_path) == 0)
+        if not is_new_file:
+            # Appending to an existing record file, e.g. when a recording is resumed
+            with open(file_path, 'rb') as record_file:
+                if _unpack_header(record_file.read(RECORD_FILE_HEADER_SIZE)) != record_kind:
+                    raise ValueError(f'{file_path} holds records of another kind')
+        record_file = open(file_path, 'ab')
+        if is_new_file:
+            record_file.write(_pack_header(record_kind))
+        return record_file
+
+    def write(self, stream_record):
+        records, pose_records = create_records(self.record_kind, [stream_record])
+        with self._lock:
+            self._record_file.write(records.tobytes())
+            if pose_records is not None:
+                self._pose_record_file.write(pose_records.tobytes())
+            if self._is_shared:
+                self._record_file.flush()
+
+    def truncate(self):
+        # Drops the records already in the file, e.g. those left by an earlier run that failed
+        with self._lock:
+            self._record_file.truncate(RECORD_FILE_HEADER_SIZE)
+            if self._pose_record_file is not None:
+                self._pose_record_file.truncate(RECORD_FILE_HEADER_SIZE)
+
+    def close(self):
+        with self._lock:
+            self._record_file.close()
+            if self._pose_record_file is not None:
+                self._pose_record_file.close()
+
+
+def write_record_file(file_path, record_kind, stream_records):
+    records, pose_records = create_records(record_kind, stream_records)
+    with open(file_path, 'wb') as record_file:
+        record_file.write(_pack_header(record_kind))
+        record_file.write(records.tobytes())
+    if pose_records is not None:
+        with open(get_pose_record_file_path(file_path), 'wb') as pose_record_file:
+            pose_record_file.write(_pack_header(RECORD_KIND_POSE))
+            pose_record_file.write(pose_records.tobytes())
+
+
+def read_record_file(file_path):
+    # Whole stream as a read-only structured array mapped from the file
+    with open(file_path, 'rb') as record_file:
+        record_kind = _unpack_header(record_file.read(RECORD_FILE_HEADER_SIZE))
+    record_dtype = RECORD_DTYPES[record_kind]
+    num_records = (os.path.getsize(file_path) - RECORD_FILE_HEADER_SIZE) // record_dtype.itemsize
+    if num_records <= 0:
+        return record_kind, np.zeros(0, dtype=record_dtype)
+    return record_kind, np.memmap(
+        file_path, dtype=record_dtype, mode='r', offset=RECORD_FILE_HEADER_SIZE, shape=(num_records,)
+    )
+
+
+class RecordFileReader:
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.record_kind, self.records = read_record_file(file_path)
+
+        # Records are appended in arrival order, which is not always timestamp order
+        timestamps = self.records['timestamp']
+        self._sorted_indices = np.argsort(timestamps, kind='stable')
+        self._sorted_timestamps = timestamps[self._sorted_indices]
+        self._unique_timestamps = np.unique(self._sorted_timestamps)
+
+        self._pose_reader = None
+        pose_record_file_path = get_pose_record_file_path(file_path)
+        if (self.record_kind == RECORD_KIND_IMU) and os.path.exists(pose_record_file_path):
+            self._pose_reader = RecordFileReader(pose_record_file_path)
+
+    def __len__(self):
+        return len(self._unique_timestamps)
+
+    def get_sorted_timestamps(self):
+        return [int(timestamp) for timestamp in self._unique_timestamps]
+
+    def get_pose(self, timestamp):
+        position = np.searchsorted(self._sorted_timestamps, timestamp)
+        if (position >= len(self._sorted_timestamps)) or (self._sorted_timestamps[position] != timestamp):
+            return None
+        pose = self.records['pose'][self._sorted_indices[position]]
+        return None if np.isnan(pose).any() else np.array(pose)
+
+    def get_payload(self, timestamp):
+        # Same payload as the pickle files hold for the timestamp, None when there is no record for it
+        begin = np.searchsorted(self._sorted_timestamps, timestamp, side='left')
+        end = np.searchsorted(self._sorted_timestamps, timestamp, side='right')
+        if begin == end:
+            return None
+        if self.record_kind == RECORD_KIND_POSE:
+            return self.get_pose(timestamp)
+        if self.record_kind == RECORD_KIND_SPATIAL:
+            return bytearray(self.records['payload'][self._sorted_indices[begin]].tobytes())
+        samples = self.records['sample'][self._sorted_indices[begin:end]]
+        pose = self._pose_reader.get_pose(timestamp) if (self._pose_reader is not None) else None
+        return bytearray(samples.tobytes()), pose
+
+    def get_imu_batch(self):
+        # All the samples of an IMU record file, in timestamp order, without going through the payloads
+        records = self.records[self._sorted_indices]
+        return hl2ss.unpack_rm_imu_batch(records['sample'], records['timestamp'])
@@ -3,10 +3,14 @@ import os
 import random
 import signal
 
-from flask import Flask, request, jsonify
+import redis
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 
 from app.utils.constants import FlaskServer_constants as const
+from app.utils.constants import Hololens_Constants as hololens_const
+from app.services.capture_drain_service import fetch_capture_drain_progress
+from app.services.capture_telemetry_service import fetch_capture_telemetry, to_prometheus_text
 from app.services.firebase_service import FirebaseService
 from app.models.activity import Activity
 from app.models.error_tag import ErrorTag
@@ -21,9 +25,13 @@ from app.models.annotation import Annotation
 
 app = Flask(__name__)
 cors = CORS(app, resources={r"/*": {"origins": "*"}})
-db_service = FirebaseService()
-#label_studio_service = LabelStudioService()
-setup_logging()
+# Processes spawned by the capture, like the frame encoding workers, import this module again as __mp_main__
+# They only need the functions they run, so the services of the server are not set up for them
+if __name__ != "__mp_main__":
+	db_service = FirebaseService()
+	redis_client = redis.Redis(host=hololens_const.REDIS_HOST, port=hololens_const.REDIS_PORT, db=hololens_const.REDIS_DB)
+	#label_studio_service = LabelStudioService()
+	setup_logging()
 logger = get_logger(__name__)
 
 
@@ -309,6 +317,63 @@ def stop_activity_recording(recording_id, subprocess_id):
 		return "An error occurred: " + str(e), 500
 
 
+# Recordings keep draining their capture backlog after they are stopped
+@app.route("/api/capture/drain", methods=['GET'])
+def fetch_drain_progress():
+	try:
+		return jsonify(fetch_capture_drain_progress(redis_client))
+	except Exception as e:
+		logger.error("An error occurred: " + str(e))
+		return "An error occurred: " + str(e), 500
+
+
+@app.route("/api/capture/drain/<recording_id>", methods=['GET'])
+def fetch_recording_drain_progress(recording_id):
+	try:
+		drain_progress = fetch_capture_drain_progress(redis_client, recording_id)
+		if drain_progress is None:
+			return jsonify({const.STATUS: f"No drain in progress for recording {recording_id}"}), 404
+		return jsonify(drain_progress)
+	except Exception as e:
+		logger.error("An error occurred: " + str(e))
+		return "An error occurred: " + str(e), 500
+
+
+# Per-stream telemetry of the recordings being captured
+@app.route("/api/capture/telemetry", methods=['GET'])
+def fetch_telemetry():
+	try:
+		return jsonify(fetch_capture_telemetry(redis_client))
+	except Exception as e:
+		logger.error("An error occurred: " + str(e))
+		return "An error occurred: " + str(e), 500
+
+
+@app.route("/api/capture/telemetry/metrics", methods=['GET'])
+def fetch_telemetry_metrics():
+	try:
+		if not hololens_const.TELEMETRY_PROMETHEUS_EXPORT:
+			return jsonify({const.STATUS: "Prometheus export is disabled"}), 404
+		return Response(
+			to_prometheus_text(fetch_capture_telemetry(redis_client)), mimetype="text/plain; version=0.0.4"
+		)
+	except Exception as e:
+		logger.error("An error occurred: " + str(e))
+		return "An error occurred: " + str(e), 500
+
+
+@app.route("/api/capture/telemetry/<recording_id>", methods=['GET'])
+def fetch_recording_telemetry(recording_id):
+	try:
+		telemetry = fetch_capture_telemetry(redis_client, recording_id)
+		if telemetry is None:
+			return jsonify({const.STATUS: f"No capture in progress for recording {recording_id}"}), 404
+		return jsonify(telemetry)
+	except Exception as e:
+		logger.error("An error occurred: " + str(e))
+		return "An error occurred: " + str(e), 500
+
+
 # --------------------------------------------------------------------------------------------
 # -------------------------------------- REVIEW -----------------------------------------
 
@@ -0,0 +1,74 @@
+import sys
+import tempfile
+import threading
+import time
+
+import redis
+
+from datacollection.user_app.backend.app.hololens.hl2ss_simulator import simulator
+from datacollection.user_app.backend.app.models.recording import Recording
+from datacollection.user_app.backend.app.services.capture_telemetry_service import fetch_capture_telemetry
+from datacollection.user_app.backend.app.services.hololens_service import HololensService
+
+# Runs a full capture of all streams against the local stream simulator, without a HoloLens
+# Reports the receive and write rates, the redis queue depth and the packets the simulator had to drop
+# Needs a running redis: python capture_simulator_benchmark.py [duration_seconds] [max]
+# Replay a recording instead of synthetic packets with simulator(filenames={port: hl2ss_io file})
+#
+# WARNING: HololensService deletes the queues of finished recordings of its redis database when it starts
+# The benchmark uses its own database, BENCHMARK_REDIS_DB, never point it at the database of the capture server
+
+SIMULATOR_HOST = "127.0.0.1"
+REPORT_PERIOD = 5
+BENCHMARK_REDIS_DB = 15
+
+
+def print_telemetry(recording_id):
+    telemetry = fetch_capture_telemetry(redis.Redis(db=BENCHMARK_REDIS_DB), recording_id)
+    if telemetry is None:
+        return
+    for stream_name, stream_telemetry in telemetry["streams"].items():
+        print(
+            f"  {stream_name}: receive {stream_telemetry['receive_fps']} fps, "
+            f"write {stream_telemetry['write_fps']} fps, "
+            f"queue depth {stream_telemetry['queue_depth']}, gaps {stream_telemetry['gap_count']}"
+        )
+
+
+def run_benchmark(duration, realtime):
+    recording = Recording(id="simulator_benchmark", activity_id=0, is_error=False, steps=[])
+    recording.recording_info.hololens_info.device_ip = SIMULATOR_HOST
+    hololens_service = HololensService(redis_db=BENCHMARK_REDIS_DB)
+
+    with simulator(SIMULATOR_HOST, realtime=realtime) as stream_simulator, \
+            tempfile.TemporaryDirectory() as data_dir:
+        record_thread = threading.Thread(target=hololens_service.start_recording, args=(recording, data_dir))
+        record_thread.start()
+
+        start_time = time.perf_counter()
+        while (time.perf_counter() - start_time) < duration:
+            time.sleep(REPORT_PERIOD)
+            print(f"{time.perf_counter() - start_time:.0f} s")
+            print_telemetry(recording.get_recording_id())
+
+        stop_time = time.perf_counter()
+        # Returns once the remaining packets are drained
+        hololens_service.stop_recording()
+        drain_time = time.perf_counter() - stop_time
+        record_thread.join()
+        elapsed_time = stop_time - start_time
+
+        print(f"Drained the remaining packets in {drain_time:.1f} s")
+        for port_name, statistics in stream_simulator.get_statistics().items():
+            if statistics["connections"] == 0:
+                continue
+            print(
+                f"{port_name}: sent {statistics['sent_packets'] / elapsed_time:.1f} packets/s, "
+                f"{statistics['sent_bytes'] / elapsed_time / (1024 * 1024):.1f} MB/s, "
+                f"dropped {statistics['dropped_packets']} packets"
+            )
+
+
+if __name__ == '__main__':
+    benchmark_duration = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    run_benchmark(benchmark_duration, realtime=(len(sys.argv) < 3) or (sys.argv[2] != "max"))
@@ -0,0 +1,99 @@
+import threading
+
+import redis
+
+from datacollection.user_app.backend.app.services.capture_transport import (
+    RedisListTransport, RedisStreamTransport, create_consumer_name
+)
+
+# Runs against a local redis-server, or against fakeredis when it is installed
+
+
+def create_redis_client():
+    try:
+        import fakeredis
+        return fakeredis.FakeRedis()
+    except ImportError:
+        return redis.Redis(host="localhost", port=6379)
+
+
+def push_packets(redis_client, transport, queue_name, packets):
+    transport.create_queue(queue_name)
+    pipeline = redis_client.pipeline(transaction=False)
+    transport.push(pipeline, queue_name, packets)
+    pipeline.execute()
+
+
+def check_list_transport_keeps_order(redis_client):
+    queue_name = "test_list_transport"
+    redis_client.delete(queue_name)
+    transport = RedisListTransport(redis_client)
+    packets = [f"packet_{index}".encode() for index in range(10)]
+    push_packets(redis_client, transport, queue_name, packets)
+
+    received_packets = []
+    while True:
+        stream_entries = transport.read(queue_name, create_consumer_name(queue_name, 0), timeout=1)
+        if not stream_entries:
+            break
+        received_packets.extend(stream_data for _, stream_data in stream_entries)
+    assert received_packets == packets
+
+
+def check_stream_transport_shares_entries_between_workers(redis_client):
+    queue_name = "test_stream_transport_workers"
+    redis_client.delete(queue_name)
+    packets = [f"packet_{index}".encode() for index in range(100)]
+    push_packets(redis_client, RedisStreamTransport(redis_client), queue_name, packets)
+
+    received_packets = [[] for _ in range(3)]
+
+    def process_entries(worker_index):
+        transport = RedisStreamTransport(redis_client)
+        consumer_name = create_consumer_name(queue_name, worker_index)
+        while True:
+            stream_entries = transport.read(queue_name, consumer_name, timeout=1)
+            if not stream_entries:
+                break
+            received_packets[worker_index].extend(stream_data for _, stream_data in stream_entries)
+            transport.acknowledge(queue_name, [entry_id for entry_id, _ in stream_entries])
+
+    worker_threads = [threading.Thread(target=process_entries, args=(index,)) for index in range(3)]
+    for worker_thread in worker_threads:
+        worker_thread.start()
+    for worker_thread in worker_threads:
+        worker_thread.join()
+
+    all_received_packets = [packet for worker_packets in received_packets for packet in worker_packets]
+    assert sorted(all_received_packets) == sorted(packets)
+    assert not RedisStreamTransport(redis_client).has_pending(queue_name)
+    assert redis_client.xlen(queue_name) == 0
+
+
+def check_stream_transport_reclaims_entries_of_crashed_worker(redis_client):
+    queue_name = "test_stream_transport_reclaim"
+    redis_client.delete(queue_name)
+    packets = [f"packet_{index}".encode() for index in range(4)]
+    push_packets(redis_client, RedisStreamTransport(redis_client), queue_name, packets)
+
+    # Worker reads the entries and dies before acknowledging them
+    crashed_transport = RedisStreamTransport(redis_client)
+    crashed_entries = crashed_transport.read(queue_name, "crashed-worker", timeout=1)
+    assert len(crashed_entries) == len(packets)
+    assert crashed_transport.has_pending(queue_name)
+
+    transport = RedisStreamTransport(redis_client)
+    transport.reclaim_idle_time = 0
+    reclaimed_entries = transport.read(queue_name, create_consumer_name(queue_name, 0), timeout=1)
+    assert [stream_data for _, stream_data in reclaimed_entries] == packets
+
+    transport.acknowledge(queue_name, [entry_id for entry_id, _ in reclaimed_entries])
+    assert not transport.has_pending(queue_name)
+
+
+if __name__ == '__main__':
+    client = create_redis_client()
+    check_list_transport_keeps_order(client)
+    check_stream_transport_shares_entries_between_workers(client)
+    check_stream_transport_reclaims_entries_of_crashed_worker(client)
+    print("Capture transport tests passed")
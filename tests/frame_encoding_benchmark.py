@@ -0,0 +1,93 @@
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from datacollection.user_app.backend.app.hololens import hl2ss
+from datacollection.user_app.backend.app.services.frame_encoding_service import (
+    FrameEncodingPool, encode_depth_ahat_frame, encode_pv_frame
+)
+from datacollection.user_app.backend.app.utils.constants import Hololens_Constants as const
+
+# Measures the sustained frames per second of PV (JPEG) and AHAT (2 x 16-bit PNG) encoding
+# The capture target is 30 fps PV plus 45 fps AHAT
+
+BENCHMARK_DURATION = 30
+PV_TARGET_FPS = 30
+AHAT_TARGET_FPS = 45
+
+
+def create_pv_stream_data():
+    payload_size = int(const.PV_STRIDE * const.PV_FRAME_HEIGHT * 3 / 2) + 16
+    payload = np.random.randint(0, 256, payload_size, dtype=np.uint8).tobytes()
+    return bytes(hl2ss.pack_packet(hl2ss._packet(0, payload, np.eye(4, dtype=np.float32))))
+
+
+def create_depth_ahat_stream_data():
+    # Smooth depth and AB images compress like real ones, random noise would make PNG encoding look slower
+    rows, columns = np.mgrid[0:hl2ss.Parameters_RM_DEPTH_AHAT.HEIGHT, 0:hl2ss.Parameters_RM_DEPTH_AHAT.WIDTH]
+    depth = ((rows + columns) * 4).astype(np.uint16)
+    ab = ((rows * columns) % 1024).astype(np.uint16)
+    payload = depth.tobytes() + ab.tobytes()
+    return bytes(hl2ss.pack_packet(hl2ss._packet(0, payload, np.eye(4, dtype=np.float32))))
+
+
+def encode_stream(encode, encode_function, stream_data, output_directory, file_suffixes, frame_counter, stop_event):
+    frame_index = 0
+    while not stop_event.is_set():
+        file_paths = [os.path.join(output_directory, f'{frame_index}_{suffix}') for suffix in file_suffixes]
+        encode(encode_function, stream_data, *file_paths)
+        frame_index += 1
+        frame_counter[0] = frame_index
+
+
+def run_benchmark(name, encode, finish, output_directory):
+    pv_frame_counter = [0]
+    ahat_frame_counter = [0]
+    stop_event = threading.Event()
+    stream_threads = [
+        threading.Thread(target=encode_stream, args=(
+            encode, encode_pv_frame, create_pv_stream_data(), output_directory,
+            ['pv.jpg'], pv_frame_counter, stop_event
+        )),
+        threading.Thread(target=encode_stream, args=(
+            encode, encode_depth_ahat_frame, create_depth_ahat_stream_data(), output_directory,
+            ['ab.png', 'depth.png'], ahat_frame_counter, stop_event
+        )),
+    ]
+
+    start_time = time.perf_counter()
+    for stream_thread in stream_threads:
+        stream_thread.start()
+    time.sleep(BENCHMARK_DURATION)
+    stop_event.set()
+    for stream_thread in stream_threads:
+        stream_thread.join()
+    finish()
+    elapsed_time = time.perf_counter() - start_time
+
+    pv_fps = pv_frame_counter[0] / elapsed_time
+    ahat_fps = ahat_frame_counter[0] / elapsed_time
+    keeps_up = (pv_fps >= PV_TARGET_FPS) and (ahat_fps >= AHAT_TARGET_FPS)
+    print(f"{name}: PV {pv_fps:.1f} fps, AHAT {ahat_fps:.1f} fps, keeps up with capture: {keeps_up}")
+
+
+if __name__ == '__main__':
+    print(f"CPU count: {os.cpu_count()}")
+    with tempfile.TemporaryDirectory() as inline_directory:
+        run_benchmark(
+            "Inline encoding in consumer threads",
+            lambda encode_function, *args: encode_function(*args),
+            lambda: None,
+            inline_directory
+        )
+    with tempfile.TemporaryDirectory() as pool_directory:
+        pool = FrameEncodingPool()
+        run_benchmark(
+            f"Process pool encoding with {const.FRAME_ENCODING_WORKERS} workers",
+            pool.submit,
+            pool.shutdown,
+            pool_directory
+        )
@@ -0,0 +1,131 @@
+import collections
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from datacollection.user_app.backend.app.hololens import hl2ss, hl2ss_io
+
+# Size and speed of the payload compressions of hl2ss_io
+#
+# python hl2ss_io_compression_benchmark.py [raw capture file]
+#
+# With a raw capture file of a recording (the RAW AHAT or RAW PV file of a kitchen recording) its packets are
+# written again with every compression, otherwise synthetic AHAT frames of a static scene with sensor noise are used
+# Compression runs on a thread pool as in wr_process_rx, reading decompresses in parallel as the readers do
+
+NUM_SYNTHETIC_PACKETS = 900
+COMPRESSIONS = [
+    ("None", hl2ss_io.Compression.NONE),
+    ("zstd", hl2ss_io.Compression.ZSTD),
+    ("lz4", hl2ss_io.Compression.LZ4),
+]
+
+
+def create_synthetic_packets():
+    width = hl2ss.Parameters_RM_DEPTH_AHAT.WIDTH
+    height = hl2ss.Parameters_RM_DEPTH_AHAT.HEIGHT
+    x, y = np.meshgrid(np.arange(width), np.arange(height))
+    depth = (400 + x + 2 * y).astype(np.uint16)
+    ab = (200 + (x * y) % 300).astype(np.uint16)
+    period = hl2ss.TimeBase.HUNDREDS_OF_NANOSECONDS // 45
+    pose = np.eye(4, dtype=np.float32)
+    for index in range(NUM_SYNTHETIC_PACKETS):
+        noise = np.random.randint(0, 4, depth.shape, dtype=np.uint16)
+        payload = (depth + noise).tobytes() + (ab + noise).tobytes()
+        yield hl2ss._packet(index * period, payload, pose)
+
+
+def read_packets(file_path):
+    reader = hl2ss_io.create_rd(False, file_path, hl2ss.ChunkSize.SINGLE_TRANSFER, None)
+    reader.open()
+    header = reader.header
+    packets = []
+    while True:
+        packet = reader.read()
+        if packet is None:
+            break
+        packets.append(hl2ss._packet(packet.timestamp, bytes(packet.payload), packet.pose))
+    reader.close()
+    return header, packets
+
+
+def create_writer(file_path, header, compression):
+    if header.port == hl2ss.StreamPort.PERSONAL_VIDEO:
+        return hl2ss_io.wr_pv(
+            file_path, header.port, header.mode, header.width, header.height, header.framerate, header.profile,
+            header.bitrate, header.user, compression=compression
+        )
+    return hl2ss_io.wr_rm_depth_ahat(
+        file_path, header.port, header.mode, header.profile, header.bitrate, header.user, compression=compression
+    )
+
+
+def write_packets(file_path, header, packets, compression):
+    writer = create_writer(file_path, header, compression)
+    writer.open()
+    pending = collections.deque()
+    with ThreadPoolExecutor(hl2ss_io._COMPRESSION_THREADS) as pool:
+        for packet in packets:
+            pending.append(pool.submit(hl2ss_io.compress_packet, compression, packet))
+            while len(pending) > 0 and pending[0].done():
+                writer.write_compressed(pending.popleft().result())
+        while len(pending) > 0:
+            writer.write_compressed(pending.popleft().result())
+    writer.close()
+
+
+def scan(file_path):
+    reader = hl2ss_io.create_rd(False, file_path, hl2ss.ChunkSize.SINGLE_TRANSFER, None)
+    reader.open()
+    count = 0
+    while reader.read() is not None:
+        count += 1
+    reader.close()
+    return count
+
+
+def is_available(compression):
+    if compression == hl2ss_io.Compression.ZSTD:
+        return hl2ss_io.zstandard is not None
+    if compression == hl2ss_io.Compression.LZ4:
+        return hl2ss_io.lz4 is not None
+    return True
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        header, packets = read_packets(sys.argv[1])
+        print(f"{len(packets)} packets of {sys.argv[1]}")
+    else:
+        header = hl2ss_io._header_rm_depth_ahat(
+            hl2ss_io._MAGIC, hl2ss.StreamPort.RM_DEPTH_AHAT, hl2ss.StreamMode.MODE_1, hl2ss.VideoProfile.RAW, 1, b''
+        )
+        packets = list(create_synthetic_packets())
+        print(f"{len(packets)} synthetic AHAT packets")
+    payload_size = sum(len(packet.payload) for packet in packets)
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name, compression in COMPRESSIONS:
+            if not is_available(compression):
+                print(f"{name}: not installed")
+                continue
+            file_path = os.path.join(directory, f'{name}.bin')
+
+            start_time = time.perf_counter()
+            write_packets(file_path, header, packets, compression)
+            write_time = time.perf_counter() - start_time
+
+            start_time = time.perf_counter()
+            scan(file_path)
+            read_time = time.perf_counter() - start_time
+
+            file_size = os.path.getsize(file_path)
+            print(
+                f"{name}: {file_size / (1024 * 1024):.1f} MB ({payload_size / file_size:.2f}x), "
+                f"write {payload_size / write_time / (1024 * 1024):.1f} MB/s, "
+                f"read {payload_size / read_time / (1024 * 1024):.1f} MB/s"
+            )
@@ -0,0 +1,51 @@
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from datacollection.user_app.backend.app.hololens import hl2ss, hl2ss_io
+
+# Compares scanning a RAW AHAT hl2ss_io file with the chunked reader, which copies every packet out of the file
+# buffer, with the memory-mapped reader, which returns views into the mapping
+# Every packet is touched once (sum of the depth image) so that both readers actually load the data
+
+NUM_PACKETS = 1000
+PAYLOAD_SIZE = hl2ss.Parameters_RM_DEPTH_AHAT.PIXELS * hl2ss._SIZEOF.WORD * 2
+
+
+def write_file(file_path):
+    payload = np.random.randint(0, 256, PAYLOAD_SIZE, dtype=np.uint8).tobytes()
+    pose = np.eye(4, dtype=np.float32)
+    writer = hl2ss_io.wr_rm_depth_ahat(
+        file_path, hl2ss.StreamPort.RM_DEPTH_AHAT, hl2ss.StreamMode.MODE_1, hl2ss.VideoProfile.RAW, 1, b''
+    )
+    writer.open()
+    for index in range(NUM_PACKETS):
+        writer.write(hl2ss._packet(index, payload, pose))
+    writer.close()
+
+
+def scan(file_path, mapped):
+    reader = hl2ss_io.create_rd(False, file_path, 4 * 1024 * 1024, None, mapped=mapped)
+    reader.open()
+    total = 0
+    while True:
+        packet = reader.read()
+        if packet is None:
+            break
+        total += int(np.frombuffer(packet.payload, dtype=np.uint16, count=hl2ss.Parameters_RM_DEPTH_AHAT.PIXELS).sum())
+    reader.close()
+    return total
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as directory:
+        file_path = os.path.join(directory, 'depth_ahat.bin')
+        write_file(file_path)
+        file_size = os.path.getsize(file_path)
+        for name, mapped in [("Chunked reader", False), ("Memory-mapped reader", True)]:
+            start_time = time.perf_counter()
+            scan(file_path, mapped)
+            elapsed_time = time.perf_counter() - start_time
+            print(f"{name}: {file_size / elapsed_time / (1024 * 1024):.1f} MB/s")
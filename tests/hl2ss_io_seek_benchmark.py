@@ -0,0 +1,66 @@
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from datacollection.user_app.backend.app.hololens import hl2ss, hl2ss_io
+
+# Compares cutting a segment out of a 20 minute raw AHAT file by scanning every packet before it
+# with seeking through the timestamp index written next to the file
+
+NUM_PACKETS = 20 * 60 * 45
+PERIOD = hl2ss.TimeBase.HUNDREDS_OF_NANOSECONDS // 45
+PAYLOAD_SIZE = 4096
+
+
+def write_file(file_path):
+    payload = np.random.randint(0, 256, PAYLOAD_SIZE, dtype=np.uint8).tobytes()
+    writer = hl2ss_io.wr_rm_depth_ahat(
+        file_path, hl2ss.StreamPort.RM_DEPTH_AHAT, hl2ss.StreamMode.MODE_1, hl2ss.VideoProfile.RAW, 1, b''
+    )
+    writer.open()
+    pose = np.eye(4, dtype=np.float32)
+    for index in range(NUM_PACKETS):
+        writer.write(hl2ss._packet(index * PERIOD, payload, pose))
+    writer.close()
+
+
+def cut_by_scanning(file_path, timestamp_begin, timestamp_end):
+    reader = hl2ss_io.create_rd(False, file_path, hl2ss.ChunkSize.SINGLE_TRANSFER, None)
+    reader.open()
+    packets = []
+    while True:
+        packet = reader.read()
+        if (packet is None) or (packet.timestamp > timestamp_end):
+            break
+        if packet.timestamp >= timestamp_begin:
+            packets.append(packet)
+    reader.close()
+    return packets
+
+
+def cut_by_seeking(file_path, timestamp_begin, timestamp_end):
+    reader = hl2ss_io.create_rd(False, file_path, hl2ss.ChunkSize.SINGLE_TRANSFER, None)
+    reader.open()
+    packets = list(reader.read_range(timestamp_begin, timestamp_end))
+    reader.close()
+    return packets
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as directory:
+        file_path = os.path.join(directory, 'depth_ahat.bin')
+        write_file(file_path)
+        timestamp_begin = (NUM_PACKETS - 450) * PERIOD
+        timestamp_end = (NUM_PACKETS - 225) * PERIOD
+
+        for name, cut in [("Scanning", cut_by_scanning), ("Seeking", cut_by_seeking)]:
+            start_time = time.perf_counter()
+            packets = cut(file_path, timestamp_begin, timestamp_end)
+            print(f"{name}: {len(packets)} packets in {(time.perf_counter() - start_time) * 1000:.1f} ms")
+
+        os.remove(hl2ss_io.get_index_filename(file_path))
+        start_time = time.perf_counter()
+        hl2ss_io.create_index(file_path)
+        print(f"Building the index of {NUM_PACKETS} packets: {(time.perf_counter() - start_time) * 1000:.1f} ms")
@@ -0,0 +1,88 @@
+import os
+import tempfile
+
+import numpy as np
+
+from datacollection.user_app.backend.app.hololens import hl2ss, hl2ss_io
+
+# Writes a RAW AHAT stream in segments of 2 seconds and reads it back as one stream
+
+NUM_PACKETS = 450
+PERIOD = hl2ss.TimeBase.HUNDREDS_OF_NANOSECONDS // 45
+SEGMENT_DURATION = 2
+
+
+def create_writer(file_path):
+    return hl2ss_io.wr_segmented(
+        hl2ss_io.wr_rm_depth_ahat(
+            file_path, hl2ss.StreamPort.RM_DEPTH_AHAT, hl2ss.StreamMode.MODE_1, hl2ss.VideoProfile.RAW, 1, b''
+        ),
+        segment_duration=SEGMENT_DURATION
+    )
+
+
+def create_packet(index):
+    return hl2ss._packet(index * PERIOD, index.to_bytes(4, 'little') * 256, np.eye(4, dtype=np.float32))
+
+
+def read_timestamps(file_path):
+    reader = hl2ss_io.create_rd(False, file_path, hl2ss.ChunkSize.SINGLE_TRANSFER, None)
+    reader.open()
+    timestamps = []
+    while True:
+        packet = reader.read()
+        if packet is None:
+            break
+        timestamps.append(packet.timestamp)
+    reader.close()
+    return timestamps
+
+
+def check_segments_read_as_one_stream(directory):
+    file_path = os.path.join(directory, 'depth_ahat.bin')
+    writer = create_writer(file_path)
+    writer.open()
+    for index in range(NUM_PACKETS):
+        writer.write(create_packet(index))
+    writer.close()
+
+    manifest = hl2ss_io.read_manifest(file_path)
+    assert manifest['closed']
+    assert len(manifest['segments']) == (NUM_PACKETS * PERIOD) // (SEGMENT_DURATION * hl2ss.TimeBase.HUNDREDS_OF_NANOSECONDS) + 1
+    assert sum(segment['packets'] for segment in manifest['segments']) == NUM_PACKETS
+    for segment in manifest['segments']:
+        assert (segment['last_timestamp'] - segment['first_timestamp']) < SEGMENT_DURATION * hl2ss.TimeBase.HUNDREDS_OF_NANOSECONDS
+    assert read_timestamps(file_path) == [index * PERIOD for index in range(NUM_PACKETS)]
+
+    reader = hl2ss_io.create_rd(False, file_path, hl2ss.ChunkSize.SINGLE_TRANSFER, None)
+    reader.open()
+    packets = list(reader.read_range(200 * PERIOD, 300 * PERIOD))
+    assert [packet.timestamp for packet in packets] == [index * PERIOD for index in range(200, 301)]
+    reader.seek(10 * PERIOD)
+    assert reader.read().timestamp == 10 * PERIOD
+    reader.close()
+
+
+def check_closed_segments_are_readable_while_writing(directory):
+    file_path = os.path.join(directory, 'depth_ahat_live.bin')
+    writer = create_writer(file_path)
+    writer.open()
+    for index in range(NUM_PACKETS // 2):
+        writer.write(create_packet(index))
+
+    closed_timestamps = read_timestamps(file_path)
+    assert len(closed_timestamps) > 0
+    assert closed_timestamps == [index * PERIOD for index in range(len(closed_timestamps))]
+    assert not any(path.endswith('.part') for path in hl2ss_io.get_files(file_path))
+
+    for index in range(NUM_PACKETS // 2, NUM_PACKETS):
+        writer.write(create_packet(index))
+    writer.close()
+    assert len(read_timestamps(file_path)) == NUM_PACKETS
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as test_directory:
+        check_segments_read_as_one_stream(test_directory)
+        check_closed_segments_are_readable_while_writing(test_directory)
+    print("hl2ss_io segment tests passed")
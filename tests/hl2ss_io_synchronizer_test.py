@@ -0,0 +1,87 @@
+import os
+import tempfile
+
+import numpy as np
+
+from datacollection.user_app.backend.app.hololens import hl2ss, hl2ss_io
+
+# Aligns a 45 Hz stream and a 30 Hz stream with a gap to a 15 Hz base stream and compares the result
+# with the packets found by searching the whole streams
+
+SECOND = hl2ss.TimeBase.HUNDREDS_OF_NANOSECONDS
+DURATION = 20
+TOLERANCE = SECOND // 20
+
+
+def write_stream(file_path, timestamps):
+    writer = hl2ss_io.wr_rm_depth_ahat(
+        file_path, hl2ss.StreamPort.RM_DEPTH_AHAT, hl2ss.StreamMode.MODE_1, hl2ss.VideoProfile.RAW, 1, b''
+    )
+    writer.open()
+    for timestamp in timestamps:
+        pose = np.eye(4, dtype=np.float32)
+        pose[3, 0] = timestamp / SECOND
+        writer.write(hl2ss._packet(timestamp, timestamp.to_bytes(8, 'little'), pose))
+    writer.close()
+
+
+def create_streams(directory):
+    base_timestamps = [index * SECOND // 15 for index in range(DURATION * 15)]
+    stream_timestamps = {
+        'fast': [1000 + index * SECOND // 45 for index in range(DURATION * 45)],
+        # No packets between 5 and 8 seconds
+        'gap': [index * SECOND // 30 for index in range(DURATION * 30) if not (5 * SECOND <= index * SECOND // 30 < 8 * SECOND)],
+    }
+    base_path = os.path.join(directory, 'base.bin')
+    write_stream(base_path, base_timestamps)
+    stream_paths = {}
+    for name, timestamps in stream_timestamps.items():
+        stream_paths[name] = os.path.join(directory, f'{name}.bin')
+        write_stream(stream_paths[name], timestamps)
+    return base_path, base_timestamps, stream_paths, stream_timestamps
+
+
+def find_nearest(timestamps, timestamp):
+    nearest = min(timestamps, key=lambda stream_timestamp: abs(stream_timestamp - timestamp))
+    return nearest if abs(nearest - timestamp) <= TOLERANCE else None
+
+
+def find_previous(timestamps, timestamp):
+    previous = [stream_timestamp for stream_timestamp in timestamps if stream_timestamp <= timestamp]
+    return previous[-1] if previous and (timestamp - previous[-1]) <= TOLERANCE else None
+
+
+def synchronize(base_path, stream_paths, policy):
+    with hl2ss_io.synchronizer(
+        base_path, stream_paths, False, hl2ss.ChunkSize.SINGLE_TRANSFER, None, policy, TOLERANCE
+    ) as stream_synchronizer:
+        return list(stream_synchronizer)
+
+
+def check_nearest_and_previous(directory):
+    base_path, base_timestamps, stream_paths, stream_timestamps = create_streams(directory)
+    for policy, find in [(hl2ss_io.SyncPolicy.NEAREST, find_nearest), (hl2ss_io.SyncPolicy.PREVIOUS, find_previous)]:
+        aligned = synchronize(base_path, stream_paths, policy)
+        assert [base_packet.timestamp for base_packet, _ in aligned] == base_timestamps
+        for base_packet, packets in aligned:
+            for name, timestamps in stream_timestamps.items():
+                expected = find(timestamps, base_packet.timestamp)
+                assert (packets[name].timestamp if packets[name] is not None else None) == expected
+
+
+def check_interpolated_poses(directory):
+    base_path, base_timestamps, stream_paths, stream_timestamps = create_streams(directory)
+    for base_packet, packets in synchronize(base_path, stream_paths, hl2ss_io.SyncPolicy.INTERPOLATED):
+        packet = packets['fast']
+        if packet is None:
+            continue
+        if packet.timestamp == base_packet.timestamp:
+            assert abs(packet.pose[3, 0] - base_packet.timestamp / SECOND) < 1e-4
+        assert np.allclose(packet.pose[:3, :3], np.eye(3), atol=1e-5)
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as test_directory:
+        check_nearest_and_previous(test_directory)
+        check_interpolated_poses(test_directory)
+    print("hl2ss_io synchronizer tests passed")
@@ -0,0 +1,72 @@
+import multiprocessing as mp
+import time
+
+import numpy as np
+
+from datacollection.user_app.backend.app.hololens import hl2ss, hl2ss_mp
+
+# Moves RAW PV frames (1920x1080 NV12) from a producer to a sink through the queues of hl2ss_mp and through the
+# shared memory frame ring, and reports the frames delivered and the CPU time spent per frame by the sink process
+# The receiver is synthetic and paced at FRAMERATE, the sink reads every frame with get_buffered_frame
+
+PORT = hl2ss.StreamPort.PERSONAL_VIDEO
+WIDTH = 1920
+HEIGHT = 1080
+FRAMERATE = 60
+PAYLOAD_SIZE = WIDTH * HEIGHT * 3 // 2
+BUFFER_SIZE = 2 * FRAMERATE
+NUM_FRAMES = 10 * FRAMERATE
+
+
+class SyntheticReceiver:
+    def __init__(self, payload_size, framerate):
+        self.payload_size = payload_size
+        self.framerate = framerate
+
+    def open(self):
+        self._payload = np.random.randint(0, 256, self.payload_size, dtype=np.uint8).tobytes()
+        self._pose = np.eye(4, dtype=np.float32)
+        self._start_time = time.perf_counter()
+        self._index = 0
+
+    def get_next_packet(self):
+        time.sleep(max(self._start_time + self._index / self.framerate - time.perf_counter(), 0))
+        packet = hl2ss._packet(self._index * hl2ss.TimeBase.HUNDREDS_OF_NANOSECONDS // self.framerate, self._payload, self._pose)
+        self._index += 1
+        return packet
+
+    def close(self):
+        pass
+
+
+def run(slot_size):
+    producer = hl2ss_mp.producer()
+    producer.configure(PORT, SyntheticReceiver(PAYLOAD_SIZE, FRAMERATE))
+    producer.initialize(PORT, BUFFER_SIZE, slot_size)
+    producer.start(PORT)
+
+    sink = hl2ss_mp.consumer().create_sink(producer, PORT, mp.Manager(), ...)
+    frame_stamp = sink.get_attach_response() + 1
+    delivered = 0
+    lost = 0
+    start_cpu_time = time.process_time()
+    while delivered < NUM_FRAMES:
+        sink.acquire()
+        state, data = sink.get_buffered_frame(frame_stamp)
+        if state == 0:
+            delivered += 1
+            frame_stamp += 1
+            data.payload[PAYLOAD_SIZE - 1]
+        elif state < 0:
+            lost += 1
+            frame_stamp = sink.get_frame_stamp()
+    cpu_time = time.process_time() - start_cpu_time
+    sink.detach()
+    producer.stop(PORT)
+    return delivered, lost, cpu_time
+
+
+if __name__ == '__main__':
+    for name, slot_size in [("Queues", None), ("Shared memory ring", hl2ss_mp.get_slot_size(PAYLOAD_SIZE))]:
+        delivered, lost, cpu_time = run(slot_size)
+        print(f"{name}: {delivered} frames delivered, {lost} lost, sink CPU {cpu_time / delivered * 1000:.2f} ms per frame")
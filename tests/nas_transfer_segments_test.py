@@ -0,0 +1,87 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from datacollection.user_app.backend.app.hololens import hl2ss, hl2ss_io
+from datacollection.user_app.backend.app.models.recording import Recording
+from datacollection.user_app.backend.app.post_processing.nas_transfer_service import NASTransferService
+
+# Transfers a segmented raw capture while it is written, before and after a segment rollover,
+# and reads the stream back from the transferred files
+# The NAS is a local directory behind the calls of the sftp client used by NASTransferService
+
+FRAMERATE = 50
+PERIOD = hl2ss.TimeBase.HUNDREDS_OF_NANOSECONDS // FRAMERATE
+SEGMENT_DURATION = 2
+SEGMENT_PACKETS = SEGMENT_DURATION * FRAMERATE
+
+
+class LocalSftpClient:
+    def makedirs(self, remote_directory):
+        os.makedirs(remote_directory, exist_ok=True)
+
+    def stat(self, remote_path):
+        return os.stat(remote_path)
+
+    def put(self, local_path, remote_path):
+        shutil.copyfile(local_path, remote_path)
+
+
+def write_packets(writer, begin, end):
+    for index in range(begin, end):
+        writer.write(hl2ss._packet(index * PERIOD, index.to_bytes(4, 'little') * 256, np.eye(4, dtype=np.float32)))
+
+
+def read_timestamps(file_path):
+    reader = hl2ss_io.create_rd(False, file_path, hl2ss.ChunkSize.SINGLE_TRANSFER, None)
+    reader.open()
+    timestamps = []
+    while True:
+        packet = reader.read()
+        if packet is None:
+            break
+        timestamps.append(packet.timestamp)
+    reader.close()
+    return timestamps
+
+
+def check_transfers_across_segment_rollover(directory):
+    local_directory = os.path.join(directory, 'local')
+    nas_directory = os.path.join(directory, 'nas')
+    os.makedirs(local_directory)
+    file_name = 'depth_ahat.bin'
+    nas_transfer_service = NASTransferService(Recording(id='1_1', activity_id=1, is_error=False, steps=[]), directory)
+    sftp_client = LocalSftpClient()
+
+    writer = hl2ss_io.wr_segmented(
+        hl2ss_io.wr_rm_depth_ahat(
+            os.path.join(local_directory, file_name), hl2ss.StreamPort.RM_DEPTH_AHAT, hl2ss.StreamMode.MODE_1,
+            hl2ss.VideoProfile.RAW, 1, b''
+        ),
+        segment_duration=SEGMENT_DURATION
+    )
+    writer.open()
+
+    # First transfer with one closed segment, the second segment is still open
+    write_packets(writer, 0, SEGMENT_PACKETS + 10)
+    nas_transfer_service._transfer_directory(sftp_client, local_directory, nas_directory)
+    assert read_timestamps(os.path.join(nas_directory, file_name)) == [index * PERIOD for index in range(SEGMENT_PACKETS)]
+
+    # Second transfer after the rollover, the manifest on the NAS lists the new segment
+    write_packets(writer, SEGMENT_PACKETS + 10, 2 * SEGMENT_PACKETS + 10)
+    nas_transfer_service._transfer_directory(sftp_client, local_directory, nas_directory)
+    assert read_timestamps(os.path.join(nas_directory, file_name)) == [index * PERIOD for index in range(2 * SEGMENT_PACKETS)]
+
+    writer.close()
+    nas_transfer_service._transfer_directory(sftp_client, local_directory, nas_directory)
+    assert hl2ss_io.read_manifest(os.path.join(nas_directory, file_name))['closed']
+    assert read_timestamps(os.path.join(nas_directory, file_name)) == [index * PERIOD for index in range(2 * SEGMENT_PACKETS + 10)]
+    assert not any(nas_file_name.endswith('.part') for nas_file_name in os.listdir(nas_directory))
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as test_directory:
+        check_transfers_across_segment_rollover(test_directory)
+    print("NAS transfer segment tests passed")
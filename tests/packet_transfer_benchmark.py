@@ -0,0 +1,86 @@
+import time
+
+import cv2
+import numpy as np
+import redis
+
+from datacollection.user_app.backend.app.hololens import hl2ss
+from datacollection.user_app.backend.app.utils.constants import Hololens_Constants as const
+
+# Measures bytes per second of raw PV frames through receive -> pack -> redis -> unpack -> cv2.cvtColor
+# Needs a redis server running on REDIS_HOST:REDIS_PORT
+
+QUEUE_NAME = "packet_transfer_benchmark"
+NUM_FRAMES = 600
+BATCH_SIZE = 4
+
+
+def create_pv_network_data(num_frames):
+    payload_size = int(const.PV_STRIDE * const.PV_FRAME_HEIGHT * 3 / 2) + 16
+    payload = np.random.randint(0, 256, payload_size, dtype=np.uint8).tobytes()
+    pose = np.eye(4, dtype=np.float32)
+    network_data = bytearray()
+    for timestamp in range(num_frames):
+        network_data.extend(hl2ss.pack_packet(hl2ss._packet(timestamp, payload, pose)))
+    return network_data
+
+
+def receive_packets(network_data, use_views):
+    unpacker = hl2ss._unpacker()
+    unpacker.reset(hl2ss.StreamMode.MODE_1)
+    for offset in range(0, len(network_data), hl2ss.ChunkSize.PHOTO_VIDEO):
+        unpacker.extend(network_data[offset:offset + hl2ss.ChunkSize.PHOTO_VIDEO])
+        while unpacker.unpack():
+            yield unpacker.get_view() if use_views else unpacker.get()
+
+
+def convert_frame(payload):
+    frame_nv12 = np.frombuffer(
+        payload, dtype=np.uint8, count=int((const.PV_STRIDE * const.PV_FRAME_HEIGHT * 3) / 2)
+    ).reshape((int(const.PV_FRAME_HEIGHT * 3 / 2), const.PV_STRIDE))
+    return cv2.cvtColor(frame_nv12[:, :const.PV_FRAME_WIDTH], cv2.COLOR_YUV2BGR_NV12)
+
+
+def run_copying_transfer(redis_client, network_data):
+    pipeline = redis_client.pipeline(transaction=False)
+    batch = []
+    for packet in receive_packets(network_data, use_views=False):
+        batch.append(bytes(hl2ss.pack_packet(packet)))
+        if len(batch) == BATCH_SIZE:
+            pipeline.lpush(QUEUE_NAME, *batch)
+            pipeline.execute()
+            batch = []
+        while redis_client.llen(QUEUE_NAME) > 0:
+            stream_data = redis_client.brpop([QUEUE_NAME], timeout=1)
+            convert_frame(hl2ss.unpack_packet(bytearray(stream_data[1])).payload)
+
+
+def run_zero_copy_transfer(redis_client, network_data):
+    pipeline = redis_client.pipeline(transaction=False)
+    batch = []
+    for packet in receive_packets(network_data, use_views=True):
+        batch.append(hl2ss.pack_packet_view(packet))
+        if len(batch) == BATCH_SIZE:
+            pipeline.lpush(QUEUE_NAME, *batch)
+            pipeline.execute()
+            batch = []
+        while redis_client.llen(QUEUE_NAME) > 0:
+            stream_data = redis_client.brpop([QUEUE_NAME], timeout=1)
+            convert_frame(hl2ss.unpack_packet_view(stream_data[1]).payload)
+
+
+def benchmark(name, transfer, redis_client, network_data):
+    redis_client.delete(QUEUE_NAME)
+    start_time = time.perf_counter()
+    transfer(redis_client, network_data)
+    elapsed_time = time.perf_counter() - start_time
+    print(f"{name}: {len(network_data) / elapsed_time / (1024 * 1024):.1f} MB/s, "
+          f"{NUM_FRAMES / elapsed_time:.1f} frames/s")
+
+
+if __name__ == '__main__':
+    client = redis.Redis(host=const.REDIS_HOST, port=const.REDIS_PORT)
+    data = create_pv_network_data(NUM_FRAMES)
+    benchmark("Copying pack/unpack (before)", run_copying_transfer, client, data)
+    benchmark("Zero-copy pack/unpack (after)", run_zero_copy_transfer, client, data)
+    client.delete(QUEUE_NAME)
@@ -0,0 +1,84 @@
+import os
+import sys
+import tempfile
+import time
+
+from datacollection.user_app.backend.app.hololens import hl2ss, hl2ss_io
+from datacollection.user_app.backend.app.services.frame_encoding_service import encode_pv_frame
+from datacollection.user_app.backend.app.utils.constants import Hololens_Constants as const
+
+# Compares RAW PV capture (NV12 frames, stored as JPEG frames) with encoded PV capture (H.264, stored as received)
+# Reports network bandwidth, CPU time of the capture process and disk use per recorded minute
+# Needs a HoloLens running hl2ss: python pv_capture_benchmark.py [device_ip]
+
+BENCHMARK_DURATION = 60
+
+
+def get_directory_size(directory):
+    return sum(os.path.getsize(os.path.join(directory, file_name)) for file_name in os.listdir(directory))
+
+
+def capture_raw(device_ip, output_directory):
+    client = hl2ss.rx_pv(
+        device_ip, hl2ss.StreamPort.PHOTO_VIDEO, hl2ss.ChunkSize.PHOTO_VIDEO, hl2ss.StreamMode.MODE_1,
+        const.PV_FRAME_WIDTH, const.PV_FRAME_HEIGHT, const.PV_FRAMERATE,
+        const.PV_VIDEO_PROFILE_RAW, const.PV_VIDEO_BITRATE_RAW
+    )
+    received_bytes = 0
+    num_of_frames = 0
+    client.open()
+    start_time = time.perf_counter()
+    while (time.perf_counter() - start_time) < BENCHMARK_DURATION:
+        stream_data = hl2ss.pack_packet(client.get_next_packet())
+        received_bytes += len(stream_data)
+        encode_pv_frame(stream_data, os.path.join(output_directory, f'{num_of_frames}.jpg'))
+        num_of_frames += 1
+    client.close()
+    return received_bytes, num_of_frames, get_directory_size(output_directory)
+
+
+def capture_encoded(device_ip, output_directory):
+    client = hl2ss.rx_pv(
+        device_ip, hl2ss.StreamPort.PHOTO_VIDEO, hl2ss.ChunkSize.PHOTO_VIDEO, hl2ss.StreamMode.MODE_1,
+        const.PV_FRAME_WIDTH, const.PV_FRAME_HEIGHT, const.PV_FRAMERATE,
+        const.PV_VIDEO_PROFILE_ENCODED, const.PV_VIDEO_BITRATE_ENCODED
+    )
+    file_path = os.path.join(output_directory, f'pv{const.RAW_CAPTURE_EXTENSION}')
+    writer = hl2ss_io.create_wr_from_rx(file_path, client, b'')
+    received_bytes = 0
+    num_of_frames = 0
+    client.open()
+    writer.open()
+    start_time = time.perf_counter()
+    while (time.perf_counter() - start_time) < BENCHMARK_DURATION:
+        packet = client.get_next_packet()
+        received_bytes += len(hl2ss.pack_packet(packet))
+        writer.write(packet)
+        num_of_frames += 1
+    writer.close()
+    client.close()
+    return received_bytes, num_of_frames, os.path.getsize(file_path)
+
+
+def run_benchmark(name, capture, device_ip):
+    hl2ss.start_subsystem_pv(device_ip, hl2ss.StreamPort.PHOTO_VIDEO)
+    with tempfile.TemporaryDirectory() as output_directory:
+        start_cpu_time = time.process_time()
+        start_time = time.perf_counter()
+        received_bytes, num_of_frames, disk_bytes = capture(device_ip, output_directory)
+        elapsed_minutes = (time.perf_counter() - start_time) / 60
+        cpu_seconds = time.process_time() - start_cpu_time
+    hl2ss.stop_subsystem_pv(device_ip, hl2ss.StreamPort.PHOTO_VIDEO)
+
+    print(
+        f"{name}: {num_of_frames / (elapsed_minutes * 60):.1f} fps, "
+        f"bandwidth {received_bytes / elapsed_minutes / (1024 * 1024):.1f} MB/min, "
+        f"CPU {cpu_seconds / elapsed_minutes:.1f} s/min, "
+        f"disk {disk_bytes / elapsed_minutes / (1024 * 1024):.1f} MB/min"
+    )
+
+
+if __name__ == '__main__':
+    device_ip = sys.argv[1] if len(sys.argv) > 1 else const.DEFAULT_HOLOLENS_IP
+    run_benchmark("RAW (JPEG frames)", capture_raw, device_ip)
+    run_benchmark("Encoded (H.264 stream)", capture_encoded, device_ip)
@@ -0,0 +1,98 @@
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+
+from datacollection.user_app.backend.app.hololens import hl2ss
+from datacollection.user_app.backend.app.utils.constants import Hololens_Constants as const
+
+# Measures packets and bytes per second of raw PV packets received from a local loopback server
+# Compares the offset-based unpacker of hl2ss._gatherer with the previous unpacker, which received a new bytes
+# object per chunk and re-sliced its buffer after every packet
+
+HOST = "127.0.0.1"
+PORT = 38100
+NUM_PACKETS = 2000
+
+
+def create_pv_network_data():
+    payload_size = int(const.PV_STRIDE * const.PV_FRAME_HEIGHT * 3 / 2) + 16
+    payload = np.random.randint(0, 256, payload_size, dtype=np.uint8).tobytes()
+    return bytes(hl2ss.pack_packet(hl2ss._packet(0, payload, np.eye(4, dtype=np.float32))))
+
+
+def serve(server_socket, packet_data, num_packets):
+    connection, _ = server_socket.accept()
+    with connection:
+        for _ in range(num_packets):
+            connection.sendall(packet_data)
+
+
+class ReslicingUnpacker:
+    # Previous unpacker, kept here as the baseline
+
+    def __init__(self, mode):
+        self._mode = mode
+        self._buffer = bytearray()
+
+    def extend(self, chunk):
+        self._buffer.extend(chunk)
+
+    def unpack(self):
+        if len(self._buffer) < 12:
+            return None
+        _, payload_size = struct.unpack_from('<QI', self._buffer, 0)
+        size = 12 + payload_size + (64 if (self._mode == hl2ss.StreamMode.MODE_1) else 0)
+        if len(self._buffer) < size:
+            return None
+        packet = hl2ss.unpack_packet(self._buffer[:size])
+        self._buffer = self._buffer[size:]
+        return packet
+
+
+def receive_reslicing(num_packets):
+    client = hl2ss._client()
+    client.open(HOST, PORT)
+    unpacker = ReslicingUnpacker(hl2ss.StreamMode.MODE_1)
+    received_packets = 0
+    while received_packets < num_packets:
+        unpacker.extend(client.recv(hl2ss.ChunkSize.PHOTO_VIDEO))
+        while unpacker.unpack() is not None:
+            received_packets += 1
+    client.close()
+
+
+def receive_gatherer(num_packets):
+    gatherer = hl2ss._gatherer()
+    gatherer.open(HOST, PORT, hl2ss.ChunkSize.PHOTO_VIDEO, hl2ss.StreamMode.MODE_1)
+    for _ in range(num_packets):
+        gatherer.get_next_packet()
+    gatherer.close()
+
+
+def run_benchmark(name, receive, packet_data):
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server_socket.bind((HOST, PORT))
+    server_socket.listen(1)
+    server_thread = threading.Thread(target=serve, args=(server_socket, packet_data, NUM_PACKETS))
+    server_thread.start()
+
+    start_time = time.perf_counter()
+    receive(NUM_PACKETS)
+    elapsed_time = time.perf_counter() - start_time
+    server_thread.join()
+    server_socket.close()
+
+    print(
+        f"{name}: {NUM_PACKETS / elapsed_time:.1f} packets/s, "
+        f"{NUM_PACKETS * len(packet_data) / elapsed_time / (1024 * 1024):.1f} MB/s"
+    )
+
+
+if __name__ == '__main__':
+    packet_data = create_pv_network_data()
+    run_benchmark("Re-slicing unpacker", receive_reslicing, packet_data)
+    run_benchmark("Offset unpacker (recv_into)", receive_gatherer, packet_data)